@@ -48,6 +48,10 @@ add_data(user, file):
     Adds the data in to the database. The file must
     match XML_SCHEMA, and the user must have permission.
 
+    The file is parsed as it is read, and each module is
+    added as soon as it has been parsed, so modules before
+    one that fails to parse are still added.
+
     Returns a summary (in HTML)
 
 output_xml_file(tripos,part,subject)
@@ -60,6 +64,10 @@ output_xml_file(tripos,part,subject)
 
     Returns the xml file
 
+iter_xml_file(tripos,part,subject)
+    As output_xml_file, but yields the xml file in chunks as
+    it is generated, one module at a time.
+
 add_data_post(user, post_data)
     user:       a Django user who is performing the import
     post_data:  the data of the POST request
@@ -73,24 +81,25 @@ add_data_post(user, post_data)
 from lxml import etree
 from lxml.builder import E
 
-from timetables.models import Event, EventSourceTag, Thing
+from timetables.models import Event, EventSource, EventSourceTag, Thing
 from timetables.api.processors import PostImportProcessor, XMLImportProcessor
 from timetables.api.importers import APIImporter
 from timetables.api.util import (APILogger, XML_EXPORT_FAKE_ID, XML_SCHEMA,
                                 TIMEZONE, build_path_string,
                                 DataValidationException)
+from timetables.querysets import batched
 
 
 def add_data(user, uploaded_file):
     """
-    Reads the data from the uploaded file and then adds
-    the data to the database via add_module_data
+    Reads the data from the uploaded file and adds each
+    module to the database via add_module_data as it is read
 
     Returns the log
     """
-    data = uploaded_file.read()
 
-    return handle_import(user, data, XMLImportProcessor, APIImporter)
+    return handle_streaming_import(user, uploaded_file, XMLImportProcessor,
+                                   APIImporter)
 
 
 def add_data_post(user, post_data):
@@ -132,85 +141,206 @@ def handle_import(user, data, processor_class, importer_class, logger=None):
     return logger
 
 
-def output_xml_file(tripos, part, subject=None):
+def handle_streaming_import(user, source, processor_class, importer_class,
+                            logger=None):
     """
-    Reads the data from the modules of tripos/path/subject
-    Returns an etree pretty_print of the XML tree, requiring
-    that it matches the XML_SCHEMA.
+    As handle_import, but the processor reads the data from
+    the file-like object source with process_stream, and each
+    module is imported as soon as it has been processed
+
+    Returns the log
     """
 
-    all_user_modules = Thing.objects.filter(
-        type='module',
-        fullpath__istartswith=build_path_string(tripos, part, subject)
-    )
+    if logger == None:
+        logger = APILogger()
 
-    xml_root = etree.Element("moduleList")
+    logger.log('notice', 'import', 'Performing import as user '+user.username)
 
-    for module in all_user_modules:
-        xml_module = etree.Element("module")
+    processor = processor_class(logger=logger)
+    importer = importer_class(user, logger=logger)
 
-        xml_path_node = etree.Element("path")
-        xml_path_node.append(E('tripos', tripos))
-        xml_path_node.append(E('part', part))
-        if subject is not None:
-            xml_path_node.append(E('subject', subject))
-        xml_module.append(xml_path_node)
-        xml_module.append(E('name', module.fullname))
+    for module in processor.process_stream(source):
+        importer.add_module_data(module)
 
-        # loop through the tags to find child sources
-        module_tags = EventSourceTag.objects.filter(thing=module)
+    return logger
 
-        for tag in module_tags:
-            series = tag.eventsource
 
-            xml_series = etree.Element("series")
+# The number of modules whose series and events are fetched at a time when
+# exporting
+EXPORT_MODULE_BATCH_SIZE = 100
 
-            if 'importid' in series.metadata:
-                xml_series.append(E('uniqueid', series.metadata['importid']))
-            else:
-                # no import id present - so this file won't reimport correctly
-                xml_series.append(E('uniqueid', XML_EXPORT_FAKE_ID))
 
-            xml_series.append(E('name', series.title))
+class _ChunkBuffer(object):
+    """
+    A file-like object collecting the output of an lxml xmlfile
+    so that it can be yielded in chunks
+    """
 
-            attached_events = Event.objects.filter(source=series)
+    def __init__(self):
+        self.chunks = []
 
-            if len(attached_events) == 0:
-                # this will prevent validation, so catch it now
-                raise DataValidationException(
-                    'Series '+series.title+' has no events!'
-                )
+    def write(self, data):
+        self.chunks.append(data)
 
-            for event in attached_events:
-                xml_event = etree.Element("event")
-                xml_event.append(E('uniqueid', event.uid))
-                xml_event.append(E('name', event.title))
-                xml_event.append(E('location', event.location))
+    def take(self):
+        data = ''.join(self.chunks)
+        self.chunks = []
+        return data
 
-                if ('people' in event.metadata and
-                  event.metadata['people'] is not None):
-                    for i in event.metadata['people']:
-                        xml_event.append(E('lecturer', i))
 
-                start_datetime = event.start.astimezone(TIMEZONE)
-                end_datetime = event.end.astimezone(TIMEZONE)
+def build_xml_module(module, tripos, part, subject, series_events):
+    """
+    Builds the module element of a module, given a list of
+    (series, events) tuples for each of its series
+    """
 
-                xml_event.append(E('date', start_datetime.strftime("%Y-%m-%d")))
-                xml_event.append(
-                    E('start', start_datetime.strftime("%H:%M:%S"))
-                )
-                xml_event.append(E('end', end_datetime.strftime("%H:%M:%S")))
-                xml_event.append(E('type', event.metadata['type'].lower()))
+    xml_module = etree.Element("module")
+
+    xml_path_node = etree.Element("path")
+    xml_path_node.append(E('tripos', tripos))
+    xml_path_node.append(E('part', part))
+    if subject is not None:
+        xml_path_node.append(E('subject', subject))
+    xml_module.append(xml_path_node)
+    xml_module.append(E('name', module.fullname))
+
+    for series, attached_events in series_events:
+        xml_series = etree.Element("series")
+
+        if 'importid' in series.metadata:
+            xml_series.append(E('uniqueid', series.metadata['importid']))
+        else:
+            # no import id present - so this file won't reimport correctly
+            xml_series.append(E('uniqueid', XML_EXPORT_FAKE_ID))
+
+        xml_series.append(E('name', series.title))
+
+        if len(attached_events) == 0:
+            # this will prevent validation, so catch it now
+            raise DataValidationException(
+                'Series '+series.title+' has no events!'
+            )
+
+        for event in attached_events:
+            xml_event = etree.Element("event")
+            xml_event.append(E('uniqueid', event.uid))
+            xml_event.append(E('name', event.title))
+            xml_event.append(E('location', event.location))
+
+            if ('people' in event.metadata and
+              event.metadata['people'] is not None):
+                for i in event.metadata['people']:
+                    xml_event.append(E('lecturer', i))
 
-                xml_series.append(xml_event)
-            xml_module.append(xml_series)
-        xml_root.append(xml_module)
+            start_datetime = event.start.astimezone(TIMEZONE)
+            end_datetime = event.end.astimezone(TIMEZONE)
 
-    try:
-        XML_SCHEMA.assertValid(xml_root)
-    except etree.DocumentInvalid as err:
+            xml_event.append(E('date', start_datetime.strftime("%Y-%m-%d")))
+            xml_event.append(
+                E('start', start_datetime.strftime("%H:%M:%S"))
+            )
+            xml_event.append(E('end', end_datetime.strftime("%H:%M:%S")))
+            xml_event.append(E('type', event.metadata['type'].lower()))
+
+            xml_series.append(xml_event)
+        xml_module.append(xml_series)
+
+    return xml_module
+
+
+def iter_module_series(modules):
+    """
+    Yields (module, [(series, events), ...]) for each module,
+    fetching the series and events of a batch of modules at a time
+    """
+
+    for batch in batched(modules, EXPORT_MODULE_BATCH_SIZE):
+        tags = (EventSourceTag.objects
+                .filter(thing__in=batch)
+                .select_related('eventsource')
+                .order_by('id'))
+        module_series = {}
+        for tag in tags:
+            module_series.setdefault(tag.thing_id, []).append(tag.eventsource)
+
+        series_ids = set(series.id for series_list in module_series.values()
+                         for series in series_list)
+        series_events = {}
+        for event in Event.objects.filter(source__in=series_ids).order_by('id'):
+            series_events.setdefault(event.source_id, []).append(event)
+
+        for module in batch:
+            yield module, [
+                (series, series_events.get(series.id, []))
+                for series in module_series.get(module.id, [])
+            ]
+
+
+def iter_xml_file(tripos, part, subject=None):
+    """
+    Reads the data from the modules of tripos/path/subject
+    Yields the XML file in chunks, one per module, each
+    module having been checked against XML_SCHEMA.
+
+    Checks which would stop the file from validating as a
+    whole are made before anything is yielded, but a module
+    that fails to validate raises DataValidationException
+    part way through.
+    """
+
+    path = build_path_string(tripos, part, subject)[:-1]
+    all_user_modules = Thing.objects.filter(
+        Thing.treequery([path]),
+        type='module'
+    )
+    modules = list(all_user_modules.order_by('id'))
+
+    if len(modules) == 0:
+        raise DataValidationException(
+            "Generated XML was not valid!\nNo modules found in {0}".format(
+                path)
+        )
+
+    empty_series = EventSource.objects.filter(
+        eventsourcetag__thing__in=all_user_modules,
+        event__isnull=True
+    )[:1]
+    for series in empty_series:
+        # this will prevent validation, so catch it now
         raise DataValidationException(
-            "Generated XML was not valid!\n{0}".format(err)
+            'Series '+series.title+' has no events!'
         )
 
-    return etree.tostring(xml_root, pretty_print=True)
+    output = _ChunkBuffer()
+    with etree.xmlfile(output, encoding='utf-8') as xml_file:
+        with xml_file.element('moduleList'):
+            xml_file.write('\n')
+            for module, series_events in iter_module_series(modules):
+                xml_module = build_xml_module(
+                    module, tripos, part, subject, series_events
+                )
+
+                # The schema describes a whole file, so validate the
+                # module inside a moduleList of its own
+                xml_root = etree.Element("moduleList")
+                xml_root.append(xml_module)
+                try:
+                    XML_SCHEMA.assertValid(xml_root)
+                except etree.DocumentInvalid as err:
+                    raise DataValidationException(
+                        "Generated XML was not valid!\n{0}".format(err)
+                    )
+
+                xml_file.write(xml_module, pretty_print=True)
+                yield output.take()
+    output.write('\n')
+    yield output.take()
+
+
+def output_xml_file(tripos, part, subject=None):
+    """
+    Reads the data from the modules of tripos/path/subject
+    Returns the XML file built by iter_xml_file as a string.
+    """
+
+    return ''.join(iter_xml_file(tripos, part, subject))
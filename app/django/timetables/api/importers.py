@@ -3,9 +3,187 @@ Defines API importers, which take ModuleData and put it into the database
 """
 
 import datetime
+import re
+from collections import OrderedDict
+from itertools import chain
+
+from django.db import connection
 
 from timetables.api.util import APILogger, TIMEZONE, DataValidationException
-from timetables.models import Event, EventSource, EventSourceTag, Thing
+from timetables.models import (Event, EventSource, EventSourceTag, Thing,
+    EventTag, ThingEventIndex, deferred_metadata)
+from timetables.querysets import batched, MAX_BATCH_SIZE
+from timetables.utils.feedcache import feed_cache
+from timetables.utils.transactions import commit_on_success
+
+
+# The fields of an Event set by the importer, and so written when updating
+EVENT_FIELDS = ("start", "end", "title", "location", "uid", "source",
+                "status", "data", "allday", "event_type", "people",
+                "lastmodified")
+
+# Each updated event binds its id and value for every field, plus its id in
+# the WHERE clause.
+UPDATE_BATCH_SIZE = MAX_BATCH_SIZE // (2 * len(EVENT_FIELDS) + 1)
+
+# Each deleted id is bound twice, to match events by id or by master.
+DELETE_BATCH_SIZE = MAX_BATCH_SIZE // 2
+
+
+class SeriesEvents(object):
+    """
+    The events of a single series being imported.
+
+    The series' existing events are loaded in one query and changes are made
+    to them in memory. apply() then writes all the changes at once, in one
+    transaction, with raw DELETEs, a CASE UPDATE per batch of changed events
+    and a bulk insert. None of these send signals, so the series' metadata,
+    the event index and the feeds are updated once for the whole series
+    afterwards.
+    """
+
+    def __init__(self, db_source, event_list, is_new=False):
+        self.db_source = db_source
+        self.by_uid = {}
+        if not is_new:
+            for db_event in event_list.filter(source=db_source):
+                self.by_uid.setdefault(db_event.uid, []).append(db_event)
+
+        self.inserts = []
+        # Updated events by id, in the order they were first updated
+        self.updates = OrderedDict()
+        self.deletes = []
+
+    def get(self, uid):
+        """
+        Returns: The events with the specified uid.
+        """
+        return self.by_uid.get(uid, [])
+
+    def insert(self, db_event):
+        self.by_uid[db_event.uid] = [db_event]
+        self.inserts.append(db_event)
+
+    def update(self, db_event):
+        # Events yet to be inserted are inserted with the changes made to them
+        if db_event.pk is not None:
+            self.updates.setdefault(db_event.pk, db_event)
+
+    @staticmethod
+    def _without(events, db_event):
+        # Unsaved events compare equal to each other, so compare identity
+        return [e for e in events if e is not db_event]
+
+    def delete(self, db_event):
+        self.by_uid[db_event.uid] = self._without(
+            self.by_uid[db_event.uid], db_event)
+        if db_event.pk is None:
+            self.inserts = self._without(self.inserts, db_event)
+            return
+        self.updates.pop(db_event.pk, None)
+        self.deletes.append(db_event.pk)
+
+    def has_changes(self):
+        return bool(self.inserts or self.updates or self.deletes)
+
+    @staticmethod
+    def _delete_events(event_ids):
+        """
+        Delete the Events with the specified ids, their versions and the
+        rows referring to them, as Event.delete() would but without loading
+        them or sending a post_delete signal for each one.
+        """
+        cursor = connection.cursor()
+        for batch in batched(event_ids, DELETE_BATCH_SIZE):
+            where = "id IN ({0}) OR master_id IN ({0})".format(
+                ", ".join(["%s"] * len(batch)))
+            params = batch + batch
+            for model in (EventTag, ThingEventIndex):
+                cursor.execute(
+                    "DELETE FROM {0} WHERE event_id IN"
+                    " (SELECT id FROM {1} WHERE {2})".format(
+                        model._meta.db_table, Event._meta.db_table, where),
+                    params)
+            cursor.execute(
+                "DELETE FROM {0} WHERE {1}".format(Event._meta.db_table,
+                                                   where),
+                params)
+
+    @staticmethod
+    def _typed_placeholder(field, conn):
+        """
+        The placeholder for a value of field in a CASE branch.
+
+        PostgreSQL types a CASE by its THEN values, and the postgres backend
+        sends datetimes as strings, so untyped values would make every
+        column text (or, if they're all NULL, unknown). Each value is cast to
+        the column's type there, without any CHECK constraint of the type.
+        """
+        if conn.vendor != "postgresql":
+            return "%s"
+        db_type = re.sub(r"\s+CHECK\b.*$", "", field.db_type(conn))
+        return "CAST(%s AS {0})".format(db_type)
+
+    @classmethod
+    def _update_sql(cls, fields, count, conn=connection):
+        """
+        Returns: The UPDATE setting fields of count Events, taking each
+            event's id and value for every field, then the events' ids.
+        """
+        qn = conn.ops.quote_name
+        return "UPDATE {0} SET {1} WHERE id IN ({2})".format(
+            qn(Event._meta.db_table),
+            ", ".join("{0} = CASE id {1} END".format(
+                qn(field.column),
+                " ".join(["WHEN %s THEN {0}".format(
+                    cls._typed_placeholder(field, conn))] * count))
+                for field in fields),
+            ", ".join(["%s"] * count))
+
+    @classmethod
+    def _update_events(cls, db_events):
+        """
+        Write the EVENT_FIELDS of db_events with an UPDATE per batch of
+        events, setting each column with a CASE on the event's id.
+        """
+        fields = [Event._meta.get_field(name) for name in EVENT_FIELDS]
+        cursor = connection.cursor()
+        for batch in batched(db_events, UPDATE_BATCH_SIZE):
+            params = []
+            for field in fields:
+                # pre_save() sets lastmodified, as save() would
+                params.extend(chain.from_iterable(
+                    (db_event.pk, field.get_db_prep_save(
+                        field.pre_save(db_event, False), connection))
+                    for db_event in batch))
+            params.extend(db_event.pk for db_event in batch)
+            cursor.execute(cls._update_sql(fields, len(batch)), params)
+
+    @commit_on_success
+    def apply(self):
+        if not self.has_changes():
+            return
+
+        self._delete_events(self.deletes)
+
+        updates = self.updates.values()
+        for db_event in updates:
+            # As save() would, validate and serialise the metadata
+            db_event.on_pre_save()
+        self._update_events(updates)
+
+        for db_event in self.inserts:
+            db_event.on_pre_save()
+        Event.objects.bulk_create(self.inserts)
+
+        # Saving or deleting each event would do these for every event, so do
+        # them once for the series instead. Invalidating the events
+        # invalidates every feed, including those of Things which had
+        # EventTags to the deleted events.
+        self.db_source.update_metadata()
+        ThingEventIndex.index_sources([self.db_source.id])
+        feed_cache.invalidate_events()
+
 
 class APIImporter(object):
     """
@@ -62,7 +240,10 @@ class APIImporter(object):
             )
             return
 
-        self.process_module_dict(module)
+        # Update the metadata of each series once, after all its events have
+        # been processed.
+        with deferred_metadata():
+            self.process_module_dict(module)
 
 
     def process_module_dict(self, module):
@@ -104,13 +285,14 @@ class APIImporter(object):
         matching_source_tags = self.event_source_list.filter(
             thing=db_module,
             annotation='home'
-        )
+        ).select_related('eventsource')
 
         for tag in matching_source_tags:
             # check it was imported via the api
-            if 'importid' in tag.eventsource.metadata:
+            metadata = tag.eventsource.metadata
+            if 'importid' in metadata:
                 module_sources.append(
-                    (tag.eventsource, tag.eventsource.metadata['importid'])
+                    (tag.eventsource, metadata['importid'])
                 )
 
         for source in module['seriesList']:
@@ -131,6 +313,7 @@ class APIImporter(object):
 
         is_deleting_source = source.is_being_deleted()
         db_source = None
+        is_new_source = False
 
         # check if the source is already in the data
         for existing_source in module_sources:
@@ -151,26 +334,31 @@ class APIImporter(object):
                 return
             else:
                 db_source = self.add_source(db_module, source)
+                is_new_source = True
 
+        series_events = SeriesEvents(
+            db_source, self.event_list, is_new=is_new_source)
         for event in source['events']:
-            self.process_event_dict(db_source, event)
+            self.process_event_dict(series_events, event)
+        series_events.apply()
 
         return db_source
 
 
-    def process_event_dict(self, db_source, event):
+    def process_event_dict(self, series_events, event):
         """
-        Processes a EventData dict and updates the database
+        Processes a EventData dict, recording the changes to make to the
+        database in series_events
         """
         if event.is_being_deleted():
             # delete it if it exists
             self.delete_event(
-                db_source,
+                series_events,
                 event
             )
         else:
             self.add_or_update_event(
-                db_source,
+                series_events,
                 event
             )
 
@@ -327,14 +515,14 @@ class APIImporter(object):
         child_events = self.event_list.filter(source=db_source)
 
         self.logger.log('delete', 'source', db_source.title)
-        for event in child_events:
-            self.logger.log('delete', 'event', event.title)
-            event.delete()
+        for title in child_events.values_list('title', flat=True):
+            self.logger.log('delete', 'event', title)
 
+        # Deleting the source deletes its events along with it
         db_source.delete()
 
 
-    def delete_event(self, db_source, event):
+    def delete_event(self, series_events, event):
         """
         Deletes the event specified. The event is identified by
         it's uid (with the import- prefix) and its source.
@@ -342,26 +530,23 @@ class APIImporter(object):
 
         event_uid = event.get_internal_id()
 
-        try:
-            matching_event = self.event_list.get(
-                uid=event_uid,
-                source=db_source
-            )
-        except Event.MultipleObjectsReturned:
+        matching_events = series_events.get(event_uid)
+        if len(matching_events) > 1:
             self.logger.log(
                 'failed',
                 'event',
                 'Multiple events found with uid {0}'.format(event_uid)
             )
             return
-        except Event.DoesNotExist:
+        elif len(matching_events) == 0:
             return
 
+        matching_event = matching_events[0]
         self.logger.log('delete', 'event', matching_event.title)
-        matching_event.delete()
+        series_events.delete(matching_event)
 
 
-    def add_or_update_event(self, db_source, event):
+    def add_or_update_event(self, series_events, event):
         """
         Checks if an event exists identified (by uid with import-
         prefix and by source) and updates it or adds it as
@@ -369,19 +554,18 @@ class APIImporter(object):
         the current data.
         """
 
+        db_source = series_events.db_source
         event_uid = event.get_internal_id()
 
-        try:
-            db_event = self.event_list.get(uid=event_uid, source=db_source)
-        except Event.DoesNotExist:
-            db_event = None
-        except Event.MultipleObjectsReturned:
+        matching_events = series_events.get(event_uid)
+        if len(matching_events) > 1:
             self.logger.log(
                 'failed',
                 'event',
                 'Event uid {0} was not unique'.format(event_uid)
             )
             return
+        db_event = matching_events[0] if matching_events else None
 
         start_time = TIMEZONE.localize(
             datetime.datetime.combine(event['date'], event['start'])
@@ -405,7 +589,7 @@ class APIImporter(object):
             db_event.metadata['people'] = event['lecturer']
             db_event.metadata['type'] = event['type']
             self.logger.log('insert', 'event', event['name'])
-            db_event.save()
+            series_events.insert(db_event)
         else:
             # check if an update is required
             if('people' not in db_event.metadata or
@@ -415,7 +599,7 @@ class APIImporter(object):
                 db_event.title != event['name'] or
                 db_event.location != event['location'] or
                 db_event.uid != event_uid or
-                db_event.source != db_source or
+                db_event.source_id != db_source.id or
                 db_event.status != 0 or
                 db_event.metadata['people'] != event['lecturer'] or
                 db_event.metadata['type'] != event['type']
@@ -431,6 +615,6 @@ class APIImporter(object):
                 db_event.metadata['people'] = event['lecturer']
                 db_event.metadata['type'] = event['type']
                 self.logger.log('update', 'event', event['name'])
-                db_event.save()
+                series_events.update(db_event)
 
         return db_event
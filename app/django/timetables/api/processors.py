@@ -8,6 +8,8 @@ from xml.etree.ElementTree import ParseError
 from lxml import etree
 from defusedxml.common import DefusedXmlException
 from defusedxml.ElementTree import fromstring as XMLFromStringSecurity
+from defusedxml.ElementTree import iterparse as XMLIterParseSecurity
+from defusedxml.ElementTree import tostring as XMLToStringSecurity
 from lxml.etree import fromstring as XMLFromString
 
 from timetables.api.util import (APILogger, ModuleData, SeriesData, EventData,
@@ -67,6 +69,90 @@ class XMLImportProcessor(object):
 
         return modules
 
+    def process_stream(self, source):
+        """
+        Parses the xml read from the file-like object source
+        incrementally, yielding a ModuleData for each module as
+        soon as its end tag is read, so the whole file is never held
+        in memory. Each module must match self.schema.
+
+        Parsing stops at the first problem, in which case the
+        modules already yielded are still valid.
+        """
+
+        root = None
+        depth = 0
+
+        try:
+            # As in process(), defusedxml guards against entity
+            # expansion and DTDs, and lxml checks schema compliance,
+            # here one module at a time
+            for event, element in XMLIterParseSecurity(
+                    source, events=('start', 'end'), forbid_dtd=True):
+                if event == 'start':
+                    depth += 1
+                    if root is None:
+                        root = element
+                        if root.tag != 'moduleList':
+                            self.logger.log(
+                                'failed',
+                                'xml',
+                                'XML file was not valid: expected '
+                                'moduleList, found {0}'.format(root.tag)
+                            )
+                            return
+                    continue
+
+                depth -= 1
+                if depth != 1:
+                    continue
+
+                # a child of the root is complete
+                module = self.process_xml_module_string(
+                    XMLToStringSecurity(element)
+                )
+
+                # free the module's elements before moving on
+                root.remove(element)
+                element.clear()
+
+                if module is None:
+                    return
+                yield module
+
+        except IOError as err:
+            self.logger.log(
+                'failed',
+                'xml',
+                'Unable to read XML file: {0}'.format(err)
+            )
+        except (DefusedXmlException, ParseError) as err:
+            self.logger.log(
+                'failed',
+                'xml',
+                'XML file was not valid: {0}'.format(err)
+            )
+
+    def process_xml_module_string(self, data):
+        """
+        Creates a ModuleData from the xml of a single module,
+        checking it against the schema
+        """
+        try:
+            xml = XMLFromString(
+                '<moduleList>{0}</moduleList>'.format(data),
+                self.parser
+            )
+        except etree.XMLSyntaxError as err:
+            self.logger.log(
+                'failed',
+                'xml',
+                'XML file was not valid: {0}'.format(err)
+            )
+            return
+
+        return self.process_xml_module_node_to_dict(xml.find('module'))
+
     def process_xml_module_node_to_dict(self, xml_module):
         """
         Creates a ModuleData from a module node
@@ -2,16 +2,23 @@
 Tests for timetables.api
 """
 
+import datetime
 import os
+from StringIO import StringIO
 
+from django.db import connection
+from django.db.utils import load_backend
 from django.test import TestCase
+from lxml import etree
 from django.conf import settings
 
-from timetables.models import Thing, ThingTag, User, ThingTag
-import timetables.api as api
+from timetables.models import (Event, EventSource, EventTag, Thing,
+    ThingEventIndex, ThingTag, User)
+import timetables.api.api as api
 import timetables.api.processors as processors
 import timetables.api.importers as importers
-from timetables.api.util import APILogger
+from timetables.api.util import (APILogger, ModuleData, SeriesData,
+    EventData, DataValidationException, XML_SCHEMA)
 
 xml_path = os.path.join(settings.DJANGO_DIR, 'timetables/api/tests/xml')
 
@@ -38,6 +45,15 @@ class TestImportXMLProtection(TestCase):
             if logger.was_success():
                 self.fail("Imported malicious XML ({0})".format(fname))
 
+            # and again, streaming the file
+            logger.clear()
+            processor = processors.XMLImportProcessor(logger=logger)
+            with open(file_full_path) as opened_file:
+                modules = list(processor.process_stream(opened_file))
+
+            if modules or logger.was_success():
+                self.fail("Streamed malicious XML ({0})".format(fname))
+
 
 class TestImportMalformed(TestCase):
     def test_malformed_import(self):
@@ -59,6 +75,36 @@ class TestImportMalformed(TestCase):
             if logger.was_success():
                 self.fail("Imported malformed XML ({0})".format(fname))
 
+            logger.clear()
+            processor = processors.XMLImportProcessor(logger=logger)
+            with open(file_full_path) as opened_file:
+                list(processor.process_stream(opened_file))
+
+            if logger.was_success():
+                self.fail("Streamed malformed XML ({0})".format(fname))
+
+    def test_streaming_stops_at_invalid_module(self):
+        module = ('<module><path><tripos>api</tripos><part>test</part></path>'
+                  '<name>{0}</name><delete/></module>')
+        content = ('<moduleList>' + module.format('First') +
+                   '<module><name>No path</name><delete/></module>' +
+                   module.format('Third') + '</moduleList>')
+
+        logger = APILogger()
+        processor = processors.XMLImportProcessor(logger=logger)
+        modules = list(processor.process_stream(StringIO(content)))
+
+        self.assertEqual(['First'], [m['name'] for m in modules])
+        self.assertFalse(logger.was_success())
+
+    def test_streaming_requires_module_list(self):
+        logger = APILogger()
+        processor = processors.XMLImportProcessor(logger=logger)
+        modules = list(processor.process_stream(StringIO('<module/>')))
+
+        self.assertEqual([], modules)
+        self.assertFalse(logger.was_success())
+
 class TestImport(TestCase):
     def setUp(self):
         # make a user
@@ -165,3 +211,215 @@ class TestImport(TestCase):
         if not logger.was_success():
             self.fail("Import failed "+logger.summary())
 
+    def import_test_add(self):
+        part = Thing(fullname='test', type='part', parent=self.tripos,
+                     name='test')
+        part.save()
+        ThingTag(thing=self.userthing, targetthing=part,
+                 annotation="admin").save()
+
+        with open(os.path.join(xml_path, 'test_add.xml')) as opened_file:
+            logger = api.handle_streaming_import(self.user, opened_file,
+                processors.XMLImportProcessor, importers.APIImporter)
+
+        if not logger.was_success():
+            self.fail("Import failed "+logger.summary())
+
+    def test_xml_streaming_import(self):
+        self.import_test_add()
+        self.assertEqual(
+            ['import-myuniqueid1', 'import-myuniqueid2'],
+            sorted(Event.objects.values_list('uid', flat=True)))
+
+    def test_xml_export(self):
+        self.import_test_add()
+
+        chunks = list(api.iter_xml_file('api', 'test'))
+        # the module, then the end of the file
+        self.assertEqual(2, len(chunks))
+
+        xml = etree.fromstring(''.join(chunks))
+        XML_SCHEMA.assertValid(xml)
+        self.assertEqual(['Unit Test Module'], xml.xpath('module/name/text()'))
+        self.assertEqual(
+            ['import-myuniqueid1', 'import-myuniqueid2'],
+            xml.xpath('module/series/event/uniqueid/text()'))
+        self.assertEqual(''.join(chunks), api.output_xml_file('api', 'test'))
+
+        # the export can be imported again without changes
+        logger = APILogger()
+        importer = importers.APIImporter(self.user, logger=logger)
+        for module in processors.XMLImportProcessor(logger=logger).process(
+                ''.join(chunks)):
+            importer.add_module_data(module)
+        self.assertEqual([], logger.actions)
+
+    def test_xml_export_errors(self):
+        self.import_test_add()
+
+        with self.assertRaises(DataValidationException):
+            list(api.iter_xml_file('api', 'missing'))
+
+        Event.objects.all().delete()
+        with self.assertRaises(DataValidationException):
+            list(api.iter_xml_file('api', 'test'))
+
+class TestImportEventChanges(TestCase):
+    def setUp(self):
+        user = User(username='testuser', password='password', email='email')
+        user.save()
+        userthing = Thing(name='testuser', type='user',
+            parent=Thing.objects.create(fullname='All Users', type='user',
+                                        name='user'),
+            fullname='A Users Calendar')
+        userthing.save()
+
+        tripos = Thing(fullname='api', type='tripos', name='api',
+            parent=Thing.objects.create(fullname='All Tripos',
+                                        type='tripos', name='tripos'))
+        tripos.save()
+        part = Thing(fullname='test', type='part', parent=tripos,
+                     name='test')
+        part.save()
+        ThingTag(thing=userthing, targetthing=part,
+                 annotation='admin').save()
+
+        self.logger = APILogger()
+        self.importer = importers.APIImporter(user, logger=self.logger)
+
+    def make_event(self, eid, name, hour=10, **kwargs):
+        return EventData(eid, name=name, date=datetime.date(2013, 10, 10),
+                         start=datetime.time(hour), end=datetime.time(hour + 1),
+                         type='lecture', location='Room',
+                         lecturer=['Prof. A'], **kwargs)
+
+    def import_events(self, events):
+        module = ModuleData('Unit Test Module', path='tripos/api/test/')
+        module['seriesList'] = [SeriesData('myseries', name='Unit Test Series',
+                                           events=events)]
+        self.logger.clear()
+        self.importer.add_module_data(module)
+        return [action[:3] for action in self.logger.actions]
+
+    def get_events(self):
+        return sorted(Event.objects.values_list('uid', 'title'))
+
+    def test_insert_update_delete(self):
+        self.assertEqual([
+            ('insert', 'module', 'Unit Test Module'),
+            ('insert', 'source', 'Unit Test Series'),
+            ('insert', 'sourcetag', 'unit-test-module > Unit Test Series'),
+            ('insert', 'event', 'Event 1'),
+            ('insert', 'event', 'Event 2'),
+            ('insert', 'event', 'Event 3'),
+        ], self.import_events([self.make_event('e1', 'Event 1'),
+                               self.make_event('e2', 'Event 2'),
+                               self.make_event('e3', 'Event 3')]))
+
+        self.assertEqual([
+            ('update', 'event', 'Event 2 (moved)'),
+            ('delete', 'event', 'Event 3'),
+            ('insert', 'event', 'Event 4'),
+        ], self.import_events([self.make_event('e1', 'Event 1'),
+                               self.make_event('e2', 'Event 2 (moved)', 14),
+                               EventData('e3', delete=True),
+                               self.make_event('e4', 'Event 4')]))
+
+        self.assertEqual([('import-e1', 'Event 1'),
+                          ('import-e2', 'Event 2 (moved)'),
+                          ('import-e4', 'Event 4')], self.get_events())
+        moved = Event.objects.get(uid='import-e2')
+        self.assertGreater(moved.lastmodified, moved.versionstamp)
+        self.assertEqual(['Prof. A'], moved.metadata['people'])
+        self.assertEqual(15, moved.end_local().hour)
+
+        # The series' metadata is recomputed from its events
+        source = EventSource.objects.get(title='Unit Test Series')
+        self.assertEqual(['Prof. A'], source.metadata['people'])
+        self.assertEqual('Room', source.metadata['location'])
+        self.assertNotEqual('', source.metadata['datePattern'])
+
+    def test_updates_in_batches(self):
+        self.import_events([self.make_event('e%d' % i, 'Event %d' % i)
+                            for i in range(5)])
+        batch_size = importers.UPDATE_BATCH_SIZE
+        importers.UPDATE_BATCH_SIZE = 2
+        try:
+            self.import_events([self.make_event('e%d' % i, 'Moved %d' % i,
+                                                hour=10 + i)
+                                for i in range(5)])
+        finally:
+            importers.UPDATE_BATCH_SIZE = batch_size
+
+        for i in range(5):
+            event = Event.objects.get(uid='import-e%d' % i)
+            self.assertEqual('Moved %d' % i, event.title)
+            self.assertEqual((10 + i, 11 + i),
+                             (event.start_local().hour,
+                              event.end_local().hour))
+            self.assertEqual(['Prof. A'], event.metadata['people'])
+            self.assertEqual('lecture', event.event_type)
+
+    def test_update_sql_casts_values_on_postgres(self):
+        settings_dict = dict(connection.settings_dict,
+            ENGINE='django.db.backends.postgresql_psycopg2')
+        postgres = load_backend(settings_dict['ENGINE']).DatabaseWrapper(
+            settings_dict, 'postgres')
+        fields = [Event._meta.get_field(name)
+                  for name in ('start', 'allday', 'status', 'source')]
+
+        self.assertEqual(
+            'UPDATE "timetables_event" SET '
+            '"start" = CASE id WHEN %s THEN'
+            ' CAST(%s AS timestamp with time zone) END, '
+            '"allday" = CASE id WHEN %s THEN CAST(%s AS boolean) END, '
+            '"status" = CASE id WHEN %s THEN CAST(%s AS smallint) END, '
+            '"source_id" = CASE id WHEN %s THEN CAST(%s AS integer) END '
+            'WHERE id IN (%s)',
+            importers.SeriesEvents._update_sql(fields, 1, postgres))
+
+    def test_delete_removes_tags_and_versions(self):
+        self.import_events([self.make_event('e1', 'Event 1'),
+                            self.make_event('e2', 'Event 2')])
+        event = Event.objects.get(uid='import-e1')
+        user = Thing.objects.get(fullpath='user/testuser')
+        EventTag.objects.create(thing=user, event=event)
+        # An older version of the event, which isn't imported
+        version = Event(from_instance=event)
+        version.uid = 'version'
+        version.save()
+        self.assertEqual(1, user.get_events().count())
+
+        self.import_events([EventData('e1', delete=True)])
+
+        self.assertEqual([('import-e2', 'Event 2')], self.get_events())
+        self.assertFalse(EventTag.objects.exists())
+        self.assertFalse(ThingEventIndex.objects.filter(
+            event_id__in=[event.id, version.id]).exists())
+        self.assertEqual(0, user.get_events().count())
+
+    def test_unchanged_events_are_not_updated(self):
+        events = [self.make_event('e1', 'Event 1')]
+        self.import_events(events)
+        self.assertEqual([], self.import_events(events))
+
+    def test_insert_then_delete(self):
+        self.import_events([self.make_event('e1', 'Event 1'),
+                            self.make_event('e2', 'Event 2'),
+                            self.make_event('e2', 'Event 2 (again)'),
+                            EventData('e2', delete=True)])
+        self.assertEqual([('import-e1', 'Event 1')], self.get_events())
+
+    def test_duplicate_uids(self):
+        self.import_events([self.make_event('e1', 'Event 1')])
+        source = EventSource.objects.get(title='Unit Test Series')
+        Event.objects.create(uid='import-e1', title='Copy', source=source,
+                             start=source.event_set.get().start,
+                             end=source.event_set.get().end)
+
+        self.assertEqual([
+            ('failed', 'event', 'Event uid import-e1 was not unique'),
+            ('failed', 'event', 'Multiple events found with uid import-e1'),
+        ], self.import_events([self.make_event('e1', 'Event 1 (changed)'),
+                               EventData('e1', delete=True)]))
+
@@ -7,6 +7,8 @@ import logging
 from timetables.models import HierachicalModel, Event, Thing, EventSource,\
     ThingTag
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.core.cache import get_cache
 from django.core.signing import base64_hmac
 from django.utils.timezone import now
 from django.conf import settings
@@ -15,6 +17,116 @@ from django.utils.crypto import constant_time_compare
 
 log = logging.getLogger(__name__)
 
+
+ADMIN_TARGETS_KEY = "permissions:admin_targets:%s"
+
+
+def get_permission_cache():
+    return get_cache(settings.PERMISSION_CACHE)
+
+
+def invalidate_user_admin_targets(user_thing_id):
+    """
+    Drop the cached admin targets of the user Thing with the specified id.
+    ThingTags created or deleted in bulk don't send signals, so whatever
+    changes them must call this itself.
+    """
+    get_permission_cache().delete(ADMIN_TARGETS_KEY % user_thing_id)
+
+def invalidate_admin_targets(sender, instance=None, **kwargs):
+    """
+    Signal handler dropping the cached admin targets of the user Thing a
+    ThingTag is from.
+    """
+    invalidate_user_admin_targets(instance.thing_id)
+
+post_save.connect(invalidate_admin_targets, sender=ThingTag)
+post_delete.connect(invalidate_admin_targets, sender=ThingTag)
+
+
+class PermissionMemo(object):
+    '''
+    Memoises the lookups made while resolving a user's permissions.
+
+    The memo is stored on the user object, which Django creates for each
+    request, so it lasts for a single request (in the same way as
+    ModelBackend's _perm_cache). The set of Things the user administers is
+    also shared between requests via the cache named by
+    settings.PERMISSION_CACHE.
+    '''
+
+    ATTRIBUTE = "_timetables_perm_memo"
+
+    @classmethod
+    def for_user(cls, user_obj):
+        memo = getattr(user_obj, cls.ATTRIBUTE, None)
+        if memo is None:
+            memo = cls(user_obj)
+            setattr(user_obj, cls.ATTRIBUTE, memo)
+        return memo
+
+    def __init__(self, user_obj):
+        self.user_obj = user_obj
+        # Resolved permission sets keyed by (handler class, subject key)
+        self.permissions = {}
+        self._lookups = {}
+        self._user_thing = None
+        self._user_thing_fetched = False
+        self._admin_targets = None
+
+    @property
+    def user_thing(self):
+        '''
+        The user's Thing, or None if they don't have one.
+        '''
+        if not self._user_thing_fetched:
+            try:
+                self._user_thing = Thing.get_by_path(
+                    "user/%s" % self.user_obj.username)
+            except Thing.DoesNotExist:
+                self._user_thing = None
+            self._user_thing_fetched = True
+        return self._user_thing
+
+    def memoise(self, key, func):
+        '''
+        Returns the result of func(), calling it only the first time key is
+        seen.
+        '''
+        if key not in self._lookups:
+            self._lookups[key] = func()
+        return self._lookups[key]
+
+    def resolve_thing(self, subject):
+        '''
+        Sets the Thing of a HierachicalSubject, fetching each path only once.
+        '''
+        if subject._thing is None:
+            subject._thing = self.memoise(("thing", subject.fullpath),
+                                          subject._get_thing)
+
+    @property
+    def admin_targets(self):
+        '''
+        The ids of the Things the user has an admin ThingTag on.
+        '''
+        if self._admin_targets is None:
+            userthing = self.user_thing
+            if userthing is None:
+                self._admin_targets = frozenset()
+            else:
+                cache = get_permission_cache()
+                key = ADMIN_TARGETS_KEY % userthing.id
+                targets = cache.get(key)
+                if targets is None:
+                    targets = frozenset(ThingTag.objects
+                        .filter(thing=userthing, annotation="admin")
+                        .values_list("targetthing_id", flat=True))
+                    cache.set(key, targets, settings.PERMISSION_CACHE_TIMEOUT)
+                self._admin_targets = targets
+        return self._admin_targets
+
+
 class BaseAuthorizationHandler(object):
     
     class Meta:
@@ -23,13 +135,29 @@ class BaseAuthorizationHandler(object):
     def _get_subject_perms(self, user_obj, obj):
         return self.JUST_READ
 
+    def _get_subject_key(self, obj):
+        '''
+        Returns a hashable key identifying the subject obj, under which its
+        resolved permissions are memoised for the rest of the request, or
+        None if they shouldn't be memoised.
+        '''
+        return None
+
     def get_all_permissions(self, user_obj, obj=None):
         if isinstance(obj,self.SUBJECT):
             if user_obj.is_staff:
                 return self.ALL
-            # This is a little more complex, we need to find out if the users Thing is associated with
-            # the eventsource.
-            return self._get_subject_perms(user_obj, obj)
+            key = self._get_subject_key(obj)
+            if key is None:
+                return self._get_subject_perms(user_obj, obj)
+
+            permissions = PermissionMemo.for_user(user_obj).permissions
+            key = (self.__class__, key)
+            if key not in permissions:
+                # This is a little more complex, we need to find out if the users Thing is associated with
+                # the eventsource.
+                permissions[key] = self._get_subject_perms(user_obj, obj)
+            return permissions[key]
         return set()
 
 
@@ -70,7 +198,15 @@ class HierachicalSubject(object):
 
     def _get_thing(self):
         if self._thing is None:
-            self._thing = Thing.objects.get(pathid=Thing.hash(self.fullpath))
+            self._thing = Thing.get_by_path(self.fullpath)
+        return self._thing
+
+    def _get_thing_for_update(self):
+        '''
+        Read the Thing from the database rather than the cache, as its
+        changes are going to be saved.
+        '''
+        self._thing = Thing.objects.get(pathid=Thing.hash(self.path))
         return self._thing
 
     def is_user(self):
@@ -102,6 +238,8 @@ class HierachicalSubject(object):
         if t is None:
             return None
         self.create_salt(update)
+        # create_salt() may have re-read the Thing
+        t = self._get_thing()
         # This depends on setting.SECRET_KEY which should be configured for the instance
         # Changing that will invalidate all hmacs. Deleting the salt will invalidate
         # just hmacs for this thing.
@@ -112,7 +250,9 @@ class HierachicalSubject(object):
         Create or update salt in the Thing metadata.
         Separated from create_hmac so that user salts may be regenerated independently. 
         '''
-        t = self._get_thing()
+        if not update and 'salt' in self._get_thing().metadata:
+            return False
+        t = self._get_thing_for_update()
         metadata = t.metadata
         if update or 'salt' not in metadata:
             metadata['salt'] = Thing.hash(now().isoformat())
@@ -130,11 +270,14 @@ class HierachicalAuthorizationHandler(BaseAuthorizationHandler):
     JUST_READ = frozenset((HierachicalModel.PERM_READ,))
     SUBJECT = HierachicalSubject
 
-    
+    def _get_subject_key(self, obj):
+        return (obj.path, obj.hmac)
                 
     def _get_subject_perms(self, user_obj, obj):
+        memo = PermissionMemo.for_user(user_obj)
         if obj.hmac is not None:
             # A hmac can only ever grant read
+            memo.resolve_thing(obj)
             if obj.is_hmac_valid():
                 return self.JUST_READ
             return set()
@@ -144,12 +287,18 @@ class HierachicalAuthorizationHandler(BaseAuthorizationHandler):
 
         try:
             # Get the thing associated with this user
-            userthing = Thing.objects.get(pathid=Thing.hash("user/%s" % user_obj.username))
+            userthing = memo.user_thing
+            if userthing is None:
+                raise Thing.DoesNotExist()
             # Check if this event is associated with an admin annotation via eventtag or eventsourcetag
+            memo.resolve_thing(obj)
             t = obj.thing
             if t is not None:
-                Thing.objects.get(id=t.id,relatedthing__thing=userthing,eventtag__annotation="admin")
-                return self.ALL
+                is_admin = memo.memoise(("thing_admin", t.id),
+                    Thing.objects.filter(id=t.id, relatedthing__thing=userthing,
+                                         eventtag__annotation="admin").exists)
+                if is_admin:
+                    return self.ALL
         except Thing.DoesNotExist:
             # One or more of the things we were looking for doesn't exist, therefore therefore there is only read.
             pass
@@ -193,13 +342,18 @@ class EventAuthorizationHandler(BaseAuthorizationHandler):
     ALL = frozenset((Event.PERM_WRITE, Event.PERM_READ,))
     JUST_READ = frozenset((Event.PERM_READ,))
     SUBJECT = EventSubject
+
+    def _get_subject_key(self, obj):
+        return obj.event_id if obj._event is None else obj._event.id
                 
     def _get_subject_perms(self, user_obj, obj):
         # This is a little more complex, we need to find out if the users Thing is associated with
         # the event.
         try:
             # Get the thing associated with this user
-            userthing = Thing.objects.get(pathid=Thing.hash("user/%s" % user_obj.username))
+            userthing = PermissionMemo.for_user(user_obj).user_thing
+            if userthing is None:
+                raise Thing.DoesNotExist()
             # Check if this event is associated with an admin annotation via eventtag or eventsourcetag
             e = obj.event
             if e is not None:
@@ -238,11 +392,18 @@ class EventSourceAuthorizationHandler(BaseAuthorizationHandler):
     ALL = frozenset((EventSource.PERM_WRITE, EventSource.PERM_READ, EventSource.PERM_LINK, ))
     JUST_READ = frozenset((EventSource.PERM_READ,))
     SUBJECT = EventSourceSubject
+
+    def _get_subject_key(self, obj):
+        if obj._event_source is None:
+            return obj.event_source_id
+        return obj._event_source.id
                 
     def _get_subject_perms(self, user_obj, obj):
         try:
             # Get the thing associated with this user
-            userthing = Thing.objects.get(pathid=Thing.hash("user/%s" % user_obj.username))
+            userthing = PermissionMemo.for_user(user_obj).user_thing
+            if userthing is None:
+                raise Thing.DoesNotExist()
             # Check if this eventsource is associated with an admin annotation via  eventsourcetag
             es = obj.event_source
             if es is not None:
@@ -271,15 +432,14 @@ class GlobalThingAuthorizationHandler(BaseAuthorizationHandler):
     JUST_READ = frozenset((Thing.PERM_READ,))
     SUBJECT = GlobalThingSubject
 
-    def _get_subject_perms(self, user_obj, obj):
-        try:
-            # Is there anything associated with the user
-            userthing = Thing.objects.get(pathid=Thing.hash("user/%s" % user_obj.username))
-            if ThingTag.objects.filter(thing=userthing,annotation="admin").count() > 0:
-                return self.ALL
-        except Thing.DoesNotExist:
-            pass
+    def _get_subject_key(self, obj):
+        # There's only one global subject
+        return GlobalThingSubject
 
+    def _get_subject_perms(self, user_obj, obj):
+        # Is there anything associated with the user
+        if PermissionMemo.for_user(user_obj).admin_targets:
+            return self.ALL
 
         return self.JUST_READ
     
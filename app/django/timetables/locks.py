@@ -0,0 +1,283 @@
+"""
+Backends used by LockStrategy to store the locks held on Things.
+
+A lock on a Thing consists of two parts, a short (timeout) lock which the
+admin UI refreshes every few seconds while a timetable is open, and a long
+(edit) lock which is refreshed whenever the timetable is edited. The lock is
+only held while neither has expired.
+
+The backend used by default is set by settings.LOCK_BACKEND.
+"""
+import datetime
+import math
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import transaction
+from django.utils import decorators
+
+from timetables.models import Thing, ThingLock, LockStrategy, LockException
+
+
+class DatabaseLockBackend(object):
+    """
+    Stores locks as ThingLock rows. Locks survive a restart of the cache, but
+    each operation needs several queries.
+
+    Expired locks are never used again, so acquiring a lock occasionally
+    deletes a batch of them (see also the sweep_thing_locks command).
+    """
+
+    # The chance of acquire() deleting a batch of expired locks
+    SWEEP_PROBABILITY = 0.05
+
+    def __init__(self, sweep_probability=SWEEP_PROBABILITY):
+        self.sweep_probability = sweep_probability
+
+    def get_status(self, things, now):
+        """
+        things should be list of thing fullpaths
+        Returns dictionary containing lock data for specified things;
+        dictionary is in form { thing_fullpath: user }, where user is user
+        thing which has the lock or None
+        """
+
+        # initialise locks_status to ensure that a value is returned for all of the specified things
+        locks_status = {}
+        things_hashed = []
+        for thing_fullpath in things:
+            locks_status[thing_fullpath] = False
+            things_hashed.append(Thing.hash(thing_fullpath)) # hash for indexed filtering
+
+        # get all of the locks for the specified things
+        locks = (ThingLock.objects.filter(thing__pathid__in=things_hashed)
+                 .just_active(now=lambda: now)
+                 .order_by("-expires") # descending order to ensure most recent is first
+                 .prefetch_related("thing")
+                 .prefetch_related("owner"))
+        # note that prefetch_related calls mean we only ever make three database queries; otherwise it is arbitrary depending on the number of different things and found owners
+
+        # process locks to check both short and long are set
+        things_locks = {}
+        for lock in locks: # pair up all the locks
+            thing_fullpath = lock.thing.fullpath
+            if thing_fullpath not in things_locks:
+                things_locks[thing_fullpath] = {}
+            if lock.name not in things_locks[thing_fullpath]: # ensure we only use the most recent
+                things_locks[thing_fullpath][lock.name] = lock.owner
+
+        for thing_fullpath, thing_locks in things_locks.items(): # for each thing_id, check that both locks are set (and are the same person)
+            owner = False
+            if (LockStrategy.TIMEOUT_LOCK_NAME in thing_locks and
+                    LockStrategy.EDIT_LOCK_NAME in thing_locks):
+                if (thing_locks[LockStrategy.TIMEOUT_LOCK_NAME] ==
+                        thing_locks[LockStrategy.EDIT_LOCK_NAME]):
+                    owner_thing = thing_locks[LockStrategy.TIMEOUT_LOCK_NAME]
+                    owner = {"name": owner_thing.name} # may be expanded as required
+            locks_status[thing_fullpath] = owner
+
+        # return locks to caller
+        return locks_status
+
+    def _get_lock(self, thing, name, now):
+        locks = (thing.locks.filter(name=name)
+                # Use our own 'now' implementation to allow the current time
+                # to be altered for testing purposes
+                .just_active(now=lambda: now)
+                .order_by("expires")[:1])
+        if len(locks) == 0:
+            return None
+
+        return locks[0]
+
+    def _get_locks(self, thing, now):
+        timeout_lock = self._get_lock(thing, LockStrategy.TIMEOUT_LOCK_NAME, now)
+        edit_lock = self._get_lock(thing, LockStrategy.EDIT_LOCK_NAME, now)
+
+        if timeout_lock and edit_lock and timeout_lock.owner == edit_lock.owner:
+            return (timeout_lock, edit_lock)
+        return None
+
+    def get_holder(self, thing, now):
+        locks = self._get_locks(thing, now)
+        if locks:
+            return locks[0].owner
+        return None
+
+    @decorators.method_decorator(transaction.commit_on_success)
+    def refresh(self, thing, owner, now, timeout_expires, edit_expires=None):
+        # Check if the thing is already locked by someone else
+        locks = self._get_locks(thing, now)
+
+        if locks is None:
+            raise LockException("Thing is not locked by anyone. Call "
+                    "acquire_lock() to acquire the lock before attempting to "
+                    "refresh it.")
+
+        timeout_lock, edit_lock = locks
+        assert timeout_lock.owner == edit_lock.owner
+        existing_owner = timeout_lock.owner
+
+        if existing_owner != owner:
+            raise LockException("Thing is already locked by another "
+                    "user. Thing: %s, user: %s" % (thing, existing_owner))
+
+        # We must already hold the lock, so refresh the requested lock.
+        timeout_lock.expires = timeout_expires
+        timeout_lock.save()
+
+        if edit_expires is not None:
+            edit_lock.expires = edit_expires
+            edit_lock.save()
+
+    def acquire(self, thing, owner, now, timeout_expires, edit_expires):
+        # Check if the thing is already locked by someone else
+        locks = self._get_locks(thing, now)
+
+        # Refuse to create a lock if it's already locked by SOMEONE ELSE.
+        # Note that we'll re-create the lock if we already hold it.
+        if locks is not None and locks[0].owner != owner:
+            raise LockException("Thing is already locked by someone. "
+                    "thing: %s, current owner: %s" % (thing, locks[0].owner))
+
+        # Remove old locks before creating a new one
+        (thing.locks.filter(
+                name__in=[LockStrategy.TIMEOUT_LOCK_NAME,
+                          LockStrategy.EDIT_LOCK_NAME])
+                .delete())
+
+        ThingLock.objects.create(thing=thing, owner=owner,
+                expires=timeout_expires,
+                name=LockStrategy.TIMEOUT_LOCK_NAME)
+
+        ThingLock.objects.create(thing=thing, owner=owner,
+                expires=edit_expires,
+                name=LockStrategy.EDIT_LOCK_NAME)
+
+        if random.random() < self.sweep_probability:
+            ThingLock.delete_expired(now=lambda: now, max_batches=1)
+
+
+class CacheLockBackend(object):
+    """
+    Stores locks in the cache named by settings.LOCK_CACHE, under a key per
+    Thing holding the owner and the expiry times of both parts of the lock.
+    Entries expire from the cache along with the lock, and get_status() for
+    any number of Things is a single get_many().
+
+    The cache API has no compare-and-swap, so changes are made while holding
+    a short lived mutex, taken with the cache's atomic add(). The cache must
+    be shared by all processes (e.g. memcached) for locks to be exclusive.
+
+    This is best effort rather than a true compare-and-swap. The mutex holds
+    a token unique to each acquisition, and is only released by the process
+    whose token it still holds, so a process which overruns MUTEX_TIMEOUT
+    doesn't release the mutex taken by another. There is still a window
+    between reading the token and deleting the mutex in which it could expire
+    and be taken, and an overrunning process may write the lock after the
+    mutex has passed to another.
+    """
+
+    KEY = "locks:thing:%s"
+    MUTEX_KEY = "locks:mutex:%s"
+
+    # The number of seconds after which a mutex is released even if the
+    # process holding it died, and how long to wait for a mutex to be released.
+    MUTEX_TIMEOUT = 5
+    MUTEX_WAIT = datetime.timedelta(seconds=2)
+    MUTEX_POLL_INTERVAL = 0.05
+
+    def __init__(self, cache=None):
+        self._cache = cache
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_cache(settings.LOCK_CACHE)
+        return self._cache
+
+    @staticmethod
+    def _is_active(lock, now):
+        return (lock is not None and lock["timeout_expires"] >= now and
+                lock["edit_expires"] >= now)
+
+    def _get_active(self, thing, now):
+        lock = self.cache.get(self.KEY % thing.pathid)
+        if self._is_active(lock, now):
+            return lock
+        return None
+
+    def get_status(self, things, now):
+        keys = dict((self.KEY % Thing.hash(fullpath), fullpath)
+                    for fullpath in things)
+        locks = self.cache.get_many(keys.keys())
+
+        locks_status = dict((fullpath, False) for fullpath in things)
+        for key, lock in locks.items():
+            if self._is_active(lock, now):
+                locks_status[keys[key]] = {"name": lock["owner_name"]}
+        return locks_status
+
+    def get_holder(self, thing, now):
+        lock = self._get_active(thing, now)
+        if lock is None:
+            return None
+        return Thing.objects.get(pk=lock["owner_id"])
+
+    def _swap(self, thing, now, update):
+        """
+        Atomically replace the lock on thing with the result of calling
+        update with the currently active lock (or None).
+        """
+        mutex_key = self.MUTEX_KEY % thing.pathid
+        token = uuid.uuid4().hex
+        give_up = time.time() + self.MUTEX_WAIT.total_seconds()
+        while not self.cache.add(mutex_key, token, self.MUTEX_TIMEOUT):
+            if time.time() > give_up:
+                raise LockException("Timed out waiting to update the lock "
+                        "on %s" % thing)
+            time.sleep(self.MUTEX_POLL_INTERVAL)
+
+        try:
+            lock = update(self._get_active(thing, now))
+            expires = min(lock["timeout_expires"], lock["edit_expires"])
+            timeout = max(1, int(math.ceil((expires - now).total_seconds())))
+            self.cache.set(self.KEY % thing.pathid, lock, timeout)
+        finally:
+            # Unless we overran MUTEX_TIMEOUT and another process now holds it
+            if self.cache.get(mutex_key) == token:
+                self.cache.delete(mutex_key)
+
+    def refresh(self, thing, owner, now, timeout_expires, edit_expires=None):
+        def update(lock):
+            if lock is None:
+                raise LockException("Thing is not locked by anyone. Call "
+                        "acquire_lock() to acquire the lock before "
+                        "attempting to refresh it.")
+            if lock["owner_id"] != owner.id:
+                raise LockException("Thing is already locked by another "
+                        "user. Thing: %s, user: %s" % (
+                            thing, lock["owner_name"]))
+            lock = dict(lock, timeout_expires=timeout_expires)
+            if edit_expires is not None:
+                lock["edit_expires"] = edit_expires
+            return lock
+        self._swap(thing, now, update)
+
+    def acquire(self, thing, owner, now, timeout_expires, edit_expires):
+        def update(lock):
+            # Note that we'll re-create the lock if we already hold it.
+            if lock is not None and lock["owner_id"] != owner.id:
+                raise LockException("Thing is already locked by someone. "
+                        "thing: %s, current owner: %s" % (
+                            thing, lock["owner_name"]))
+            return {
+                "owner_id": owner.id,
+                "owner_name": owner.name,
+                "timeout_expires": timeout_expires,
+                "edit_expires": edit_expires
+            }
+        self._swap(thing, now, update)
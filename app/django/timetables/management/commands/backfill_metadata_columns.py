@@ -0,0 +1,43 @@
+"""
+Copy the metadata keys mirrored in columns from the data of existing Events
+and EventSources
+
+The columns are kept up to date whenever Events and EventSources are saved,
+so this only needs to be run after the columns are added, or if data has been
+changed directly in the database. Rows whose columns are already correct are
+not written, so it's safe to run again.
+"""
+
+import argparse
+import sys
+
+from timetables.models import Event, EventSource, SchemalessModel
+from timetables.utils import manage_commands
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="backfill_metadata_columns",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("--batch-size", type=int,
+            default=SchemalessModel.BACKFILL_BATCH_SIZE,
+            help="The number of rows to read at a time.")
+
+    def handle(self, args):
+        for model in (EventSource, Event):
+            updated, invalid = model.backfill_metadata_columns(
+                batch_size=args.batch_size)
+
+            sys.stderr.write("Updated {0} {1} objects\n".format(
+                updated, model.__name__))
+            if invalid:
+                sys.stderr.write("{0} {1}(s) have invalid data: {2}\n".format(
+                    len(invalid), model.__name__,
+                    ", ".join(str(i) for i in invalid)))
@@ -0,0 +1,139 @@
+"""
+Measure the size and rendering time of each event feed format, with and
+without gzip compression, scaled to 10,000 events.
+
+By default a set of generated events is exported (no database access is
+needed), otherwise the events of --thing are. The generated events belong to
+series of --weeks weekly lectures, like most real series.
+"""
+
+import argparse
+import datetime
+import json
+import sys
+import time
+import uuid
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.text import compress_sequence
+
+from timetables.models import Thing
+from timetables.utils import manage_commands
+from timetables.utils.formats.records import EventRecord, EventRecords
+from timetables.utils.reflection import newinstance
+
+
+# The number of events the results are scaled to
+PER_EVENTS = 10000
+
+# The number of lectures in a generated series, as in "Mi1-8 Th 10"
+WEEKS = 8
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="benchmark_exporters",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("--events", type=int, default=PER_EVENTS,
+            help="The number of events to generate.")
+        self.parser.add_argument("--weeks", type=int, default=WEEKS,
+            help="The number of weekly events in each generated series.")
+        self.parser.add_argument("--thing", metavar="FULLPATH",
+            help="Export the events of this Thing rather than generated "
+                 "events.")
+        self.parser.add_argument("--depth", type=int, choices=[1, 2],
+            default=1, help="The depth of the --thing feed.")
+        self.parser.add_argument("--repeat", type=int, default=3,
+            help="The number of times to render each variant, the fastest "
+                 "of which is reported.")
+
+    def generate_events(self, count, weeks):
+        records = EventRecords(None)
+        start = timezone.now().replace(minute=0, second=0, microsecond=0)
+        data = json.dumps({"type": "lecture", "people": ["Prof A Person"]})
+        events = []
+        for i in range(count):
+            series, week = divmod(i, weeks)
+            event_start = start + datetime.timedelta(weeks=week, hours=series)
+            values = (i, str(uuid.uuid4()), "Lecture %d" % series,
+                      "Lecture Theatre %d" % (series % 10), event_start,
+                      event_start + datetime.timedelta(hours=1),
+                      settings.TIME_ZONE, settings.TIME_ZONE, False,
+                      "lecture", "Prof A Person", data, series)
+            events.append(EventRecord(records, values, records.get_series(
+                series, "Series %d" % series)))
+        records._domain = "example.com"
+        return events
+
+    def get_events(self, args):
+        if args.thing is None:
+            return self.generate_events(args.events, args.weeks)
+        thing = Thing.objects.get(pathid=Thing.hash(args.thing))
+        # Read the events once, so the database isn't included in the timings
+        return list(EventRecords(thing.get_events(depth=args.depth)))
+
+    def get_variants(self):
+        """
+        Yields (name, exporter_class, options) for each variant, where
+        options are the exporter attributes to set.
+        """
+        for outputformat, exporter_class in sorted(
+                settings.EVENT_EXPORTERS.items()):
+            try:
+                exporter = newinstance(exporter_class)
+            except ImportError as e:
+                sys.stdout.write("{0}: unavailable ({1})\n".format(
+                    outputformat, e))
+                continue
+            if exporter is None:
+                continue
+            yield outputformat, exporter_class, {}
+            if hasattr(exporter, "ndjson"):
+                yield outputformat + " (ndjson)", exporter_class, {
+                    "ndjson": True}
+            if hasattr(exporter, "recurrences"):
+                yield outputformat + " (weekly)", exporter_class, {
+                    "recurrences": True}
+
+    def render(self, exporter_class, options, events, gzip):
+        exporter = newinstance(exporter_class)
+        exporter.stream_response = True
+        for name, value in options.items():
+            setattr(exporter, name, value)
+        response = exporter.export(events)
+        content = response.streaming_content
+        if gzip:
+            content = compress_sequence(content)
+        return sum(len(chunk) for chunk in content)
+
+    def handle(self, args):
+        events = self.get_events(args)
+        if not events:
+            sys.stderr.write("No events to export\n")
+            return
+        scale = float(PER_EVENTS) / len(events)
+
+        sys.stdout.write("{0} events, results per {1} events\n".format(
+            len(events), PER_EVENTS))
+        sys.stdout.write("{0:<16} {1:>8} {2:>14} {3:>10}\n".format(
+            "format", "encoding", "bytes", "seconds"))
+        for name, exporter_class, options in self.get_variants():
+            for gzip in (False, True):
+                timings = []
+                for _ in range(args.repeat):
+                    start = time.time()
+                    size = self.render(exporter_class, options, events,
+                                       gzip)
+                    timings.append(time.time() - start)
+
+                sys.stdout.write("{0:<16} {1:>8} {2:>14,d} {3:>10.3f}\n".format(
+                    name, "gzip" if gzip else "identity",
+                    int(size * scale), min(timings) * scale))
@@ -0,0 +1,110 @@
+"""
+Measure the time taken by LockStrategy.get_status() for a page of timetables
+against a ThingLock table holding a year of expired locks, and again once the
+expired locks have been deleted.
+
+The timetables and locks are created inside a transaction which is rolled
+back afterwards.
+"""
+
+import argparse
+import datetime
+import sys
+import time
+
+from django.db import transaction
+from django.utils import timezone
+
+from timetables.models import Thing, ThingLock, LockStrategy
+from timetables.locks import DatabaseLockBackend
+from timetables.utils import manage_commands
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="benchmark_lock_status",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("--timetables", type=int, default=50,
+            help="The number of timetables to lock, all shown on one page.")
+        self.parser.add_argument("--locks-per-day", type=int, default=5,
+            help="The number of times each timetable is locked each day.")
+        self.parser.add_argument("--days", type=int, default=365,
+            help="The number of days of lock history to create.")
+        self.parser.add_argument("--repeat", type=int, default=20,
+            help="The number of times to call get_status().")
+
+    def handle(self, args):
+        # Nothing is ever committed, so the synthetic locks are discarded by
+        # the rollback once we're done.
+        with transaction.commit_manually():
+            try:
+                fullpaths = self.create_lock_history(args)
+                self.benchmark("with history", fullpaths, args.repeat)
+
+                start = time.time()
+                deleted = ThingLock.delete_expired()
+                sys.stderr.write("Deleted {0} expired locks in {1:.2f}s\n"
+                                 .format(deleted, time.time() - start))
+
+                self.benchmark("swept", fullpaths, args.repeat)
+            finally:
+                transaction.rollback()
+
+    def create_lock_history(self, args):
+        owner = Thing.create_path("user/bench-lock-owner",
+                                  {"type": "user", "fullname": "Bench"})
+        root = Thing.create_path("tripos/bench-locks", {"fullname": "Bench"})
+        timetables = []
+        for i in range(args.timetables):
+            name = "part-{0}".format(i)
+            timetable = Thing(parent=root, name=name, fullname=name,
+                              type="part")
+            timetable.save()
+            timetables.append(timetable)
+
+        start = time.time()
+        now = timezone.now()
+        locks = []
+        for day in range(args.days, 0, -1):
+            for n in range(args.locks_per_day):
+                acquired = now - datetime.timedelta(days=day, hours=n)
+                for timetable in timetables:
+                    locks.append(ThingLock(thing=timetable, owner=owner,
+                        name=LockStrategy.TIMEOUT_LOCK_NAME,
+                        expires=acquired + LockStrategy.TIMEOUT_LOCK_TIMEOUT))
+                    locks.append(ThingLock(thing=timetable, owner=owner,
+                        name=LockStrategy.EDIT_LOCK_NAME,
+                        expires=acquired + LockStrategy.EDIT_LOCK_TIMEOUT))
+            if len(locks) > 5000:
+                ThingLock.objects.bulk_create(locks)
+                locks = []
+        ThingLock.objects.bulk_create(locks)
+
+        # Half of the timetables are currently locked
+        strategy = LockStrategy(
+            backend=DatabaseLockBackend(sweep_probability=0))
+        for timetable in timetables[::2]:
+            strategy.acquire_lock(timetable, owner)
+
+        sys.stderr.write("Created {0} locks in {1:.2f}s\n".format(
+            ThingLock.objects.count(), time.time() - start))
+        return [timetable.fullpath for timetable in timetables]
+
+    def benchmark(self, name, fullpaths, repeat):
+        strategy = LockStrategy(backend=DatabaseLockBackend())
+        timings = []
+        for _ in range(repeat):
+            start = time.time()
+            strategy.get_status(fullpaths)
+            timings.append(time.time() - start)
+        sys.stdout.write(
+            "{0:>12}: {1} locks, best {2:.2f}ms, mean {3:.2f}ms\n".format(
+                name, ThingLock.objects.count(), min(timings) * 1000,
+                sum(timings) / len(timings) * 1000))
@@ -0,0 +1,71 @@
+"""
+Time the expansion of every datePattern stored in EventSource metadata, first
+with an empty expanded pattern cache and then with a warm one.
+"""
+
+import argparse
+import sys
+import time
+
+from timetables.models import EventSource
+from timetables.utils import manage_commands
+from timetables.utils import v1
+from timetables.utils.academicyear import TERM_STARTS
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="benchmark_patterns",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("--year", type=int, choices=TERM_STARTS,
+            default=max(TERM_STARTS),
+            help="The academic year to expand the patterns in.")
+        self.parser.add_argument("--repeat", type=int, default=3,
+            help="The number of warm passes over the patterns.")
+
+    def get_patterns(self):
+        patterns = []
+        for eventsource in EventSource.objects.only("data").iterator():
+            pattern = eventsource.metadata.get("datePattern")
+            if pattern:
+                patterns.append(pattern)
+        return patterns
+
+    def expand_all(self, patterns, year):
+        failures = 0
+        start = time.time()
+        for pattern in patterns:
+            try:
+                v1.expand_pattern(pattern, year)
+            except Exception:
+                failures += 1
+        return time.time() - start, failures
+
+    def report(self, name, patterns, elapsed):
+        sys.stdout.write(
+            "{0:>6}: {1} patterns in {2:.3f}s ({3:.1f} patterns/s)\n".format(
+                name, len(patterns), elapsed,
+                len(patterns) / elapsed if elapsed > 0 else 0))
+
+    def handle(self, args):
+        patterns = self.get_patterns()
+        sys.stdout.write("Found {0} stored patterns, {1} distinct\n".format(
+            len(patterns), len(set(patterns))))
+
+        v1._expanded_patterns.clear()
+        elapsed, failures = self.expand_all(patterns, args.year)
+        self.report("cold", patterns, elapsed)
+        if failures:
+            sys.stdout.write("{0} patterns couldn't be expanded\n".format(
+                failures))
+
+        best = min(self.expand_all(patterns, args.year)[0]
+                   for _ in range(args.repeat))
+        self.report("warm", patterns, best)
@@ -0,0 +1,109 @@
+"""
+Compare the time taken to find the descendants of Things using the
+ThingClosure table (Thing.treequery) against the previous approach of OR-ing
+together parent__parent__...__pathid lookups.
+
+By default the Things already in the database are used. With --synthetic, a
+university-sized hierarchy of triposes, parts, subjects and modules is created
+first, inside a transaction which is rolled back afterwards.
+"""
+
+import argparse
+import sys
+import time
+
+from django.db import models, transaction
+
+from timetables.models import Thing
+from timetables.utils import manage_commands
+
+
+def parent_chain_query(paths, inclusive=True, max_depth=10):
+    """
+    The original implementation of Thing.treequery().
+    """
+    pathhashes = [Thing.hash(p) for p in paths]
+    q = None
+    if inclusive:
+        q = models.Q(pathid__in=pathhashes)
+    key = "pathid"
+    for _ in range(0, max_depth):
+        key = "parent__%s" % key
+        qterm = models.Q(**{"%s__in" % key: pathhashes})
+        q = qterm if q is None else q | qterm
+    return q
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="benchmark_treequery",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("paths", metavar="PATH", nargs="*",
+            default=["tripos"],
+            help="The Thing paths to find the descendants of.")
+        self.parser.add_argument("--repeat", type=int, default=20,
+            help="The number of times to run each query.")
+        self.parser.add_argument("--synthetic", action="store_true",
+            help="Create a synthetic hierarchy under tripos/ to query.")
+        self.parser.add_argument("--triposes", type=int, default=30)
+        self.parser.add_argument("--parts", type=int, default=3)
+        self.parser.add_argument("--subjects", type=int, default=4)
+        self.parser.add_argument("--modules", type=int, default=15)
+
+    def handle(self, args):
+        # Nothing is ever committed, so the synthetic hierarchy is discarded
+        # by the rollback once we're done.
+        with transaction.commit_manually():
+            try:
+                if args.synthetic:
+                    self.create_synthetic_hierarchy(args)
+                self.benchmark(args)
+            finally:
+                transaction.rollback()
+
+    def create_synthetic_hierarchy(self, args):
+        root = Thing.create_path("tripos", {"fullname": "Triposes"})
+
+        def create_children(parent, count, thing_type):
+            children = []
+            for i in range(count):
+                name = "bench-{0}-{1}".format(thing_type, i)
+                child = Thing(parent=parent, name=name, fullname=name,
+                              type=thing_type)
+                child.save()
+                children.append(child)
+            return children
+
+        start = time.time()
+        for tripos in create_children(root, args.triposes, "tripos"):
+            for part in create_children(tripos, args.parts, "part"):
+                for subject in create_children(part, args.subjects,
+                                               "subject"):
+                    create_children(subject, args.modules, "module")
+        sys.stderr.write("Created hierarchy in {1:.2f}s ({0} Things in total)\n".format(
+            Thing.objects.count(), time.time() - start))
+
+    def time_query(self, q, repeat):
+        timings = []
+        count = None
+        for _ in range(repeat):
+            start = time.time()
+            count = len(list(Thing.objects.filter(q).values_list("id", flat=True)))
+            timings.append(time.time() - start)
+        return count, min(timings), sum(timings) / len(timings)
+
+    def benchmark(self, args):
+        for name, query in [("parent chain", parent_chain_query),
+                            ("closure", Thing.treequery)]:
+            count, best, mean = self.time_query(query(args.paths),
+                                                args.repeat)
+            sys.stdout.write(
+                "{0:>12}: {1} things, best {2:.2f}ms, mean {3:.2f}ms\n".format(
+                    name, count, best * 1000, mean * 1000))
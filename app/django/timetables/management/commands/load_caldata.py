@@ -2,20 +2,35 @@
 Created on May 23, 2012
 
 @author: ieb
+
+Loads the calendar data exported by Timetables v1. The detail files are
+listed once, parsed and expanded into events by a pool of worker processes,
+and then loaded in batches, each in its own transaction, with bulk inserts.
+The time spent in each phase is logged at the end.
 '''
 import re
 from django.utils import simplejson as json
 from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+import collections
+import contextlib
+import itertools
+import multiprocessing
 import os
+import time
 
 import logging
 from timetables.utils.v1 import generate
 from timetables.models import EventSource, Event, Thing,\
-    EventSourceTag, MAX_NAME_LENGTH, MAX_URL_LENGTH
+    EventSourceTag, ThingEventIndex, MAX_NAME_LENGTH, MAX_URL_LENGTH
+from timetables.querysets import batched
+from timetables.utils import transactions
 from optparse import make_option
 import urllib2
 log = logging.getLogger(__name__)
 
+# The most events inserted by each INSERT, where the database allows it
+EVENT_BATCH_SIZE = 2000
 
 
 ID_PATTERNS = (
@@ -170,6 +185,16 @@ KNOWN_LEVELS = {
 KNOWN_MODULES = {
                  "Entire course" : None
         }
+def init_worker():
+    # Workers don't use the database, but mustn't share the parent's
+    # connection.
+    connection.close()
+
+
+def parse_detail_file(job):
+    return Command().parse_detail_file(*job)
+
+
 class Command(BaseCommand):
     args = '<path_to_caldata_location> [list]|[<Subject::level> <Subject::level>] '
     help = 'Loads test data to populate the db for the first time, allowing dump'
@@ -190,6 +215,16 @@ class Command(BaseCommand):
             dest='source_element',
             default=False,
             help='Map element to EventSource objects'),
+        make_option('--workers',
+            type='int',
+            dest='workers',
+            default=multiprocessing.cpu_count(),
+            help='The number of processes parsing detail files'),
+        make_option('--batch-size',
+            type='int',
+            dest='batch_size',
+            default=100,
+            help='The number of detail files loaded in each transaction'),
         )
 
     def handle(self, *args, **options):
@@ -198,12 +233,16 @@ class Command(BaseCommand):
         
         logging.basicConfig(level=logging.INFO)
 
+        workers = options.get("workers") or 1
+        batch_size = options.get("batch_size") or 100
+
         if len(args) == 1 or args[1] == 'list':
             listOnly = True
         else:
             listOnly = False
         if len(args) == 1:
-            self.load_calendar_data(None, args[0], listOnly)
+            self.load_calendar_data(None, args[0], listOnly,
+                    workers=workers, batch_size=batch_size)
         else:
             nameFilter = []
             eventSourceLevel = "file" 
@@ -214,7 +253,8 @@ class Command(BaseCommand):
             for a in args[1:]:
                 nameFilter.append(a.lower())
             
-            self.load_calendar_data(nameFilter, args[0], listOnly, eventSourceLevel)
+            self.load_calendar_data(nameFilter, args[0], listOnly, eventSourceLevel,
+                    workers=workers, batch_size=batch_size)
             
     def _for_url(self, name):
         if name is None:
@@ -247,7 +287,156 @@ class Command(BaseCommand):
         log.error("No Url Mapping for %s " % name)
         return urllib2.quote(name.strip().lower().replace(" ","_").encode("utf8"))
 
-    def load_calendar_data(self, nameFilter, caldir, listOnly, eventSourceLevel="file"):
+    @contextlib.contextmanager
+    def _timed(self, phase):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.timings[phase] = self.timings.get(phase, 0) + time.time() - start
+
+    def index_detail_files(self, caldir, part_ids):
+        """
+        List the detail files once, grouping them by the id of the part they
+        belong to, which prefixes the id in their name.
+
+        Returns: A dict of part id to a sorted list of detail file names.
+        """
+        detailMatch = re.compile("details_(T\d*).json$")
+        prefix_lengths = set(len(part_id) for part_id in part_ids)
+        part_ids = set(part_ids)
+
+        index = collections.defaultdict(list)
+        for fileName in sorted(os.listdir(caldir)):
+            m = detailMatch.match(fileName)
+            if m is None:
+                continue
+            for length in prefix_lengths:
+                prefix = m.group(1)[:length]
+                if prefix in part_ids:
+                    index[prefix].append(fileName)
+        return index
+
+    def plan(self, top, caldir, listOnly, eventSourceLevel):
+        """
+        Work out which detail files to load for each part in top.json.
+
+        Returns: A list of the arguments to parse_detail_file() for each file.
+        """
+        parts = []
+        for year in top["years"]:
+            log.info("Processing Year %s " % year['name'])
+            start_year = int(re.match("(\d{4})", year['name']).group(1))
+            for tripos in year['triposes']:
+                if not 'parts' in tripos or \
+                        len(tripos['parts']) == 0 or \
+                        'id' not in tripos['parts'][0]:
+                    log.info("Skipping Invalid Tripos %s " % tripos)
+                    continue
+                if listOnly:
+                    log.info("Processing Tripos %s" % (tripos['name']))
+                    
+                triposId = self._parseId(tripos['parts'][0]['id'])
+                if triposId is None:
+                    continue
+
+                for p in tripos['parts']:
+                    nameParts = self._parsePartName(p["name"])
+                    if nameParts is None:
+                        nameParts = {"name" : p["name"] }
+                        log.error("Failed to parse name  %s " % p["name"])
+                    log.info("Processing Part triposId %s  Part %s " % (p["name"], nameParts))
+                    if listOnly:
+                        continue
+                    parts.append((p['id'], nameParts, start_year))
+
+        with self._timed("index"):
+            index = self.index_detail_files(caldir, [p[0] for p in parts])
+
+        return [(caldir, dfn, nameParts, start_year, eventSourceLevel)
+                for part_id, nameParts, start_year in parts
+                for dfn in index.get(part_id, [])]
+
+    def parse_detail_file(self, caldir, dfn, nameParts, start_year, eventSourceLevel):
+        """
+        Parse a detail file and expand its date patterns. This is run in the
+        worker processes, so doesn't touch the database.
+
+        Returns: A dict describing the Thing to create, and a list of
+            (title, url, events) for each EventSource, where events are
+            (start, end, title, location, uid, data, allday, event_type,
+            people) tuples.
+        """
+        detailF = open(os.path.join(caldir, dfn))
+        detail = json.loads(detailF.read())
+        detailF.close()
+
+        groupTitle = "Unknown"
+        if "name" in detail:
+            groupTitle = detail['name']
+        elif "subject" in nameParts:
+            groupTitle = nameParts['subject']
+        elif "name" in nameParts:
+            groupTitle = nameParts['name']
+
+        name = nameParts['name']
+        level = self._get_level(nameParts)
+        module = self._get_module(detail)
+
+        u = []
+        for x in [self._tripos_for_url(name), level, self._for_url(module) ]:
+            if x is not None:
+                u.append(x)
+        thingpath = "tripos/%s" % ("/".join(u))
+
+        types = []
+        if self._tripos_for_url(name) is not None:
+            types.append("tripos")
+        if level is not None:
+            types.append("level")
+        if module is not None:
+            types.append("module")
+
+        sources = []
+        def add_source(title, url):
+            sources.append((title[:(MAX_NAME_LENGTH-1)], url[:(MAX_URL_LENGTH-1)], []))
+            return sources[-1][2]
+
+        if eventSourceLevel == "file":
+            events = add_source(groupTitle, dfn)
+
+        for n, g in enumerate(detail.get('groups', [])):
+            if eventSourceLevel == "group":
+                events = add_source("%s %s" % (groupTitle, n), "%s:%s" % (dfn, n))
+            group_template = g.get('code') or ""
+            for e in g['elements']:
+                location = e.get('where') or g.get('location') or "Unknown"
+                title = e.get('what') or groupTitle or 'Unnamed'
+                date_time_pattern = g.get('when') or ""
+                if eventSourceLevel == "element":
+                    events = add_source("%s %s" % (groupTitle, title), "%s:%s:%s" % (dfn, n, title))
+                # generate() validates the events, which needs no queries
+                # without a source. The source is set when they're loaded.
+                events.extend((event.start, event.end, event.title,
+                               event.location, event.uid, event.data,
+                               event.allday, event.event_type, event.people)
+                              for event in generate(None,
+                                     title,
+                                     location,
+                                     date_time_pattern,
+                                     group_template,
+                                     start_year))
+
+        return {
+            "thingpath": thingpath,
+            "types": types,
+            "fullname": detail['name'][:(MAX_NAME_LENGTH-1)],
+            "has_groups": "groups" in detail,
+            "sources": sources
+        }
+
+    def load_calendar_data(self, nameFilter, caldir, listOnly, eventSourceLevel="file",
+                           workers=1, batch_size=100):
         # Scan the eventdata subdir
         # For each json file found parse and load
         """
@@ -298,178 +487,165 @@ class Command(BaseCommand):
                     "name": "Architecture & History of Art"
                 },
         """
-        
+
+        self.timings = collections.OrderedDict()
+        self.things = {}
+        self.sources = {}
+        self.total_events = 0
+        start = time.time()
+
         caldir = os.path.abspath(caldir)
         topF = open("%s/top.json" % caldir)
         top = json.loads(topF.read())
         topF.close()
 
-        detail_files = []
-        detailMatch = re.compile("details_T\d*.json$")
-        files = os.listdir(caldir)
-        for fileName in files:
-            if detailMatch.match(fileName) is not None:
-                detail_files.append(fileName)
-        total_events = 0
-        for year in top["years"]:
-            log.info("Processing Year %s " % year['name'])
-            start_year = int(re.match("(\d{4})", year['name']).group(1))
-            for tripos in year['triposes']:
-                if not 'parts' in tripos or \
-                        len(tripos['parts']) == 0 or \
-                        'id' not in tripos['parts'][0]:
-                    log.info("Skipping Invalid Tripos %s " % tripos)
-                    continue
-                if listOnly:
-                    log.info("Processing Tripos %s" % (tripos['name']))
-                    
-                triposId = self._parseId(tripos['parts'][0]['id'])
-                if triposId is None:
-                    continue
-
-                partsProcessed = 0
-                for p in tripos['parts']:
-                    n = 0
-
-                    nameParts = self._parsePartName(p["name"])
-                    triposId = self._parseId(p['id'])
-                    if nameParts is None:
-                        nameParts = {"name" : p["name"] }
-                        log.error("Failed to parse name  %s " % p["name"])
-                    '''
-
-                    if 'level' in nameParts:
-                        partId = "%s::%s" % (nameParts['name'], nameParts['level'])
-                    else:
-                        partId = "%s::" % (nameParts['name'])
-                    if nameFilter is not None and partId.lower() not in nameFilter:
-                        if listOnly:
-                            log.info("Skipping Part triposId %s  Part %s " % (triposCode, partId))
-                        continue
-                    '''
-                    log.info("Processing Part triposId %s  Part %s " % (p["name"], nameParts))
-                    if listOnly:
-                        continue
-
-                    partsProcessed = partsProcessed + 1
-
-
-
-                    dre = re.compile("details_%s\d*.json$" % p['id'])
-                    # log.info("Scanning with pattern %s " % dre.pattern)
-
-
-                    for dfn in detail_files:
-                        if not dre.match(dfn):
-                            continue
-                        detailFileName = "%s/%s" % (caldir, dfn)
-                        # log.info("Found %s " % detailFileName)
-                        detailF = open(detailFileName)
-                        detail = json.loads(detailF.read())
-                        detailF.close()
-                        
-                        
-                        groupTitle = "Unknown"
-                        level = "0"
-                        if "name" in detail:
-                            groupTitle = detail['name']
-                        elif "subject" in nameParts:
-                            groupTitle = nameParts['subject']
-                        elif "name" in nameParts:
-                            level = nameParts['name']
-                            groupTitle = nameParts['name']
-
-                        name = nameParts['name']
-                        level = self._get_level(nameParts)
-                        module = self._get_module(detail)
-                        
-                        u = []
-                        for x in [self._tripos_for_url(name), level, self._for_url(module) ]:
-                            if x is not None:
-                                u.append(x)
-                        thingpath = "tripos/%s" % ("/".join(u))
-
-                        types = []
-                        if self._tripos_for_url(name) is not None:
-                            types.append("tripos")
-                        if level is not None:
-                            types.append("level")
-                        if module is not None:
-                            types.append("module")
-
-                        
-                        
-                        thing = Thing.create_path(thingpath,    { 
-                                            "fullname" : detail['name'][:(MAX_NAME_LENGTH-1)]
-                                            }, types
-                                        )
-                        if eventSourceLevel == "file":
-                            source = self.loadEventSource(groupTitle[:(MAX_NAME_LENGTH-1)], dfn[:(MAX_URL_LENGTH-1)])
-                            EventSourceTag.objects.get_or_create(thing=thing,eventsource=source)
-
-                        # Todo: create an Thing here to associate with the source departments/department/subject/name
-                        
-
-                        if "groups" in detail:
-                            events = []
-                            n = 0
-                            sources = 0
-                            for g in detail['groups']:
-                                if eventSourceLevel == "group":
-                                    source = self.loadEventSource(("%s %s" % (groupTitle, n))[:(MAX_NAME_LENGTH-1)], ("%s:%s" % (dfn,n))[:(MAX_URL_LENGTH-1)])
-                                    EventSourceTag.objects.get_or_create(thing=thing,eventsource=source)
-                                    sources = sources + 1
-                                group_template = g.get('code') or ""
-                                for e in g['elements']:
-                                    location = e.get('where') or g.get('location') or "Unknown"
-                                    title = e.get('what') or groupTitle or 'Unnamed'
-                                    date_time_pattern = g.get('when') or ""
-                                    if eventSourceLevel == "element":
-                                        source = self.loadEventSource(("%s %s" % (groupTitle, title))[:(MAX_NAME_LENGTH-1)] , ("%s:%s:%s" % (dfn,n,title))[:(MAX_URL_LENGTH-1)])
-                                        EventSourceTag.objects.get_or_create(thing=thing,eventsource=source)
-                                        sources = sources + 1
-                                    events.extend(generate(source,
-                                             title,
-                                             location,
-                                             date_time_pattern,
-                                             group_template,
-                                             start_year))
-                            self.bulk_create(events)
-                            total_events = total_events + len(events)
-                            log.info("%s (%s) added %s events in %s series" % (thingpath, types[-1], len(events), sources))
-
-            log.info("Created %s events " % total_events)
-            
-    def loadEventSource(self,name,url):
-        source, created = EventSource.objects.get_or_create(title=name)
-        if created:
-            source.sourceurl = url
-            source.type = "S"
-            source.save()
-        else:
-            Event.objects.filter(source=source).delete()
-        return source
+        jobs = self.plan(top, caldir, listOnly, eventSourceLevel)
+        if listOnly:
+            return
 
-
-    def bulk_create(self, events, max_batch_size=500):
+        log.info("Loading %s detail files with %s worker(s)" % (len(jobs), workers))
+        results = self.parse_detail_files(jobs, workers)
+        while True:
+            with self._timed("parse"):
+                batch = list(itertools.islice(results, batch_size))
+            if not batch:
+                break
+            with transactions.commit_on_success():
+                self.load_batch(batch)
+
+        # Sets the master of the new events and invalidates cached feeds. The
+        # events were indexed as each batch was loaded.
+        Event.after_bulk_operation()
+
+        log.info("Created %s events " % self.total_events)
+        for phase, seconds in self.timings.items():
+            log.info("%s: %.1fs" % (phase, seconds))
+        log.info("total: %.1fs" % (time.time() - start))
+
+    def parse_detail_files(self, jobs, workers):
+        if workers <= 1:
+            for job in jobs:
+                yield parse_detail_file(job)
+            return
+
+        connection.close()
+        pool = multiprocessing.Pool(workers, initializer=init_worker)
+        try:
+            for result in pool.imap(parse_detail_file, jobs, chunksize=4):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def load_things(self, results):
         """
-        Inserts a list of events using Event.objects.bulk_create while ensuring
-        SQLite doesn't get too many at once.
-        
-        Args:
-            events: The events to insert
-            max_batch_size: The maximum number of events to insert at once.
+        Get or create the Things of each result, creating the missing ones
+        (and their parents) in bulk for each distinct list of types.
         """
-        # SQLite blows up if bulk_create exceeds 500 entries it seems. e.g.:
-        # http://stackoverflow.com/questions/9527851/
-        remaining = events
-        while True:
-            to_insert, remaining = remaining[:max_batch_size], remaining[max_batch_size:]
-            if not to_insert:
-                return
-            Event.objects.bulk_create(to_insert)
-            Event.after_bulk_operation()
+        missing = collections.OrderedDict()
+        for result in results:
+            if result["thingpath"] not in self.things:
+                paths = missing.setdefault(tuple(result["types"]), {})
+                paths[result["thingpath"]] = {"fullname" : result["fullname"]}
+
+        for types, properties in missing.items():
+            self.things.update(Thing.ensure_paths(
+                    properties.keys(), list(types), properties))
+        return [self.things[result["thingpath"]] for result in results]
+
+    def load_sources(self, titles):
+        """
+        Get or create the EventSources with the specified titles, deleting the
+        events of any that already exist as loadEventSource() did.
 
+        Args:
+            titles: A dict of title to the url of new EventSources.
+        """
+        existing = [t for t in titles if t in self.sources]
+        missing = [t for t in titles if t not in self.sources]
+
+        for batch in batched(missing):
+            for source in EventSource.objects.filter(title__in=batch).order_by("-id"):
+                self.sources[source.title] = source
+                existing.append(source.title)
+        missing = [t for t in missing if t not in self.sources]
+
+        for batch in batched(self.sources[t].id for t in existing):
+            Event.objects.filter(source__in=batch).delete()
+
+        EventSource.objects.bulk_create([
+            EventSource(title=t, sourceurl=titles[t], sourcetype="S")
+            for t in missing])
+        for batch in batched(missing):
+            for source in EventSource.objects.filter(title__in=batch).order_by("-id"):
+                self.sources[source.title] = source
+
+    def load_tags(self, pairs):
+        """
+        Create EventSourceTags for each (thing id, source id) pair which
+        doesn't have one.
+        """
+        thing_ids = set(thing_id for thing_id, _ in pairs)
+        existing = set()
+        for batch in batched(thing_ids):
+            existing.update(EventSourceTag.objects
+                    .filter(thing__in=batch)
+                    .values_list("thing_id", "eventsource_id"))
+        EventSourceTag.objects.bulk_create([
+            EventSourceTag(thing_id=thing_id, eventsource_id=source_id)
+            for thing_id, source_id in pairs if (thing_id, source_id) not in existing])
+
+    def load_batch(self, results):
+        with self._timed("things"):
+            things = self.load_things(results)
+
+        # Later sources with the same title replace the events of earlier
+        # ones, as loadEventSource() deleted the existing events.
+        titles = collections.OrderedDict()
+        events = collections.OrderedDict()
+        for result in results:
+            for title, url, source_events in result["sources"]:
+                titles.setdefault(title, url)
+                events[title] = source_events
+
+        with self._timed("sources"):
+            self.load_sources(titles)
+
+        with self._timed("tags"):
+            pairs = collections.OrderedDict()
+            for thing, result in zip(things, results):
+                for title, _, _ in result["sources"]:
+                    pairs[(thing.id, self.sources[title].id)] = True
+            self.load_tags(pairs.keys())
+
+        with self._timed("events"):
+            new_events = [
+                Event(start=start, end=end, title=title, location=location,
+                      uid=uid, data=data, allday=allday, event_type=event_type,
+                      people=people, source=self.sources[source_title])
+                for source_title, source_events in events.items()
+                for (start, end, title, location, uid, data, allday,
+                     event_type, people) in source_events
+            ]
+            # Django doesn't check an explicit batch_size against the
+            # database's limit on query parameters (999 for SQLite)
+            batch_size = min(EVENT_BATCH_SIZE, connection.ops.bulk_batch_size(
+                Event._meta.concrete_fields, new_events))
+            Event.objects.bulk_create(new_events, batch_size=batch_size)
+
+        with self._timed("event index"):
+            ThingEventIndex.index_sources(self.sources[t].id for t in titles)
+
+        for result in results:
+            n_events = sum(len(e) for _, _, e in result["sources"])
+            self.total_events += n_events
+            if result["has_groups"]:
+                log.info("%s (%s) added %s events in %s series" % (
+                    result["thingpath"], result["types"][-1], n_events,
+                    len(result["sources"])))
 
     def _parseSet(self, name, patterns):
         for r in patterns:
@@ -8,9 +8,7 @@ import json
 from collections import namedtuple
 import datetime
 
-from django.db import transaction
-
-from timetables.utils import manage_commands
+from timetables.utils import manage_commands, transactions
 from timetables.models import Thing
 from timetables.management.commands.moveevents import Progress, RollingAverage, AnimatedProgressRenderer
 
@@ -33,7 +31,7 @@ class Command(manage_commands.ArgparseBaseCommand):
             help="JSON file containing CRSID metadata."
         )
 
-    @transaction.commit_on_success
+    @transactions.commit_on_success
     def handle(self, args):
         crsids = json.load(args.crsid_json_file)
 
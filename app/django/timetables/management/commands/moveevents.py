@@ -17,6 +17,7 @@ from django.utils.timezone import is_aware
 from django.core.exceptions import ValidationError
 
 from timetables.models import Event
+from timetables.utils.transactions import committing
 from timetables.utils import manage_commands
 from timetables.utils import datetimes
 from timetables.utils.academicyear import TERM_STARTS
@@ -40,7 +41,7 @@ class Command(manage_commands.ArgparseBaseCommand):
 
     def handle(self, args):
         # Wrap the entire moving process in a transaction
-        with transaction.commit_manually():
+        with committing(), transaction.commit_manually():
             try:
                 self.move_events(args)
             except:
@@ -55,9 +56,12 @@ class Command(manage_commands.ArgparseBaseCommand):
 
     def move_events(self, args):
         event_mover = self.get_event_mover(args)
-        events = self.get_events()
 
-        event_count = events.count()
+        # The term dates of all the events are worked out up front in one go,
+        # which is much quicker than doing it event by event.
+        moved = event_mover.move_events(list(self.get_events()))
+
+        event_count = len(moved)
         progress = Progress(event_count, RollingAverage())
 
         progress_renderer = AnimatedProgressRenderer(
@@ -65,19 +69,15 @@ class Command(manage_commands.ArgparseBaseCommand):
             update_interval=datetime.timedelta(seconds=0.25),
             last_n_sample_count=500)
 
-        moved = []
         failed = []
 
-        for i, event in enumerate(self.get_events()):
+        for i, (event, old_start, old_end) in enumerate(moved):
             is_last = i == event_count - 1
             with progress:
-                old_start, old_end = event.start, event.end
-                if event_mover.move_event(event):
-                    moved.append((event, old_start, old_end))
-                    try:
-                        event.save()
-                    except ValidationError as e:
-                        failed.append((event, e))
+                try:
+                    event.save()
+                except ValidationError as e:
+                    failed.append((event, e))
             progress_renderer.render(force=is_last)
 
         # Print details of events moved
@@ -107,30 +107,40 @@ class Command(manage_commands.ArgparseBaseCommand):
         sys.stdout.write("\n")
 
     def get_moved_json(self, moved):
+        datetimes_json = self.get_datetimes_json(
+            dt
+            for event, old_start, old_end in moved
+            for dt in (old_start, event.start, old_end, event.end)
+        )
         return [
             OrderedDict([
                 ("id", event.id),
                 ("title", event.title),
-                ("old_start", self.get_datetime_json(old_start)),
-                ("start", self.get_datetime_json(event.start)),
-                ("old_end", self.get_datetime_json(old_end)),
-                ("end", self.get_datetime_json(event.end)),
+                ("old_start", next(datetimes_json)),
+                ("start", next(datetimes_json)),
+                ("old_end", next(datetimes_json)),
+                ("end", next(datetimes_json)),
             ])
             for event, old_start, old_end in moved
         ]
 
-    def get_datetime_json(self, dt):
-        return {
-            "abs": self.format_datetime(dt),
-            "rel": self.format_relative_date(dt)
-        }
+    def get_datetimes_json(self, dts):
+        dts = list(dts)
+        termweeks = datetimes.dates_to_termweeks(dt.date() for dt in dts)
+        return iter([
+            {
+                "abs": self.format_datetime(dt),
+                "rel": self.format_relative_date(termweek)
+            }
+            for dt, termweek in zip(dts, termweeks)
+        ])
 
     def format_datetime(self, dt):
         timestamp = time.mktime(dt.timetuple())
         return format_date_time(timestamp)
 
-    def format_relative_date(self, dt):
-        year, term, week, day = datetimes.date_to_termweek(dt.date())
+    def format_relative_date(self, termweek):
+        year, term, week, day = termweek
         return "{year} {term} W{week} {day}".format(
             year=year,
             term=term.capitalize(),
@@ -160,20 +170,42 @@ class EventMover(object):
         if not year in TERM_STARTS:
             raise ValueError("{} not known: {}".format(name, year))
 
-    def move_event(self, event):
-        if not self.should_be_moved(event):
-            return False
+    def move_events(self, events):
+        """
+        Moves the events in from_year to the equivalent term dates in to_year.
+        The events are updated but not saved.
 
-        self.update_event_timestamps(event)
-        return True
+        Returns: A list of (event, old_start, old_end) tuples for the events
+            which were moved.
+        """
+        termweeks = datetimes.dates_to_termweeks(
+            dt.date() for event in events for dt in (event.start, event.end))
+        to_move = [
+            (event, start_termweek, end_termweek)
+            for event, start_termweek, end_termweek
+            in zip(events, termweeks[0::2], termweeks[1::2])
+            if self.should_be_moved(start_termweek)
+        ]
 
-    def should_be_moved(self, event):
-        year, term, week, day = datetimes.date_to_termweek(event.start.date())
+        new_dates = datetimes.termweeks_to_dates(
+            self.move_termweek(termweek)
+            for event, start_termweek, end_termweek in to_move
+            for termweek in (start_termweek, end_termweek))
+
+        moved = []
+        for i, (event, _, _) in enumerate(to_move):
+            moved.append((event, event.start, event.end))
+            self.update_event_timestamps(
+                event, new_dates[i * 2], new_dates[i * 2 + 1])
+        return moved
+
+    def should_be_moved(self, start_termweek):
+        year, term, week, day = start_termweek
         return year == self.from_year
 
-    def update_event_timestamps(self, event):
-        start = self.move_datetime(event.start)
-        end = self.move_datetime(event.end)
+    def update_event_timestamps(self, event, start_date, end_date):
+        start = datetime.datetime.combine(start_date, event.start.timetz())
+        end = datetime.datetime.combine(end_date, event.end.timetz())
 
         assert is_aware(start) == is_aware(event.start)
         assert is_aware(end) == is_aware(event.end)
@@ -181,14 +213,13 @@ class EventMover(object):
         event.start = start
         event.end = end
 
-    def move_datetime(self, dt):
-        year, term, week, day = datetimes.date_to_termweek(dt.date())
+    def move_termweek(self, termweek):
+        year, term, week, day = termweek
 
         assert year == self.from_year, (
             "Moved datetimes must be in the from_year")
 
-        new_date = datetimes.termweek_to_date(self.to_year, term, week, day)
-        return datetime.datetime.combine(new_date, dt.timetz())
+        return (self.to_year, term, week, day)
 
 
 class RollingAverage(object):
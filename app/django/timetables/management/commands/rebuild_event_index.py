@@ -0,0 +1,32 @@
+"""
+Rebuild the ThingEventIndex of Events linked to each Thing from scratch
+"""
+
+import argparse
+import sys
+
+from timetables.models import ThingEventIndex
+from timetables.utils import manage_commands, transactions
+from timetables.utils.feedcache import feed_cache
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="rebuild_event_index",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+    def handle(self, args):
+        # Rebuild in a single transaction so that timetables are never seen
+        # half indexed. Cached feeds were built from the old index.
+        with transactions.commit_on_success():
+            ThingEventIndex.rebuild()
+            feed_cache.invalidate_events()
+
+        sys.stderr.write("Indexed {0} thing events\n".format(
+            ThingEventIndex.objects.count()))
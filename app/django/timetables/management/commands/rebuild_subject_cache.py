@@ -0,0 +1,30 @@
+"""
+Rebuild the cached subjects catalogue
+
+The catalogue is rebuilt automatically when tripos, part or subject Things
+change, but changes made directly in the database aren't noticed.
+"""
+
+import argparse
+import sys
+
+from timetables.utils import manage_commands
+from timetables.utils.subjectcache import subject_cache
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="rebuild_subject_cache",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+    def handle(self, args):
+        subject_cache.rebuild()
+
+        sys.stderr.write("Cached {0} subjects\n".format(
+            len(subject_cache.get_subjects())))
@@ -0,0 +1,28 @@
+"""
+Rebuild the ThingClosure table of Thing ancestors/descendants from scratch
+"""
+
+import argparse
+import sys
+
+from timetables.models import ThingClosure
+from timetables.utils import manage_commands, transactions
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="rebuild_thing_closure",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+    def handle(self, args):
+        with transactions.commit_on_success():
+            ThingClosure.rebuild()
+
+        sys.stderr.write("Closure contains {0} rows\n".format(
+            ThingClosure.objects.count()))
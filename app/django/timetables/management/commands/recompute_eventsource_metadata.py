@@ -1,16 +1,100 @@
 """
 Recompute Metadata on all EventSource objects based on child Events
+
+EventSources are processed in batches, each of which is committed in its own
+transaction, optionally using several worker processes. With --checkpoint,
+progress is recorded in a file so that an interrupted run resumes from where
+it stopped.
 """
 
 import argparse
+import datetime
+import json
+import multiprocessing
+import os
 import sys
+import time
 
-from django.db import transaction
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
+from timetables.models import Event, EventSource
+from timetables.querysets import batched
 from timetables.utils import manage_commands
 from timetables.management.commands import utils
 
 
+def parse_since(value):
+    since = parse_datetime(value)
+    if since is None:
+        date = parse_date(value)
+        if date is None:
+            raise argparse.ArgumentTypeError(
+                "Invalid date/time: {0}".format(value))
+        since = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(since):
+        since = timezone.make_aware(since, timezone.get_default_timezone())
+    return since
+
+
+def init_worker():
+    # Workers must open their own database connection rather than using the
+    # one inherited from the parent process.
+    connection.close()
+
+
+def recompute_batch(job):
+    index, eventsource_ids, dry_run = job
+    failed = utils.fix_eventsource_batch(eventsource_ids, dry_run=dry_run)
+    return index, len(eventsource_ids), failed
+
+
+class Checkpoint(object):
+    """
+    Records the id of the EventSource up to which every EventSource has been
+    processed. Batches can complete out of order, so this only advances once
+    all the batches before it have completed.
+    """
+
+    def __init__(self, path, batches):
+        self.path = path
+        self.batch_last_ids = [batch[-1] for batch in batches]
+        self.completed = set()
+        self.next_index = 0
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns: The id stored in the checkpoint file at path, or None if
+            there isn't one.
+        """
+        if path is None or not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)["last_id"]
+
+    def complete(self, index):
+        self.completed.add(index)
+        advanced = False
+        while self.next_index in self.completed:
+            self.completed.remove(self.next_index)
+            self.next_index += 1
+            advanced = True
+
+        if advanced and self.path is not None:
+            # Write then rename so that the checkpoint is never half written
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"last_id": self.batch_last_ids[self.next_index - 1]},
+                          f)
+            os.rename(tmp_path, self.path)
+
+    def finish(self):
+        if self.path is not None and os.path.exists(self.path):
+            os.remove(self.path)
+
+
 class Command(manage_commands.ArgparseBaseCommand):
 
     def __init__(self):
@@ -23,22 +107,89 @@ class Command(manage_commands.ArgparseBaseCommand):
         )
 
         self.parser.add_argument("--dry-run", action="store_true", help="Don't make any db changes.")
+        self.parser.add_argument("--since", type=parse_since,
+            help="Only recompute EventSources with events created or changed "
+                 "since this date/time, e.g. 2013-09-01 or 2013-09-01T12:00.")
+        self.parser.add_argument("--batch-size", type=int, default=200,
+            help="The number of EventSources to update in each transaction.")
+        self.parser.add_argument("--workers", type=int, default=1,
+            help="The number of worker processes to use.")
+        self.parser.add_argument("--checkpoint", metavar="FILE",
+            help="Record progress in FILE, resuming from it if it exists. "
+                 "The file is removed once all EventSources are processed.")
+
+    def get_eventsource_ids(self, args, last_id):
+        eventsources = EventSource.objects.order_by("id")
+        if args.since is not None:
+            eventsources = eventsources.filter(id__in=Event.objects
+                .filter(lastmodified__gte=args.since).values("source"))
+        if last_id is not None:
+            eventsources = eventsources.filter(id__gt=last_id)
+        return list(eventsources.values_list("id", flat=True))
+
+    def run_batches(self, jobs, workers):
+        if workers <= 1:
+            for job in jobs:
+                yield recompute_batch(job)
+            return
+
+        connection.close()
+        pool = multiprocessing.Pool(workers, initializer=init_worker)
+        try:
+            for result in pool.imap_unordered(recompute_batch, jobs):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
 
     def handle(self, args):
-        # Wrap the entire process in a transaction
-        with transaction.commit_manually():
-            try:
-                utils.fix_eventsources()
-            except:
-                transaction.rollback()
-                raise
-            else:
-                # Handle dry_run by always rolling back the transaction
-                if args.dry_run:
-                    transaction.rollback()
-                    sys.stderr.write("Dry run complete\n")
-                else:
-                    transaction.commit()
-                    sys.stderr.write("Update complete\n")
+        # A dry run makes no changes, so there's no progress to record
+        checkpoint_path = None if args.dry_run else args.checkpoint
+        last_id = Checkpoint.load(checkpoint_path)
+        if last_id is not None:
+            sys.stderr.write("Resuming after EventSource {0}\n".format(last_id))
+
+        ids = self.get_eventsource_ids(args, last_id)
+        batches = list(batched(ids, args.batch_size))
+        jobs = [(index, batch, args.dry_run)
+                for index, batch in enumerate(batches)]
+        checkpoint = Checkpoint(checkpoint_path, batches)
+
+        sys.stderr.write("Found {0} EventSource objects, processing in {1} "
+                         "batches with {2} worker(s)...\n".format(
+                            len(ids), len(batches), args.workers))
+
+        start = time.time()
+        processed = 0
+        failed = []
+        for index, count, batch_failed in self.run_batches(jobs, args.workers):
+            checkpoint.complete(index)
+            processed += count
+            failed.extend(batch_failed)
+
+            elapsed = time.time() - start
+            rate = processed / elapsed if elapsed > 0 else 0
+            sys.stderr.write("{0}/{1} EventSources processed, {2:.1f}/s\n"
+                             .format(processed, len(ids), rate))
+        checkpoint.finish()
+
+        elapsed = time.time() - start
+        sys.stderr.write(
+            "Processed {0} EventSources in {1:.1f}s ({2:.1f}/s)\n".format(
+                processed, elapsed, processed / elapsed if elapsed > 0 else 0))
 
+        if failed:
+            # Print details of eventsources which couldn't be saved
+            sys.stdout.write("\n\n{0:d} EventSource(s) couldn't be updated "
+                             "because they're in an invalid state and "
+                             "couldn't be saved:\n".format(len(failed)))
+            json.dump(failed, sys.stdout, indent=2)
+            sys.stdout.write("\n")
 
+        if args.dry_run:
+            sys.stderr.write("Dry run complete\n")
+        else:
+            sys.stderr.write("Update complete\n")
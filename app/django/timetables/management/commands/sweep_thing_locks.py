@@ -0,0 +1,34 @@
+"""
+Delete expired ThingLocks
+
+Expired locks are never used again. Some are deleted as locks are acquired,
+but this removes all of them.
+"""
+
+import argparse
+import sys
+
+from timetables.models import ThingLock
+from timetables.utils import manage_commands
+
+
+class Command(manage_commands.ArgparseBaseCommand):
+
+    def __init__(self):
+        super(Command, self).__init__()
+
+        self.parser = argparse.ArgumentParser(
+            prog="sweep_thing_locks",
+            description=__doc__,
+            formatter_class=argparse.ArgumentDefaultsHelpFormatter
+        )
+
+        self.parser.add_argument("--batch-size", type=int,
+            default=ThingLock.DELETE_EXPIRED_BATCH_SIZE,
+            help="The number of locks to delete at a time.")
+
+    def handle(self, args):
+        deleted = ThingLock.delete_expired(batch_size=args.batch_size)
+
+        sys.stderr.write("Deleted {0} expired locks, {1} remain\n".format(
+            deleted, ThingLock.objects.count()))
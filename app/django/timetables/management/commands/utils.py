@@ -2,47 +2,38 @@
 Shared utilities for use in multiple management commands
 """
 
-
-import json
-import sys
-
 from django.core.exceptions import ValidationError
+from django.db import transaction
 
 from timetables.models import EventSource
+from timetables.utils.transactions import committing
+
+def fix_eventsource_batch(eventsource_ids, dry_run=False):
+    """
+    Recompute the metadata of the EventSources with the given ids in a
+    single transaction, which is committed unless dry_run is True.
 
-def fix_eventsources():
-    all_es = EventSource.objects.all()
-    sys.stderr.write("Found %s EventSource objects, now processing...\n" % len(all_es))
-    sys.stderr.write("Objects processed so far: ")
+    Returns: A list of dicts of the id, title and validation_error of each
+        EventSource which couldn't be saved.
+    """
     failed = []
-    for i, es in enumerate(all_es):
-        if i % 250 == 0:
-            sys.stderr.write("%s " % i)
+    with committing(), transaction.commit_manually():
         try:
-            es.set_metadata(save=True)
-        except ValidationError as e:
-            failed.append((es, e))
-    sys.stderr.write("%s\n" % len(all_es))
-
-    if len(failed)>0:
-
-        # Print details of eventsources which couldn't be saved
-        sys.stdout.write("\n\n{failed_count:d} EventSource(s) couldn't be updated because they're in "
-               "an invalid state and couldn't be saved:\n"
-               .format(failed_count=len(failed)))
-    
-        json.dump(
-            [
-                {
-                    "id": es.id,
-                    "title": es.title,
-                    "validation_error": str(error)
-                }
-                for (es, error) in failed
-            ],
-            sys.stdout,
-            indent=2)
-        sys.stdout.write("\n")
-    else:
-        sys.stderr.write("All EventSources updated successfully!\n")
-
+            for es in EventSource.objects.filter(id__in=eventsource_ids):
+                try:
+                    es.set_metadata(save=True)
+                except ValidationError as e:
+                    failed.append({
+                        "id": es.id,
+                        "title": es.title,
+                        "validation_error": str(e)
+                    })
+        except:
+            transaction.rollback()
+            raise
+        else:
+            if dry_run:
+                transaction.rollback()
+            else:
+                transaction.commit()
+    return failed
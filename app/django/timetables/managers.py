@@ -59,6 +59,9 @@ class ThingLockManager(QuerySetManager):
     def just_active(self, **kwargs):
         return self.all().just_active(**kwargs)
 
+    def just_expired(self, **kwargs):
+        return self.all().just_expired(**kwargs)
+
 
 class EventSourceTagManager(QuerySetManager):
     querySet = querysets.EventSourceQuerySet
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+import datetime
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding model 'ThingClosure'
+        db.create_table(u'timetables_thingclosure', (
+            (u'id', self.gf('django.db.models.fields.AutoField')(primary_key=True)),
+            ('ancestor', self.gf('django.db.models.fields.related.ForeignKey')(related_name='closure_descendants', to=orm['timetables.Thing'])),
+            ('descendant', self.gf('django.db.models.fields.related.ForeignKey')(related_name='closure_ancestors', to=orm['timetables.Thing'])),
+            ('depth', self.gf('django.db.models.fields.PositiveIntegerField')()),
+        ))
+        db.send_create_signal(u'timetables', ['ThingClosure'])
+
+        # Adding unique constraint on 'ThingClosure', fields ['ancestor', 'descendant']
+        db.create_unique(u'timetables_thingclosure', ['ancestor_id', 'descendant_id'])
+
+        # Adding index on 'ThingClosure', fields ['ancestor', 'depth']
+        db.create_index(u'timetables_thingclosure', ['ancestor_id', 'depth'])
+
+        if db.dry_run:
+            return
+
+        # Populate the closure one level at a time, as the
+        # rebuild_thing_closure management command does.
+        db.execute(
+            "INSERT INTO timetables_thingclosure (ancestor_id, descendant_id, depth)"
+            " SELECT id, id, 0 FROM timetables_thing")
+        depth = 0
+        while db.execute(
+                "SELECT COUNT(*) FROM timetables_thingclosure WHERE depth = %s",
+                [depth])[0][0]:
+            db.execute(
+                "INSERT INTO timetables_thingclosure (ancestor_id, descendant_id, depth)"
+                " SELECT c.ancestor_id, t.id, c.depth + 1"
+                " FROM timetables_thingclosure c"
+                " INNER JOIN timetables_thing t ON t.parent_id = c.descendant_id"
+                " WHERE c.depth = %s",
+                [depth])
+            depth += 1
+
+    def backwards(self, orm):
+        # Removing index on 'ThingClosure', fields ['ancestor', 'depth']
+        db.delete_index(u'timetables_thingclosure', ['ancestor_id', 'depth'])
+
+        # Removing unique constraint on 'ThingClosure', fields ['ancestor', 'descendant']
+        db.delete_unique(u'timetables_thingclosure', ['ancestor_id', 'descendant_id'])
+
+        # Deleting model 'ThingClosure'
+        db.delete_table(u'timetables_thingclosure')
+
+    models = {
+        u'timetables.event': {
+            'Meta': {'object_name': 'Event'},
+            'current': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'end': ('django.db.models.fields.DateTimeField', [], {}),
+            'endtz': ('django.db.models.fields.CharField', [], {'default': "'Europe/London'", 'max_length': '32'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'location': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'master': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'versions'", 'null': 'True', 'to': u"orm['timetables.Event']"}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.EventSource']", 'null': 'True', 'blank': 'True'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {}),
+            'starttz': ('django.db.models.fields.CharField', [], {'default': "'Europe/London'", 'max_length': '32'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'uid': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'versionstamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'timetables.eventsource': {
+            'Meta': {'object_name': 'EventSource'},
+            'current': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'master': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'versions'", 'null': 'True', 'to': u"orm['timetables.EventSource']"}),
+            'sourcefile': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'blank': 'True'}),
+            'sourcetype': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'sourceurl': ('django.db.models.fields.CharField', [], {'max_length': '2048', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'versionstamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'timetables.eventsourcetag': {
+            'Meta': {'object_name': 'EventSourceTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'eventsource': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.EventSource']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.eventtag': {
+            'Meta': {'object_name': 'EventTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'event': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Event']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thing': {
+            'Meta': {'object_name': 'Thing'},
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'direct_events': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'direct_things'", 'symmetrical': 'False', 'through': u"orm['timetables.EventTag']", 'to': u"orm['timetables.Event']"}),
+            'fullname': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'fullpath': ('django.db.models.fields.CharField', [], {'max_length': '2048'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'locked_by': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'locked_things'", 'symmetrical': 'False', 'through': u"orm['timetables.ThingLock']", 'to': u"orm['timetables.Thing']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']", 'null': 'True', 'blank': 'True'}),
+            'pathid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'}),
+            'sources': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'things'", 'symmetrical': 'False', 'through': u"orm['timetables.EventSourceTag']", 'to': u"orm['timetables.EventSource']"}),
+            'type': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '12', 'db_index': 'True', 'blank': 'True'})
+        },
+        u'timetables.thingclosure': {
+            'Meta': {'unique_together': "((u'ancestor', u'descendant'),)", 'object_name': 'ThingClosure', 'index_together': "((u'ancestor', u'depth'),)"},
+            'ancestor': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'closure_descendants'", 'to': u"orm['timetables.Thing']"}),
+            'depth': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'descendant': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'closure_ancestors'", 'to': u"orm['timetables.Thing']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        u'timetables.thingeventindex': {
+            'Meta': {'unique_together': "((u'thing', u'event'),)", 'object_name': 'ThingEventIndex', 'index_together': "((u'thing', u'start'),)"},
+            'event': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'thing_index'", 'to': u"orm['timetables.Event']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'event_index'", 'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thinglock': {
+            'Meta': {'object_name': 'ThingLock'},
+            'expires': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '32', 'db_index': 'True'}),
+            'owner': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'owned_locks'", 'to': u"orm['timetables.Thing']"}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'locks'", 'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thingtag': {
+            'Meta': {'object_name': 'ThingTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'targetthing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'relatedthing'", 'to': u"orm['timetables.Thing']"}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        }
+    }
+
+    complete_apps = ['timetables']
\ No newline at end of file
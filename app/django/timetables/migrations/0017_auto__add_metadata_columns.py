@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+import datetime
+import json
+import logging
+from south.db import db
+from south.v2 import SchemaMigration
+from django.db import models
+
+
+log = logging.getLogger(__name__)
+
+
+# Copies of timetables.models.join_metadata_list() and metadata_text(), and
+# of the METADATA_COLUMNS of each model as of this migration, so that later
+# changes to the models don't change what it does.
+def join_metadata_list(values):
+    if isinstance(values, basestring):
+        return values
+    return "\n".join(values or [])
+
+
+def metadata_text(value):
+    return value or ""
+
+
+METADATA_COLUMNS = (
+    ("EventSource", (
+        ("datePattern", "date_pattern", metadata_text),
+        ("type", "event_type", metadata_text),
+        ("people", "people", join_metadata_list),
+    )),
+    ("Event", (
+        ("x-allday", "allday", bool),
+        ("type", "event_type", metadata_text),
+        ("people", "people", join_metadata_list),
+    )),
+)
+
+# The number of rows read by each query of the backfill
+BATCH_SIZE = 500
+
+
+class Migration(SchemaMigration):
+
+    def forwards(self, orm):
+        # Adding field 'EventSource.date_pattern'
+        db.add_column(u'timetables_eventsource', 'date_pattern',
+                      self.gf('django.db.models.fields.TextField')(default='', blank=True),
+                      keep_default=False)
+
+        # Adding field 'EventSource.event_type'
+        db.add_column(u'timetables_eventsource', 'event_type',
+                      self.gf('django.db.models.fields.CharField')(db_index=True, default='', max_length=512, blank=True),
+                      keep_default=False)
+
+        # Adding field 'EventSource.people'
+        db.add_column(u'timetables_eventsource', 'people',
+                      self.gf('django.db.models.fields.TextField')(default='', blank=True),
+                      keep_default=False)
+
+        # Adding field 'Event.allday'
+        db.add_column(u'timetables_event', 'allday',
+                      self.gf('django.db.models.fields.BooleanField')(default=False),
+                      keep_default=False)
+
+        # Adding field 'Event.event_type'
+        db.add_column(u'timetables_event', 'event_type',
+                      self.gf('django.db.models.fields.CharField')(db_index=True, default='', max_length=512, blank=True),
+                      keep_default=False)
+
+        # Adding field 'Event.people'
+        db.add_column(u'timetables_event', 'people',
+                      self.gf('django.db.models.fields.TextField')(default='', blank=True),
+                      keep_default=False)
+
+        if db.dry_run:
+            return
+
+        # Fill the new columns from the metadata of the existing rows, as the
+        # backfill_metadata_columns management command does. Reads use the
+        # columns from now on, so they can't be left empty.
+        for model_name, metadata_columns in METADATA_COLUMNS:
+            invalid = self.backfill_metadata_columns(
+                orm["timetables." + model_name], metadata_columns)
+            if invalid:
+                log.warning("Left the metadata columns of %d %s rows empty,"
+                            " as their data isn't valid JSON. The first ids"
+                            " are: %s", len(invalid), model_name,
+                            ", ".join(str(i) for i in invalid[:20]))
+
+    def backfill_metadata_columns(self, model, metadata_columns):
+        """
+        Set the columns of metadata_columns of each row of model whose
+        values differ from its data, with an UPDATE for each distinct set of
+        values in each batch of rows.
+
+        Returns: The ids of rows whose data isn't valid JSON.
+        """
+        fields = [field for _, field, _ in metadata_columns]
+        invalid = []
+        last_id = 0
+        while True:
+            rows = list(model.objects.filter(id__gt=last_id).order_by("id")
+                        .values_list("id", "data", *fields)[:BATCH_SIZE])
+            if not rows:
+                return invalid
+            last_id = rows[-1][0]
+
+            changes = {}
+            for row in rows:
+                try:
+                    metadata = json.loads(row[1]) if row[1] else {}
+                except ValueError:
+                    invalid.append(row[0])
+                    continue
+                columns = tuple(convert(metadata.get(key))
+                                for key, _, convert in metadata_columns)
+                if columns != tuple(row[2:]):
+                    changes.setdefault(columns, []).append(row[0])
+
+            for columns, ids in changes.items():
+                model.objects.filter(id__in=ids).update(
+                    **dict(zip(fields, columns)))
+
+
+    def backwards(self, orm):
+        # Deleting field 'EventSource.date_pattern'
+        db.delete_column(u'timetables_eventsource', 'date_pattern')
+
+        # Deleting field 'EventSource.event_type'
+        db.delete_column(u'timetables_eventsource', 'event_type')
+
+        # Deleting field 'EventSource.people'
+        db.delete_column(u'timetables_eventsource', 'people')
+
+        # Deleting field 'Event.allday'
+        db.delete_column(u'timetables_event', 'allday')
+
+        # Deleting field 'Event.event_type'
+        db.delete_column(u'timetables_event', 'event_type')
+
+        # Deleting field 'Event.people'
+        db.delete_column(u'timetables_event', 'people')
+
+
+    models = {
+        u'timetables.event': {
+            'Meta': {'object_name': 'Event'},
+            'allday': ('django.db.models.fields.BooleanField', [], {'default': 'False'}),
+            'current': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'end': ('django.db.models.fields.DateTimeField', [], {}),
+            'endtz': ('django.db.models.fields.CharField', [], {'default': "'Europe/London'", 'max_length': '32'}),
+            'event_type': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'location': ('django.db.models.fields.CharField', [], {'max_length': '512', 'blank': 'True'}),
+            'master': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'versions'", 'null': 'True', 'to': u"orm['timetables.Event']"}),
+            'people': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'source': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.EventSource']", 'null': 'True', 'blank': 'True'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {}),
+            'starttz': ('django.db.models.fields.CharField', [], {'default': "'Europe/London'", 'max_length': '32'}),
+            'status': ('django.db.models.fields.PositiveSmallIntegerField', [], {'default': '0'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'uid': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'versionstamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'timetables.eventsource': {
+            'Meta': {'object_name': 'EventSource'},
+            'current': ('django.db.models.fields.BooleanField', [], {'default': 'True'}),
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'date_pattern': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'event_type': ('django.db.models.fields.CharField', [], {'db_index': 'True', 'max_length': '512', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'master': ('django.db.models.fields.related.ForeignKey', [], {'blank': 'True', 'related_name': "'versions'", 'null': 'True', 'to': u"orm['timetables.EventSource']"}),
+            'people': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'sourcefile': ('django.db.models.fields.files.FileField', [], {'max_length': '100', 'blank': 'True'}),
+            'sourcetype': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'sourceurl': ('django.db.models.fields.CharField', [], {'max_length': '2048', 'null': 'True', 'blank': 'True'}),
+            'title': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'versionstamp': ('django.db.models.fields.DateTimeField', [], {'default': 'datetime.datetime.now'})
+        },
+        u'timetables.eventsourcetag': {
+            'Meta': {'object_name': 'EventSourceTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'eventsource': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.EventSource']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.eventtag': {
+            'Meta': {'object_name': 'EventTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            'event': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Event']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thing': {
+            'Meta': {'object_name': 'Thing'},
+            'data': ('django.db.models.fields.TextField', [], {'blank': 'True'}),
+            'direct_events': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'direct_things'", 'symmetrical': 'False', 'through': u"orm['timetables.EventTag']", 'to': u"orm['timetables.Event']"}),
+            'fullname': ('django.db.models.fields.CharField', [], {'max_length': '512'}),
+            'fullpath': ('django.db.models.fields.CharField', [], {'max_length': '2048'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'locked_by': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'locked_things'", 'symmetrical': 'False', 'through': u"orm['timetables.ThingLock']", 'to': u"orm['timetables.Thing']"}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '32'}),
+            'parent': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']", 'null': 'True', 'blank': 'True'}),
+            'pathid': ('django.db.models.fields.CharField', [], {'unique': 'True', 'max_length': '64'}),
+            'sources': ('django.db.models.fields.related.ManyToManyField', [], {'related_name': "'things'", 'symmetrical': 'False', 'through': u"orm['timetables.EventSourceTag']", 'to': u"orm['timetables.EventSource']"}),
+            'type': ('django.db.models.fields.CharField', [], {'default': "''", 'max_length': '12', 'db_index': 'True', 'blank': 'True'})
+        },
+        u'timetables.thingclosure': {
+            'Meta': {'unique_together': "((u'ancestor', u'descendant'),)", 'object_name': 'ThingClosure', 'index_together': "((u'ancestor', u'depth'),)"},
+            'ancestor': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'closure_descendants'", 'to': u"orm['timetables.Thing']"}),
+            'depth': ('django.db.models.fields.PositiveIntegerField', [], {}),
+            'descendant': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'closure_ancestors'", 'to': u"orm['timetables.Thing']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'})
+        },
+        u'timetables.thingeventindex': {
+            'Meta': {'unique_together': "((u'thing', u'event'),)", 'object_name': 'ThingEventIndex', 'index_together': "((u'thing', u'start'),)"},
+            'event': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'thing_index'", 'to': u"orm['timetables.Event']"}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'start': ('django.db.models.fields.DateTimeField', [], {}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'event_index'", 'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thinglock': {
+            'Meta': {'object_name': 'ThingLock', 'index_together': "((u'thing', u'name', u'expires'),)"},
+            'expires': ('django.db.models.fields.DateTimeField', [], {}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'name': ('django.db.models.fields.CharField', [], {'max_length': '32', 'db_index': 'True'}),
+            'owner': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'owned_locks'", 'to': u"orm['timetables.Thing']"}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'locks'", 'to': u"orm['timetables.Thing']"})
+        },
+        u'timetables.thingtag': {
+            'Meta': {'object_name': 'ThingTag'},
+            'annotation': ('django.db.models.fields.CharField', [], {'max_length': '32', 'null': 'True', 'blank': 'True'}),
+            u'id': ('django.db.models.fields.AutoField', [], {'primary_key': 'True'}),
+            'targetthing': ('django.db.models.fields.related.ForeignKey', [], {'related_name': "'relatedthing'", 'to': u"orm['timetables.Thing']"}),
+            'thing': ('django.db.models.fields.related.ForeignKey', [], {'to': u"orm['timetables.Thing']"})
+        }
+    }
+
+    complete_apps = ['timetables']
\ No newline at end of file
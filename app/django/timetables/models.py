@@ -2,12 +2,14 @@
 
 from itertools import chain
 import base64
+import contextlib
 import datetime
 import hashlib
 import logging
 import os
 import pytz
 import re
+import threading
 import time
 import unicodedata
 import uuid
@@ -17,8 +19,8 @@ from django.contrib.auth.models import User
 from django.contrib.sites.models import Site
 from django.core import exceptions
 from django.db import models, connection
-from django.db import transaction
-from django.db.models.signals import pre_save, post_save, pre_delete
+from django.db.models.signals import (pre_save, post_save, pre_delete,
+    post_delete)
 from django.utils import decorators
 from django.utils import simplejson as json
 from django.utils import timezone
@@ -26,6 +28,11 @@ from django.utils.timezone import now
 
 from timeit import itertools
 from timetables import managers
+from timetables.querysets import batched, MAX_BATCH_SIZE
+from timetables.utils.feedcache import feed_cache
+from timetables.utils.subjectcache import subject_cache
+from timetables.utils.thingcache import thing_path_cache
+from timetables.utils import transactions
 
 log = logging.getLogger(__name__)
 
@@ -188,26 +195,19 @@ class HierachicalModel(PreSaveMixin, models.Model):
     def treequery(cls, paths, inclusive=True, max_depth=10):
         '''
         Get the decendents of this Thing, down to a maximum depth.
+
+        The descendants are looked up in the ThingClosure table, so this is a
+        single indexed lookup regardless of max_depth.
         :param inclusive:
         :param max_depth:
         '''
         pathhashes = [ cls.hash(p) for p in paths]
-        q = None
-        if inclusive:
-            q = models.Q(pathid__in=pathhashes)
-        key = "pathid"
-        # Construct an or clause so to find all children though their parents.
-        for _ in range(0,max_depth):
-            key = "parent__%s" % key
-            qterm = "%s__in" % key
-            kwargs = {}
-            kwargs[qterm] = pathhashes
-            if q is None:
-                q = models.Q(**kwargs)
-            else:
-                q = q | models.Q(**kwargs)
-        return q
-    
+        closure = ThingClosure.objects.filter(
+                ancestor__pathid__in=pathhashes,
+                depth__gte=0 if inclusive else 1,
+                depth__lte=max_depth)
+        return models.Q(id__in=closure.values("descendant"))
+
     @classmethod
     def create_path(cls, path, properties, types=None):
         '''
@@ -215,34 +215,91 @@ class HierachicalModel(PreSaveMixin, models.Model):
         :param path: The full path of the cls
         :param properties: The properties of the cls. If fullpath or pathid are set they will be ignored
         '''
-        parent = os.path.dirname(path)
-        parent_obj = None
-        if parent is not None and parent != "." and parent != "" and parent != path:
-            try:
-                parent_obj = cls.objects.get(pathid=cls.hash(parent))
-            except cls.DoesNotExist:
-                if types is None:
-                    parent_obj = cls.create_path(parent, {})
-                else:
-                    parent_obj = cls.create_path(parent, {}, types[:-1])
-
-
-        pathhash = cls.hash(path)
-        try:
-            return cls.objects.get(pathid=pathhash)
-        except cls.DoesNotExist:
-            name = os.path.basename(path)
-            properties.update({
-                        "parent" : parent_obj,
-                        "name" : name[:(MAX_NAME_LENGTH-1)],
-                        "fullpath" : path,
-                        "pathid" : pathhash })
-            if "type" not in properties:
-                if types:
-                    properties['type'] = types[-1]
-                else:
-                    properties['type'] = "undefined"
-            return cls.objects.create(**properties)
+        return cls.ensure_paths([path], types, {path: properties})[path]
+
+    @classmethod
+    def _get_by_pathids(cls, pathids):
+        found = {}
+        for batch in batched(pathids):
+            for instance in cls.objects.filter(pathid__in=batch):
+                found[instance.pathid] = instance
+        return found
+
+    @classmethod
+    def ensure_paths(cls, paths, types=None, properties=None):
+        '''
+        Get the instances at each of paths, creating them and any missing
+        parents as create_path() does.
+
+        All the paths and their parents are looked up at once, then the
+        missing ones are validated and bulk inserted a level at a time, so
+        this takes a few queries per level rather than several per path.
+        Bulk inserts don't send signals, so on_paths_created() is called with
+        the instances created at each level.
+
+        :param paths: The full paths of the instances
+        :param types: The types of each path's instance and its parents, as
+            for create_path()
+        :param properties: A dict of path to the properties of the instance
+            at that path, used if it has to be created
+        :return: A dict of path to instance for all of paths and their parents
+        '''
+        properties = properties or {}
+
+        # The type of each path and its parents, by depth
+        levels = {}
+        for path in paths:
+            depth = path.count("/")
+            for i in range(depth + 1):
+                level = levels.setdefault(depth - i, {})
+                if path not in level:
+                    level[path] = types[-1 - i] if types and i < len(types) else "undefined"
+                path = os.path.dirname(path)
+
+        existing = cls._get_by_pathids(
+            cls.hash(path) for level in levels.values() for path in level)
+
+        instances = {}
+        for depth in sorted(levels):
+            created = []
+            for path, path_type in levels[depth].items():
+                pathid = cls.hash(path)
+                if pathid in existing:
+                    instances[path] = existing[pathid]
+                    continue
+
+                props = dict(properties.get(path, {}))
+                props.setdefault("type", path_type)
+                props.update({
+                            "parent" : instances.get(os.path.dirname(path)),
+                            "name" : os.path.basename(path)[:(MAX_NAME_LENGTH-1)],
+                            "fullpath" : path })
+                instance = cls(**props)
+                # Run the pre save hooks without validating (as if loading a
+                # fixture), then validate without the queries checking
+                # uniqueness and that the parent exists.
+                instance.on_pre_save(raw=True)
+                instance.full_clean(exclude=["parent"], validate_unique=False)
+                created.append((path, instance))
+
+            if not created:
+                continue
+            cls.objects.bulk_create([instance for _, instance in created])
+            # bulk_create() doesn't set the ids of the new instances
+            saved = cls._get_by_pathids(instance.pathid for _, instance in created)
+            for path, instance in created:
+                instances[path] = saved[instance.pathid]
+            cls.on_paths_created([saved[instance.pathid] for _, instance in created])
+
+        return instances
+
+    @classmethod
+    def on_paths_created(cls, instances):
+        '''
+        Called by ensure_paths() with the instances created at each level of
+        the hierarchy, after those of the levels above.
+        '''
+        pass
 
     def update_fullpath(self, parent=None):
         parent = parent or self.parent
@@ -263,13 +320,50 @@ class HierachicalModel(PreSaveMixin, models.Model):
         return self.fullpath
 
 
+# The separator of the values of list metadata mirrored in a column (see
+# SchemalessModel.METADATA_COLUMNS)
+METADATA_LIST_SEPARATOR = "\n"
+
+
+def join_metadata_list(values):
+    """
+    Get the column value of a list of strings from the metadata.
+    """
+    if isinstance(values, basestring):
+        return values
+    return METADATA_LIST_SEPARATOR.join(values or [])
+
+
+def split_metadata_list(value):
+    """
+    Get the list of strings stored in a column by join_metadata_list().
+    """
+    if not value:
+        return []
+    return value.split(METADATA_LIST_SEPARATOR)
+
+
+def metadata_text(value):
+    return value or ""
+
+
 class SchemalessModel(models.Model):
     class Meta:
         abstract=True
     # A block of objects, all the meta data associated with this thing.
     # This avoids forcing all objects to have the same schema.
     data = models.TextField(blank=True, help_text="Additional data in json format")
-     
+
+    # The metadata keys which are mirrored in columns, as (key, field name,
+    # function converting the key's value to the column's) tuples. The columns
+    # are updated from the metadata whenever the model is saved, so the keys
+    # can be filtered on and read without decoding data. Code writing data
+    # without saving (e.g. bulk_create()) must call update_metadata_columns().
+    METADATA_COLUMNS = ()
+
+    # The number of rows read by each query of backfill_metadata_columns()
+    BACKFILL_BATCH_SIZE = 500
+
     
     @property
     def metadata(self):
@@ -297,7 +391,57 @@ class SchemalessModel(models.Model):
         Override this if there are fields that need to be updated from the metadata
         '''
         pass
-        
+
+    def update_metadata_columns(self):
+        """
+        Set the columns listed in METADATA_COLUMNS from the metadata.
+        """
+        if not self.METADATA_COLUMNS:
+            return
+        metadata = self.metadata
+        for key, field, convert in self.METADATA_COLUMNS:
+            setattr(self, field, convert(metadata.get(key)))
+
+    @classmethod
+    def backfill_metadata_columns(cls, batch_size=BACKFILL_BATCH_SIZE):
+        """
+        Set the METADATA_COLUMNS of the existing rows from their data, e.g.
+        after adding a column. Rows are read batch_size at a time, and only
+        those whose columns change are written, with an UPDATE for each
+        distinct set of column values in a batch.
+
+        Returns: A tuple of the number of rows updated, and a list of the ids
+            of rows whose data isn't valid JSON (which are left alone).
+        """
+        fields = [field for _, field, _ in cls.METADATA_COLUMNS]
+        updated = 0
+        invalid = []
+        last_id = 0
+        while fields:
+            rows = list(cls.objects.filter(id__gt=last_id).order_by("id")
+                        .values_list("id", "data", *fields)[:batch_size])
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            changes = {}
+            for row in rows:
+                try:
+                    metadata = json.loads(row[1]) if row[1] else {}
+                except ValueError:
+                    invalid.append(row[0])
+                    continue
+                columns = tuple(convert(metadata.get(key))
+                                for key, _, convert in cls.METADATA_COLUMNS)
+                if columns != tuple(row[2:]):
+                    changes.setdefault(columns, []).append(row[0])
+
+            with transactions.commit_on_success():
+                for columns, ids in changes.items():
+                    updated += cls.objects.filter(id__in=ids).update(
+                        **dict(zip(fields, columns)))
+        return updated, invalid
+
     def on_pre_save(self, **kwargs):
         """
         Called before save and makes certain data contains a json version of _data
@@ -309,6 +453,7 @@ class SchemalessModel(models.Model):
             self.data = json.dumps(self._data)
         elif self.data is None: # Only set to nothing if None, metadata might not have been touched.
             self.data = ""
+        self.update_metadata_columns()
 
     def copycreate(self, instance):
         self.metadata = instance.metadata
@@ -373,6 +518,9 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
         self._initial_parent_id = self.parent_id
         self._initial_name = self.name
         self._initial_fullpath = self.fullpath
+        # and those the subjects catalogue depends on
+        self._initial_fullname = self.fullname
+        self._initial_type = self.type
 
     def get_events(self, depth=1, date_range=None):
         events = Event.objects.filter(
@@ -381,31 +529,46 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
         )
 
         if depth == 1:
-            events = events.filter(source__eventsourcetag__thing=self)
+            index_filter = {"thing_index__thing": self}
         elif depth == 2:
-            events = events.filter(source__eventsourcetag__thing__parent=self)
+            index_filter = {"thing_index__thing__parent": self}
         else:
             raise NotImplementedError("Depth not supported: {}".format(depth))
 
         if date_range != None:
             start = date_range[0]
             end = date_range[1]
-            # Filter just on start rather than start and end so that we
-            # can use a single index to satisfy the query.
-            events = events.filter(start__gte=start, start__lte=end)
+            # Filter on the start denormalised into the index so that the
+            # (thing, start) index can satisfy the query. This must be in the
+            # same filter() call as the thing so that only one join is made.
+            index_filter.update(thing_index__start__gte=start,
+                                thing_index__start__lte=end)
 
-        return events
+        return events.filter(**index_filter)
 
     @classmethod
     def get_all_events(cls, things):
-        return Event.objects.filter(models.Q(source__eventsourcetag__thing__in=things, source__current=True)|
-                                    models.Q(eventtag__thing__in=things), current=True)
+        # ThingEventIndex holds the Events linked via both EventSourceTags and
+        # EventTags, so there's no need for an OR across the two tag tables.
+        return Event.objects.filter(thing_index__thing__in=things,
+                                    current=True).distinct()
+
+    @classmethod
+    def get_by_path(cls, fullpath):
+        """
+        Look up a Thing by its fullpath, using the cache of Things in
+        timetables.utils.thingcache. The result may be a few seconds out of
+        date, so use Thing.objects.get() for a Thing which will be saved.
+
+        Raises: Thing.DoesNotExist if there's no Thing at fullpath.
+        """
+        return thing_path_cache.get(fullpath)
 
     @classmethod
     def get_or_create_user_thing(cls, user ):
         path = "user/%s" % user.username
         try:
-            return cls.objects.get(pathid=cls.hash(user.username))
+            return cls.get_by_path(path)
         except Thing.DoesNotExist:
             return cls.create_path(path, {
                     "type" : "user",
@@ -440,8 +603,21 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
 
         super(Thing, self).on_pre_save(**kwargs)
 
-    def on_post_save(self, raw=None, **kwargs):
-        super(Thing, self).on_post_save(raw=raw, **kwargs)
+    def on_post_save(self, raw=None, created=False, **kwargs):
+        super(Thing, self).on_post_save(raw=raw, created=created, **kwargs)
+        # The closure is maintained even when importing data as treequery()
+        # depends on it.
+        if raw or created or self.parent_id != self._initial_parent_id:
+            ThingClosure.move_subtree(self)
+
+        if self._subjects_changed(created):
+            subject_cache.invalidate()
+
+        pathids = [self.pathid]
+        if self._initial_fullpath and self._initial_fullpath != self.fullpath:
+            pathids.append(self.hash(self._initial_fullpath))
+        thing_path_cache.invalidate(pathids)
+
         # Don't mess with the db when importing data.
         if raw:
             return
@@ -449,9 +625,42 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
         # If our fullpath has changed we need to update the fullpaths
         # of all our descendents.
         if self.fullpath != self._initial_fullpath:
-            # This acts recursively to update all descendents
             self.update_child_paths()
 
+    @staticmethod
+    def is_subject_type(thing_type):
+        """
+        Returns: True if Things of type thing_type appear in the subjects
+            catalogue (see Subjects).
+        """
+        return (thing_type in ("tripos", "part") or
+                thing_type in NestedSubject.NESTED_SUBJECT_TYPES)
+
+    @classmethod
+    def on_paths_created(cls, things):
+        """
+        Do for the Things created in bulk by ensure_paths() what on_post_save
+        does for each Thing saved.
+        """
+        super(Thing, cls).on_paths_created(things)
+        ThingClosure.add_leaves([thing.id for thing in things])
+
+        if any(cls.is_subject_type(thing.type) for thing in things):
+            subject_cache.invalidate()
+        thing_path_cache.invalidate([thing.pathid for thing in things])
+
+    def _subjects_changed(self, created):
+        if not (self.is_subject_type(self.type) or
+                self.is_subject_type(self._initial_type)):
+            return False
+        return (
+            created or
+            self.name != self._initial_name or
+            self.fullname != self._initial_fullname or
+            self.type != self._initial_type or
+            self.parent_id != self._initial_parent_id
+        )
+
     def on_pre_delete(self, **kwargs):
         """
         Check whether the Thing is a module, if so delete its child series
@@ -465,16 +674,61 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
                 eventsourcetag__thing=self,
                 eventsourcetag__annotation="home").delete()
 
+    # The number of Things updated by each UPDATE in update_child_paths().
+    # Each row uses 5 parameters, keeping us under SQLite's limit of 999.
+    CHILD_PATH_BATCH_SIZE = 100
+
     def update_child_paths(self):
         """
         Update the fullpaths of this Thing to reflect it's current fullpath.
-        This acts recursively on all descendent Things.
+        This acts on all descendent Things, which are updated with a few bulk
+        UPDATEs rather than being saved individually.
+
+        Returns: The number of descendants updated.
         """
-        for thing in self.thing_set.all():
-            thing.update_fullpath(parent=self)
-            # Recursivley trigger update_child_paths() via _post_save()
-            # on all children.
-            thing.save()
+        # Ordering by depth ensures parents are seen before their children
+        descendants = (Thing.objects
+            .filter(closure_ancestors__ancestor=self,
+                    closure_ancestors__depth__gt=0)
+            .order_by("closure_ancestors__depth")
+            .values_list("id", "parent_id", "name", "type", "pathid"))
+
+        fullpaths = {self.id: self.fullpath}
+        updates = []
+        old_pathids = []
+        subjects_changed = False
+        for thing_id, parent_id, name, thing_type, old_pathid in descendants:
+            fullpath = "{}/{}".format(fullpaths[parent_id], name)
+            fullpaths[thing_id] = fullpath
+            updates.append((thing_id, fullpath, self.hash(fullpath)))
+            old_pathids.append(old_pathid)
+            subjects_changed = (subjects_changed or
+                                self.is_subject_type(thing_type))
+
+        cursor = connection.cursor()
+        for batch in batched(updates, self.CHILD_PATH_BATCH_SIZE):
+            cases = " ".join(["WHEN %s THEN %s"] * len(batch))
+            params = list(chain.from_iterable(
+                (thing_id, fullpath) for thing_id, fullpath, _ in batch))
+            params.extend(chain.from_iterable(
+                (thing_id, pathid) for thing_id, _, pathid in batch))
+            params.extend(thing_id for thing_id, _, _ in batch)
+            cursor.execute(
+                "UPDATE {0} SET fullpath = CASE id {1} END,"
+                " pathid = CASE id {1} END WHERE id IN ({2})".format(
+                    self._meta.db_table, cases,
+                    ", ".join(["%s"] * len(batch))),
+                params)
+
+        # The UPDATEs bypass Thing's signals, so the Thing path cache and the
+        # subjects catalogue have to be invalidated here.
+        thing_path_cache.invalidate(old_pathids)
+        if subjects_changed:
+            subject_cache.invalidate()
+
+        log.debug("Updated the fullpath of %d descendants of %s",
+                  len(updates), self.fullpath)
+        return len(updates)
 
     def get_unique_child_name(self, base_name, max_len=MAX_NAME_LENGTH):
         """
@@ -508,9 +762,127 @@ class Thing(CleanModelMixin, PostSaveMixin, PreDeleteMixin, SchemalessModel, Hie
     def is_disabled(self):
         return Thing.objects.filter(pk=self.pk).is_disabled().exists()
 
+
+def invalidate_deleted_subject(sender, instance=None, **kwargs):
+    """
+    Signal handler invalidating the subjects catalogue when a tripos, part or
+    subject Thing is deleted.
+    """
+    if Thing.is_subject_type(instance.type):
+        subject_cache.invalidate()
+
+def invalidate_deleted_thing_path(sender, instance=None, **kwargs):
+    """
+    Signal handler removing a deleted Thing from the Thing path cache.
+    """
+    thing_path_cache.invalidate([instance.pathid])
+
 pre_save.connect(Thing.handle_pre_save_signal, sender=Thing)
 post_save.connect(Thing.handle_post_save_signal, sender=Thing)
 pre_delete.connect(Thing.handle_pre_delete_signal, sender=Thing)
+post_delete.connect(invalidate_deleted_subject, sender=Thing)
+post_delete.connect(invalidate_deleted_thing_path, sender=Thing)
+
+
+class ThingClosure(models.Model):
+    """
+    The closure of the Thing hierarchy: one row for every (ancestor,
+    descendant) pair, including each Thing paired with itself at depth 0.
+
+    This allows the descendants of a Thing to be found with a single indexed
+    lookup rather than following parent links one level at a time. Thing's
+    on_post_save keeps it up to date when Things are created or moved; renames
+    don't affect it. The rebuild_thing_closure management command recreates
+    it from scratch.
+    """
+
+    ancestor = models.ForeignKey(Thing, related_name="closure_descendants")
+    descendant = models.ForeignKey(Thing, related_name="closure_ancestors")
+    # The number of levels between ancestor and descendant
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = (("ancestor", "descendant"),)
+        index_together = (("ancestor", "depth"),)
+
+    @classmethod
+    def move_subtree(cls, thing):
+        """
+        (Re)link the subtree rooted at thing beneath its current parent. This
+        handles both newly created Things (whose subtree is just themselves)
+        and Things whose parent has changed.
+        """
+        if not cls.objects.filter(ancestor=thing, descendant=thing).exists():
+            cls.objects.create(ancestor=thing, descendant=thing, depth=0)
+
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        # Unlink the subtree from its old ancestors
+        cursor.execute(
+            "DELETE FROM {0}"
+            " WHERE descendant_id IN"
+            " (SELECT descendant_id FROM {0} WHERE ancestor_id = %s)"
+            " AND ancestor_id NOT IN"
+            " (SELECT descendant_id FROM {0} WHERE ancestor_id = %s)"
+            .format(table),
+            [thing.id, thing.id])
+
+        if thing.parent_id is None:
+            return
+        # Link every node in the subtree to every ancestor of the new parent
+        cursor.execute(
+            "INSERT INTO {0} (ancestor_id, descendant_id, depth)"
+            " SELECT p.ancestor_id, s.descendant_id, p.depth + s.depth + 1"
+            " FROM {0} p, {0} s"
+            " WHERE p.descendant_id = %s AND s.ancestor_id = %s"
+            .format(table),
+            [thing.parent_id, thing.id])
+
+    @classmethod
+    def add_leaves(cls, thing_ids):
+        """
+        Link newly created Things, which have no children, beneath their
+        parents, which must already be linked. This is what move_subtree()
+        does for each new Thing, but with two INSERTs for many Things.
+        """
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        for batch in batched(thing_ids):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                "INSERT INTO {0} (ancestor_id, descendant_id, depth)"
+                " SELECT id, id, 0 FROM {1} WHERE id IN ({2})"
+                .format(table, Thing._meta.db_table, placeholders),
+                batch)
+            cursor.execute(
+                "INSERT INTO {0} (ancestor_id, descendant_id, depth)"
+                " SELECT c.ancestor_id, t.id, c.depth + 1"
+                " FROM {0} c INNER JOIN {1} t ON t.parent_id = c.descendant_id"
+                " WHERE t.id IN ({2})"
+                .format(table, Thing._meta.db_table, placeholders),
+                batch)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recreate the entire closure, one level of the hierarchy at a time.
+        """
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM {0}".format(table))
+        cursor.execute(
+            "INSERT INTO {0} (ancestor_id, descendant_id, depth)"
+            " SELECT id, id, 0 FROM {1}".format(table, Thing._meta.db_table))
+
+        depth = 0
+        while cursor.rowcount > 0:
+            cursor.execute(
+                "INSERT INTO {0} (ancestor_id, descendant_id, depth)"
+                " SELECT c.ancestor_id, t.id, c.depth + 1"
+                " FROM {0} c INNER JOIN {1} t ON t.parent_id = c.descendant_id"
+                " WHERE c.depth = %s".format(table, Thing._meta.db_table),
+                [depth])
+            depth += 1
 
 
 def clean_string(txt):
@@ -573,6 +945,49 @@ def sorted_naturally(items, key=lambda x: x):
     return sorted(items, key=get_natural_key(key))
 
 
+def invalidate_disabled_subjects(sender, instance=None, **kwargs):
+    """
+    Signal handler invalidating the subjects catalogue when a Thing is
+    disabled or re-enabled (see ThingQuerySet.is_disabled()).
+    """
+    if instance.annotation == Thing.objects.querySet.disabled_annotation:
+        subject_cache.invalidate()
+
+def invalidate_event_feeds(sender, **kwargs):
+    """
+    Signal handler invalidating all cached feeds when an Event or EventSource
+    is saved or deleted.
+    """
+    feed_cache.invalidate_events()
+
+def invalidate_tagged_thing_feeds(sender, instance=None, **kwargs):
+    """
+    Signal handler invalidating the cached feeds of the Thing an EventTag or
+    EventSourceTag points at when the tag is saved or deleted.
+
+    Tags are deleted in bulk by ThingLinker with SQL which doesn't send
+    signals, so it invalidates the feeds itself.
+    """
+    feed_cache.invalidate_things([instance.thing_id])
+
+def index_tagged_thing(sender, instance=None, **kwargs):
+    """
+    Signal handler updating the ThingEventIndex of the Thing an EventTag or
+    EventSourceTag points at. As with invalidate_tagged_thing_feeds, bulk tag
+    changes must update the index themselves.
+    """
+    ThingEventIndex.index_things([instance.thing_id])
+
+def unindex_untagged_thing(sender, instance=None, **kwargs):
+    """
+    Signal handler removing the ThingEventIndex rows of the Thing a deleted
+    EventTag or EventSourceTag pointed at which are no longer linked.
+
+    Unlike index_tagged_thing this never inserts rows, as the Thing itself
+    may be being deleted along with its tags.
+    """
+    ThingEventIndex.unindex_things([instance.thing_id])
+
 def _get_upload_path(instance, filename):
     
     tpart = time.strftime('%Y/%m/%d',time.gmtime())
@@ -606,8 +1021,16 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
     # All rows point to a master, the master points to itself
     master = models.ForeignKey("EventSource", related_name="versions", null=True, blank=True)
 
-    # Flag to allow set_metadata to be enabled/disabled for efficiency reasons
-    set_metadata_is_enabled = True
+    # Copies of the metadata keys read for every series listed
+    date_pattern = models.TextField(blank=True, editable=False, help_text="The datePattern of the metadata")
+    event_type = models.CharField(max_length=MAX_LONG_NAME, blank=True, db_index=True, editable=False, help_text="The type of the metadata")
+    people = models.TextField(blank=True, editable=False, help_text="The people of the metadata, one per line")
+
+    METADATA_COLUMNS = (
+        ("datePattern", "date_pattern", metadata_text),
+        ("type", "event_type", metadata_text),
+        ("people", "people", join_metadata_list)
+    )
 
     def __init__(self,*args,**kwargs):
         instance = None
@@ -633,6 +1056,9 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
         VersionableModel.makecurrent(self)
         Event.objects.filter(source__master=self.master).update(source=self)
         EventSourceTag.objects.filter(eventsource__master=self.master).update(eventsource=self)
+        # update() bypasses the post_save signal
+        ThingEventIndex.index_sources([self.id])
+        feed_cache.invalidate_events()
 
     def can_be_edited_by(self, username):
         """
@@ -650,22 +1076,11 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
         events = Event.objects.filter(source_id = self).just_active().order_by(order_by)
         return events
 
-    def is_set_metadata_enabled(self):
-        return self.set_metadata_is_enabled
-
-    def enable_set_metadata(self):
-        self.set_metadata_is_enabled = True
-
-    def disable_set_metadata(self):
-        self.set_metadata_is_enabled = False
-
     def set_metadata(self, **kwargs):
         """
         Convenience method to allow saving of compute_metadata
         results to be optional - this facilitates non-destructive testing.
         """
-        if not self.set_metadata_is_enabled:
-            return
         self.metadata.update(self.compute_metadata())
         if "save" in kwargs:
             if kwargs["save"] == True:
@@ -681,8 +1096,9 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
         Series takes data as follows (type is optional):
             - {"datePattern": "Mi1 W 11", "type": "lecture", "location": "Faculty of English: S-R24", "people": ["Head of Department and others"]}
         """
-        events = self.get_active_events(order_by="start")
-        
+        # Evaluate the events once rather than in each compute_ method
+        events = list(self.get_active_events(order_by="start"))
+
         # construct metadata
         data = {
             "datePattern": self.compute_datepattern_metadata(events=events),
@@ -707,9 +1123,16 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
         # FullPattern object to store complete date pattern for this series of events
         from timetables.utils.v1.patternatom import PatternAtom # import PatternAtom here or we get clash with "Event" name ...
         from timetables.utils.v1 import FullPattern # and again
+        from timetables.utils import datetimes
         fp = FullPattern()
 
-        for event in events:
+        # Work out the term dates of all the events in one go rather than
+        # calling event.relative_term_date() for each event.
+        events = list(events)
+        termweeks = datetimes.dates_to_termweeks(
+                event.start.date() for event in events)
+
+        for event, rtd in zip(events, termweeks):
             # PatternAtom object to construct date pattern for event
             pa = PatternAtom(False)
             
@@ -717,7 +1140,6 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
             end = event.end_local()
         
             # add event term / week
-            rtd = event.relative_term_date()
             pa.addTermWeek(terms[rtd[1]], rtd[2])
         
             # add event start / finish to PatternAtom object
@@ -760,18 +1182,66 @@ class EventSource(CleanModelMixin, SchemalessModel, VersionableModel):
         events = events if events is not None else self.get_active_events(order_by="start")
 
         people = []
+        seen = set()
 
         for event in events:
-            # get people - construct list of unique individuals
-            data = json.loads(event.data)
-            peeps = data["people"]
-            for peep in peeps:
-                if peep not in people:
+            # get people - construct list of unique individuals, in the order
+            # they're first seen
+            for peep in split_metadata_list(event.people):
+                if peep not in seen:
+                    seen.add(peep)
                     people.append(peep)
- 
+
         return people
 
+    def update_metadata(self):
+        """
+        Recompute and save our metadata following a change to our events. If
+        this happens inside deferred_metadata() we're just marked as needing
+        an update, which happens once when the block exits.
+        """
+        dirty = getattr(_deferred_metadata, "dirty", None)
+        if dirty is not None:
+            dirty.add(self.id)
+        else:
+            self.set_metadata(save=True)
+
+
+# Per thread state of deferred_metadata()
+_deferred_metadata = threading.local()
+
+
+@contextlib.contextmanager
+def deferred_metadata():
+    """
+    Defer the EventSource metadata updates triggered by saving Events until
+    the block exits, at which point each affected EventSource is recomputed
+    and saved once, rather than once for each Event saved.
+
+    Blocks may be nested, in which case updates happen as the outermost block
+    exits. Wrap this around a transaction so that the metadata is computed
+    from the committed events. If the block raises an exception the pending
+    updates are discarded.
+    """
+    depth = getattr(_deferred_metadata, "depth", 0)
+    if depth == 0:
+        _deferred_metadata.dirty = set()
+    _deferred_metadata.depth = depth + 1
+    try:
+        yield
+    finally:
+        _deferred_metadata.depth = depth
+        if depth == 0:
+            dirty = _deferred_metadata.dirty
+            del _deferred_metadata.dirty
+
+    if depth == 0:
+        for source in EventSource.objects.filter(id__in=dirty):
+            source.set_metadata(save=True)
+
 pre_save.connect(EventSource.handle_pre_save_signal, sender=EventSource)
+post_save.connect(invalidate_event_feeds, sender=EventSource)
+post_delete.connect(invalidate_event_feeds, sender=EventSource)
 
 
 class Event(CleanModelMixin, PostSaveMixin, SchemalessModel, VersionableModel):
@@ -833,7 +1303,21 @@ class Event(CleanModelMixin, PostSaveMixin, SchemalessModel, VersionableModel):
     # source is where the source comes from and contain the default tag.
     # this is dont to reduce the size of teh EventTag tables.
     source = models.ForeignKey(EventSource, verbose_name="Source of Events", help_text="The Event source that created this event",  blank=True, null=True)
-    
+    # Set by every save and by the importer's bulk updates, unlike
+    # versionstamp which is only set when the Event is created
+    lastmodified = models.DateTimeField(auto_now=True, db_index=True, help_text="When the Event was last changed")
+
+    # Copies of the metadata keys read for every event in a feed
+    allday = models.BooleanField(default=False, editable=False, help_text="The x-allday of the metadata")
+    event_type = models.CharField(max_length=MAX_LONG_NAME, blank=True, db_index=True, editable=False, help_text="The type of the metadata")
+    people = models.TextField(blank=True, editable=False, help_text="The people of the metadata, one per line")
+
+    METADATA_COLUMNS = (
+        ("x-allday", "allday", bool),
+        ("type", "event_type", metadata_text),
+        ("people", "people", join_metadata_list)
+    )
+
     
     def __init__(self,*args,**kwargs):
         instance = None
@@ -910,17 +1394,35 @@ class Event(CleanModelMixin, PostSaveMixin, SchemalessModel, VersionableModel):
         If the metadata being loaded wasn't already correct, it can be
         fixed by running manage.py recompute_eventsource_metadata.
         '''
-        if not raw:
-            self.source.set_metadata(save=True)
+        if not raw and self.source_id is not None:
+            self.source.update_metadata()
+
+        # The index is maintained even when importing data, otherwise Things
+        # loaded from fixtures would have empty timetables.
+        ThingEventIndex.index_events([self.id])
 
     @classmethod
-    def after_bulk_operation(cls):
+    def after_bulk_operation(cls, source_ids=None):
+        """
+        Do what saving would have done for Events created with bulk_create().
+
+        Args:
+            source_ids: The ids of the EventSources of the created Events,
+                which are indexed for the Things linked to them.
+        """
         # bulk creates bypass everything, so we have make certain the master value is set.
-        cls.objects.raw("update timetables_event set master = id where master is null")
+        cls.objects.filter(master__isnull=True).update(master=models.F("id"))
+        if source_ids:
+            ThingEventIndex.index_sources(source_ids)
+        feed_cache.invalidate_events()
 
     def makecurrent(self):
         VersionableModel.makecurrent(self)
         EventTag.objects.filter(event__master=self.master).update(event=self)
+        # update() bypasses the post_save signal
+        ThingEventIndex.index_events(
+            Event.objects.filter(master=self.master).values_list("id", flat=True))
+        feed_cache.invalidate_events()
 
     def start_local(self, tz=None):
         """
@@ -983,6 +1485,8 @@ class Event(CleanModelMixin, PostSaveMixin, SchemalessModel, VersionableModel):
 
 pre_save.connect(Event.handle_pre_save_signal, sender=Event)
 post_save.connect(Event.handle_post_save_signal, sender=Event)
+post_save.connect(invalidate_event_feeds, sender=Event)
+post_delete.connect(invalidate_event_feeds, sender=Event)
     
     
     
@@ -996,6 +1500,10 @@ class EventSourceTag(CleanModelMixin, PreSaveMixin, AnnotationModel):
 
 
 pre_save.connect(EventSourceTag.handle_pre_save_signal, sender=EventSourceTag)
+post_save.connect(invalidate_tagged_thing_feeds, sender=EventSourceTag)
+post_save.connect(index_tagged_thing, sender=EventSourceTag)
+post_delete.connect(invalidate_tagged_thing_feeds, sender=EventSourceTag)
+post_delete.connect(unindex_untagged_thing, sender=EventSourceTag)
 
 
 class EventTag(CleanModelMixin, PreSaveMixin, AnnotationModel):
@@ -1008,6 +1516,265 @@ class EventTag(CleanModelMixin, PreSaveMixin, AnnotationModel):
 
 
 pre_save.connect(EventTag.handle_pre_save_signal, sender=EventTag)
+post_save.connect(invalidate_tagged_thing_feeds, sender=EventTag)
+post_save.connect(index_tagged_thing, sender=EventTag)
+post_delete.connect(invalidate_tagged_thing_feeds, sender=EventTag)
+post_delete.connect(unindex_untagged_thing, sender=EventTag)
+
+
+class ThingEventIndex(models.Model):
+    """
+    A denormalised index of the Events linked to each Thing, either via an
+    EventSourceTag or directly via an EventTag.
+
+    Querying a Thing's events through the two tag tables requires an OR across
+    two joins which the database can't satisfy from an index. This table holds
+    one row per (thing, event) pair along with the event's start, so a user's
+    timetable for a date range is a single index range scan.
+
+    Rows are kept in sync by the index_*() methods below, which are called
+    when Events and tags are saved or deleted and after the bulk operations
+    which bypass signals (makecurrent() and LinkThing). The
+    rebuild_event_index management command recreates the whole index from
+    scratch.
+    """
+
+    thing = models.ForeignKey(Thing, related_name="event_index")
+    event = models.ForeignKey(Event, related_name="thing_index")
+    # Copied from Event.start, don't modify directly.
+    start = models.DateTimeField()
+
+    class Meta:
+        unique_together = (("thing", "event"),)
+        index_together = (("thing", "start"),)
+
+    # Selects (thing_id, event_id, start) for every linked pair. The two
+    # {where} placeholders are filled with conditions on the tag table (est or
+    # et) and/or the event table (e).
+    SELECT_SQL = (
+        "SELECT est.thing_id, e.id, e.start"
+        " FROM timetables_eventsourcetag est"
+        " INNER JOIN timetables_event e ON e.source_id = est.eventsource_id"
+        " WHERE {est_where}"
+        " UNION"
+        " SELECT et.thing_id, e.id, e.start"
+        " FROM timetables_eventtag et"
+        " INNER JOIN timetables_event e ON e.id = et.event_id"
+        " WHERE {et_where}")
+
+    # The INSERT binds each id twice, once for each half of SELECT_SQL, so
+    # batches are half the usual size to stay within the database's limit on
+    # query parameters.
+    BATCH_SIZE = MAX_BATCH_SIZE // 2
+
+    @classmethod
+    def _reindex(cls, delete_where, est_where, et_where, ids):
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        # Each index row belongs to exactly one of the ids, so the batches
+        # can be deleted and re-inserted independently.
+        for batch in batched(ids, cls.BATCH_SIZE):
+            placeholders = ", ".join(["%s"] * len(batch))
+            cursor.execute(
+                "DELETE FROM {0} WHERE {1}".format(
+                    table, delete_where.format(ids=placeholders)),
+                batch)
+            cursor.execute(
+                "INSERT INTO {0} (thing_id, event_id, start) ".format(table) +
+                cls.SELECT_SQL.format(
+                    est_where=est_where.format(ids=placeholders),
+                    et_where=et_where.format(ids=placeholders)),
+                batch + batch)
+
+    @classmethod
+    def index_things(cls, thing_ids):
+        """
+        Re-index the events linked to the Things with the specified ids.
+        """
+        cls._reindex("thing_id IN ({ids})", "est.thing_id IN ({ids})",
+                     "et.thing_id IN ({ids})", thing_ids)
+
+    @classmethod
+    def unindex_things(cls, thing_ids):
+        """
+        Remove the rows of the Things with the specified ids for Events which
+        are no longer linked to them.
+        """
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        for batch in batched(thing_ids, cls.BATCH_SIZE):
+            cursor.execute(
+                "DELETE FROM {0} WHERE thing_id IN ({1})"
+                " AND NOT EXISTS (SELECT 1 FROM timetables_eventsourcetag est"
+                " INNER JOIN timetables_event e"
+                " ON e.source_id = est.eventsource_id"
+                " WHERE est.thing_id = {0}.thing_id AND e.id = {0}.event_id)"
+                " AND NOT EXISTS (SELECT 1 FROM timetables_eventtag et"
+                " WHERE et.thing_id = {0}.thing_id"
+                " AND et.event_id = {0}.event_id)"
+                .format(table, ", ".join(["%s"] * len(batch))),
+                batch)
+
+    @classmethod
+    def index_events(cls, event_ids):
+        """
+        Re-index the Things linked to the Events with the specified ids.
+        """
+        cls._reindex("event_id IN ({ids})", "e.id IN ({ids})",
+                     "e.id IN ({ids})", event_ids)
+
+    @classmethod
+    def index_sources(cls, source_ids):
+        """
+        Re-index the Things linked to the Events of the EventSources with the
+        specified ids.
+        """
+        cls._reindex(
+            "event_id IN (SELECT id FROM timetables_event"
+            " WHERE source_id IN ({ids}))",
+            "e.source_id IN ({ids})", "e.source_id IN ({ids})", source_ids)
+
+    @classmethod
+    def rebuild(cls):
+        """
+        Recreate the entire index.
+        """
+        table = cls._meta.db_table
+        cursor = connection.cursor()
+        cursor.execute("DELETE FROM {0}".format(table))
+        cursor.execute(
+            "INSERT INTO {0} (thing_id, event_id, start) ".format(table) +
+            cls.SELECT_SQL.format(est_where="1 = 1", et_where="1 = 1"))
+
+
+class ThingLinker(object):
+    """
+    Links a Thing (e.g. a user's calendar) to Events and EventSources, or to
+    the Events and EventSources linked to whole subtrees of Things, and
+    unlinks them again.
+
+    Links are worked out and changed with INSERT ... SELECT and DELETE
+    statements rather than by loading the Events into Python, so linking a
+    whole part is quick. Only current Events and EventSources are linked, and
+    links to non-current ones in the set being linked are removed.
+
+    The tags are changed without sending signals, so finish() must be called
+    once all changes are made to update the Thing's event index and feeds.
+    """
+
+    # The maximum number of ids or paths used in each statement
+    BATCH_SIZE = 500
+
+    # The depth to which descendants of linked Things are found, as with
+    # Thing.treequery().
+    MAX_DEPTH = 10
+
+    DESCENDANTS_SQL = (
+        "SELECT c.descendant_id FROM timetables_thingclosure c"
+        " INNER JOIN timetables_thing a ON a.id = c.ancestor_id"
+        " WHERE a.pathid IN ({paths}) AND c.depth <= %s")
+
+    SUBTREE_EVENTS_SQL = (
+        "SELECT st.event_id FROM timetables_eventtag st"
+        " WHERE st.thing_id IN (" + DESCENDANTS_SQL + ")")
+
+    SUBTREE_SOURCES_SQL = (
+        "SELECT st.eventsource_id FROM timetables_eventsourcetag st"
+        " WHERE st.thing_id IN (" + DESCENDANTS_SQL + ")")
+
+    # The tables linked to by each tag table, and the tag's column
+    EVENTS = ("timetables_eventtag", "event_id", "timetables_event")
+    SOURCES = ("timetables_eventsourcetag", "eventsource_id",
+               "timetables_eventsource")
+
+    def __init__(self, thing):
+        self.thing = thing
+        self.changed = 0
+
+    def _execute(self, sql, params):
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        self.changed += cursor.rowcount
+        return cursor.rowcount
+
+    def _unlink(self, tags, selection, params):
+        tag_table, column, _ = tags
+        return self._execute(
+            "DELETE FROM {0} WHERE thing_id = %s AND {1} IN ({2})".format(
+                tag_table, column, selection),
+            [self.thing.id] + params)
+
+    def _link(self, tags, selection, params):
+        tag_table, column, target_table = tags
+        # Remove links to targets which are no longer current...
+        changed = self._execute(
+            "DELETE FROM {0} WHERE thing_id = %s AND {1} IN ({2})"
+            " AND {1} IN (SELECT id FROM {3} WHERE current = %s)".format(
+                tag_table, column, selection, target_table),
+            [self.thing.id] + params + [False])
+        # ...and add those which don't exist yet.
+        changed += self._execute(
+            "INSERT INTO {0} (thing_id, {1})"
+            " SELECT %s, t.id FROM {3} t"
+            " WHERE t.id IN ({2}) AND t.current = %s"
+            " AND NOT EXISTS (SELECT 1 FROM {0} existing"
+            " WHERE existing.thing_id = %s AND existing.{1} = t.id)".format(
+                tag_table, column, selection, target_table),
+            [self.thing.id] + params + [True, self.thing.id])
+        return changed
+
+    def _change_ids(self, change, tags, ids):
+        changed = 0
+        for batch in batched(ids, self.BATCH_SIZE):
+            changed += change(tags, ", ".join(["%s"] * len(batch)), batch)
+        return changed
+
+    def _change_subtrees(self, change, paths):
+        changed = 0
+        for batch in batched((Thing.hash(path) for path in paths),
+                             self.BATCH_SIZE):
+            params = batch + [self.MAX_DEPTH]
+            placeholders = ", ".join(["%s"] * len(batch))
+            changed += change(self.EVENTS,
+                    self.SUBTREE_EVENTS_SQL.format(paths=placeholders), params)
+            changed += change(self.SOURCES,
+                    self.SUBTREE_SOURCES_SQL.format(paths=placeholders),
+                    params)
+        return changed
+
+    def link_events(self, ids):
+        """
+        Returns: The number of links created or removed.
+        """
+        return self._change_ids(self._link, self.EVENTS, ids)
+
+    def unlink_events(self, ids):
+        return self._change_ids(self._unlink, self.EVENTS, ids)
+
+    def link_sources(self, ids):
+        return self._change_ids(self._link, self.SOURCES, ids)
+
+    def unlink_sources(self, ids):
+        return self._change_ids(self._unlink, self.SOURCES, ids)
+
+    def link_subtrees(self, paths):
+        """
+        Link the Events and EventSources linked to the Things at paths or
+        any of their descendants.
+        """
+        return self._change_subtrees(self._link, paths)
+
+    def unlink_subtrees(self, paths):
+        return self._change_subtrees(self._unlink, paths)
+
+    def finish(self):
+        """
+        Update the Thing's event index and invalidate its feeds if any links
+        have changed.
+        """
+        if self.changed:
+            ThingEventIndex.index_things([self.thing.id])
+            feed_cache.invalidate_things([self.thing.id])
 
 
 class ThingTag(CleanModelMixin, PreSaveMixin, AnnotationModel):
@@ -1022,6 +1789,8 @@ class ThingTag(CleanModelMixin, PreSaveMixin, AnnotationModel):
 
 
 pre_save.connect(ThingTag.handle_pre_save_signal, sender=ThingTag)
+post_save.connect(invalidate_disabled_subjects, sender=ThingTag)
+post_delete.connect(invalidate_disabled_subjects, sender=ThingTag)
 
 
 class ThingLock(PreSaveMixin, models.Model):
@@ -1031,6 +1800,10 @@ class ThingLock(PreSaveMixin, models.Model):
 
     objects = managers.ThingLockManager()
 
+    class Meta:
+        # Backs the lookups of a Thing's active locks by name
+        index_together = [("thing", "name", "expires")]
+
     thing = models.ForeignKey(Thing, related_name="locks",
             help_text="The Thing being locked.")
 
@@ -1051,10 +1824,45 @@ class ThingLock(PreSaveMixin, models.Model):
         # Automatically call clean() before saving
         self.clean()
 
+    # The number of expired locks removed by each DELETE in delete_expired()
+    DELETE_EXPIRED_BATCH_SIZE = 500
+
+    @classmethod
+    def delete_expired(cls, now=timezone.now, batch_size=None,
+                       max_batches=None):
+        """
+        Delete expired locks, which are never used again, in batches so that
+        no one DELETE holds locks on the table for long.
+
+        Args:
+            now: A function returning the current time.
+            batch_size: The number of locks to delete at a time.
+            max_batches: Stop after this many batches, or None to delete all
+                expired locks.
+        Returns: The number of locks deleted.
+        """
+        batch_size = batch_size or cls.DELETE_EXPIRED_BATCH_SIZE
+        expired = cls.objects.just_expired(now=now)
+
+        deleted = 0
+        batches = 0
+        while max_batches is None or batches < max_batches:
+            ids = list(expired.values_list("id", flat=True)[:batch_size])
+            if not ids:
+                break
+            cls.objects.filter(id__in=ids).delete()
+            deleted += len(ids)
+            batches += 1
+        return deleted
+
 pre_save.connect(ThingLock.handle_pre_save_signal, sender=ThingLock)
 
 
 class LockStrategy(object):
+    """
+    Controls exclusive access to Things (timetables) by their editors. The
+    locks themselves are stored by a lock backend (see timetables.locks).
+    """
 
     # The name of the short-term lock which is 
     TIMEOUT_LOCK_NAME = "short"
@@ -1065,11 +1873,20 @@ class LockStrategy(object):
 
     def __init__(
             self, now=timezone.now, timeout_lock_timeout=TIMEOUT_LOCK_TIMEOUT,
-            edit_lock_timeout=EDIT_LOCK_TIMEOUT):
+            edit_lock_timeout=EDIT_LOCK_TIMEOUT, backend=None):
 
         self._now = now
         self._timeout_timeout = timeout_lock_timeout
         self._edit_timeout = edit_lock_timeout
+        self._backend = backend
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            # Imported by name as the backends depend on this module
+            from timetables.utils.reflection import newinstance
+            self._backend = newinstance(settings.LOCK_BACKEND)
+        return self._backend
 
     def get_status(self, things):
         """
@@ -1078,60 +1895,7 @@ class LockStrategy(object):
         dictionary is in form { thing_fullpath: user }, where user is user
         thing which has the lock or None
         """
-
-        # initialise locks_status to ensure that a value is returned for all of the specified things
-        locks_status = {}
-        things_hashed = []
-        for thing_fullpath in things:
-            locks_status[thing_fullpath] = False
-            things_hashed.append(Thing.hash(thing_fullpath)) # hash for indexed filtering
-        
-        # get all of the locks for the specified things
-        locks = (ThingLock.objects.filter(thing__pathid__in=things_hashed)
-                 .just_active(now=self._now)
-                 .order_by("-expires") # descending order to ensure most recent is first
-                 .prefetch_related("thing")
-                 .prefetch_related("owner"))
-        # note that prefetch_related calls mean we only ever make three database queries; otherwise it is arbitrary depending on the number of different things and found owners
-        
-        # process locks to check both short and long are set
-        things_locks = {}
-        for lock in locks: # pair up all the locks
-            thing_fullpath = lock.thing.fullpath
-            if thing_fullpath not in things_locks:
-                things_locks[thing_fullpath] = {}
-            if lock.name not in things_locks[thing_fullpath]: # ensure we only use the most recent
-                things_locks[thing_fullpath][lock.name] = lock.owner
-
-        for thing_fullpath, thing_locks in things_locks.items(): # for each thing_id, check that both locks are set (and are the same person)
-            owner = False
-            if self.TIMEOUT_LOCK_NAME in thing_locks and self.EDIT_LOCK_NAME in thing_locks:
-                if thing_locks[self.TIMEOUT_LOCK_NAME] == thing_locks[self.EDIT_LOCK_NAME]:
-                    owner_thing = thing_locks[self.TIMEOUT_LOCK_NAME]
-                    owner = {"name": owner_thing.name} # may be expanded as required
-            locks_status[thing_fullpath] = owner
-
-        # return locks to caller
-        return locks_status
-
-    def _get_lock(self, thing, name):
-        locks = (thing.locks.filter(name=name)
-                # Use our own 'now' implementation to allow the current time
-                # to be altered for testing purposes
-                .just_active(now=self._now)
-                .order_by("expires")[:1])
-        if len(locks) == 0:
-            return None
-        
-        return locks[0]
-
-    def _get_locks(self, thing):
-        timeout_lock = self._get_lock(thing, self.TIMEOUT_LOCK_NAME)
-        edit_lock = self._get_lock(thing, self.EDIT_LOCK_NAME)
-        
-        if timeout_lock and edit_lock and timeout_lock.owner == edit_lock.owner:
-            return (timeout_lock, edit_lock)
-        return None
+        return self.backend.get_status(things, self._now())
 
     def _next_timeout_expiry(self):
         return self._now() + self._timeout_timeout
@@ -1146,12 +1910,8 @@ class LockStrategy(object):
         Returns: A Thing of type "user" if a lock is held, or None if no lock
             is held.
         """
-        locks = self._get_locks(thing)
-        if locks:
-            return locks[0].owner
-        return None
+        return self.backend.get_holder(thing, self._now())
 
-    @decorators.method_decorator(transaction.commit_on_success)
     def refresh_lock(self, thing, owner, is_editing):
         """
         Attempts to refresh a previously acquired lock on thing for owner.
@@ -1164,29 +1924,9 @@ class LockStrategy(object):
         Raises:
             LockException: If the thing was already locked by another owner
         """
-        # Check if the thing is already locked by someone else
-        locks = self._get_locks(thing)
-
-        if locks is None:
-            raise LockException("Thing is not locked by anyone. Call "
-                    "acquire_lock() to acquire the lock before attempting to "
-                    "refresh it.")
-
-        timeout_lock, edit_lock = locks
-        assert timeout_lock.owner == edit_lock.owner
-        existing_owner = timeout_lock.owner
-
-        if existing_owner != owner:
-            raise LockException("Thing is already locked by another "
-                    "user. Thing: %s, user: %s" % (thing, existing_owner))
-
-        # We must already hold the lock, so refresh the requested lock.
-        timeout_lock.expires = self._next_timeout_expiry()
-        timeout_lock.save()
-
-        if is_editing:
-            edit_lock.expires = self._next_edit_expiry()
-            edit_lock.save()
+        self.backend.refresh(thing, owner, self._now(),
+                self._next_timeout_expiry(),
+                self._next_edit_expiry() if is_editing else None)
 
     def acquire_lock(self, thing, owner):
         """
@@ -1198,27 +1938,8 @@ class LockStrategy(object):
         Raises:
             LockException: If the thing was already locked by another owner.
         """
-        # Check if the thing is already locked by someone else
-        locks = self._get_locks(thing)
-
-        # Refuse to create a lock if it's already locked by SOMEONE ELSE.
-        # Note that we'll re-create the lock if we already hold it.
-        if locks is not None and locks[0].owner != owner:
-            raise LockException("Thing is already locked by someone. "
-                    "thing: %s, current owner: %s" % (thing, locks[0].owner))
-        
-        # Remove old locks before creating a new one
-        (thing.locks.filter(
-                name__in=[self.TIMEOUT_LOCK_NAME, self.EDIT_LOCK_NAME])
-                .delete())
-
-        ThingLock.objects.create(thing=thing, owner=owner,
-                expires=self._next_timeout_expiry(),
-                name=self.TIMEOUT_LOCK_NAME)
-
-        ThingLock.objects.create(thing=thing, owner=owner,
-                expires=self._next_edit_expiry(),
-                name=self.EDIT_LOCK_NAME)
+        self.backend.acquire(thing, owner, self._now(),
+                self._next_timeout_expiry(), self._next_edit_expiry())
 
 
 class LockException(Exception):
@@ -1,8 +1,140 @@
 from django.db import models
 from django.db.models.aggregates import Count
 from django.db.models import query
+from django.db.models.sql.constants import GET_ITERATOR_CHUNK_SIZE
 from django.utils import timezone
 
+
+# The maximum number of values passed to each query by batched(), keeping us
+# under SQLite's limit of 999 parameters.
+MAX_BATCH_SIZE = 500
+
+
+def batched(values, size=MAX_BATCH_SIZE):
+    """
+    Split values (any iterable) into lists of at most size values, e.g. to
+    pass to a query as the parameters of an IN (...) clause a batch at a time.
+    """
+    values = list(values)
+    for i in range(0, len(values), size):
+        yield values[i:i + size]
+
+
+class QuerysetIterator(object):
+    """
+    Provides streaming access to queryset results, regardless of whether they
+    use prefetch_related() or not.
+
+    The max results to hold in memory at once is controlled by the chunk_size
+    argument to __init__.
+
+    Querysets not using prefetch_related are iterated with the
+    queryset.iterator() method which provides ideal behaviour.
+
+    Querysets using prefetch_related are trickier, as queryset.iterator() will
+    not perform any prefetches, and iter(queryset) will cache the entire set of
+    results in memory. In this case we iteratively fetch chunk_size sized
+    chunks from the queryset which limits the maximum number of results in
+    memory while still allowing prefetch_related to work.
+
+    Unordered querysets are ordered by primary key and fetched a chunk at a
+    time with pk > the last pk seen, which stays fast however deep into the
+    results we get. Ordered querysets are sliced, as their order can't be
+    relied on to match that of the primary key.
+
+    Database drivers such as psycopg2 read the whole result of a query into
+    memory, even via queryset.iterator(), so passing chunked=True fetches
+    chunks even without prefetch_related. Chunked values_list() querysets
+    must select the primary key.
+    """
+    def __init__(self, queryset, chunk_size=GET_ITERATOR_CHUNK_SIZE,
+                 chunked=False):
+        self._queryset = queryset
+        self._chunk_size = chunk_size
+        self._chunked = chunked
+
+    def _uses_prefetch(self):
+        """
+        Returns: True if our queryset uses prefetch_related.
+        """
+        # _prefetch_related_lookups is non-empty if prefetch_related is used
+        return bool(self._queryset._prefetch_related_lookups)
+
+    def __iter__(self):
+        """
+        Returns a memory-efficient iterator over our queryset's results.
+
+        This is called when this object is used in a for loop, or passed to the
+        iter() function (etc).
+        """
+        if not (self._chunked or self._uses_prefetch()):
+            return self._queryset.iterator()
+        return self._chunk_iterator()
+
+    def chunk_size(self):
+        """
+        The maximum number of results that will be held in memory at once.
+
+        This does not include additional rows fetched as a result of
+        prefetch_related calls.
+        """
+        return self._chunk_size
+
+    def _sliced_chunks(self):
+        position = 0
+        while True:
+            # Slice a range of rows out of the queryset
+            chunk = list(
+                self._queryset[position:position + self._chunk_size])
+
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+            if len(chunk) < self._chunk_size:
+                return
+            position += self._chunk_size
+
+    def _keyset_chunks(self):
+        queryset = self._queryset.order_by("pk")
+        last_pk = None
+        while True:
+            chunk_queryset = queryset
+            if last_pk is not None:
+                chunk_queryset = chunk_queryset.filter(pk__gt=last_pk)
+            chunk = list(chunk_queryset[:self._chunk_size])
+
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+            if len(chunk) < self._chunk_size:
+                return
+            last_pk = self._get_pk(chunk[-1])
+
+    def _get_pk(self, row):
+        if isinstance(self._queryset, query.ValuesListQuerySet):
+            if self._queryset.flat:
+                return row
+            pk_name = self._queryset.model._meta.pk.attname
+            fields = list(self._queryset._fields)
+            return row[fields.index("pk" if "pk" in fields else pk_name)]
+        return row.pk
+
+    def _chunks(self):
+        """
+        Generates the 'chunks' (lists of results up to chunk_size in length)
+        of our queryset.
+        """
+        if self._queryset.ordered:
+            return self._sliced_chunks()
+        return self._keyset_chunks()
+
+    def _chunk_iterator(self):
+        for chunk in self._chunks():
+            for row in chunk:
+                yield row
+
 class EventQuerySet(query.QuerySet):
     
     def in_range(self, start, end):
@@ -46,6 +178,13 @@ class ThingLockQuerySet(query.QuerySet):
         current_time = now().astimezone(timezone.utc)
         return self.filter(expires__gte=current_time)
 
+    def just_expired(self, now=timezone.now):
+        """
+        Filters the queryset to contain only locks which have expired.
+        """
+        current_time = now().astimezone(timezone.utc)
+        return self.filter(expires__lt=current_time)
+
 
 class EventSourceQuerySet(query.QuerySet):
 
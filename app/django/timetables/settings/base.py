@@ -24,6 +24,46 @@ EVENT_IMPORTERS = {
     "pattern" : "timetables.utils.formats.datepattern.DatePatternImporter"
 }
 
+# The cache (a key of CACHES) used to hold rendered event feeds served by
+# ExportEvents, and the number of seconds a rendered feed may be cached for.
+# Feeds are invalidated when the events they contain change, so this can be
+# long.
+EVENT_FEED_CACHE = "default"
+EVENT_FEED_CACHE_TIMEOUT = 60 * 60 * 24
+
+# The cache used by TimetablesAuthorizationBackend to share the set of Things
+# each user can administer between requests, and the number of seconds the set
+# may be cached for. Changes made by bulk operations which bypass signals are
+# only seen once this expires, so keep it short.
+PERMISSION_CACHE = "default"
+PERMISSION_CACHE_TIMEOUT = 60
+
+# The cache used to hold the subjects catalogue (see
+# timetables.utils.subjectcache), and the number of seconds it may be cached
+# for. The catalogue is invalidated when tripos, part or subject Things change,
+# so this can be long.
+SUBJECT_CACHE = "default"
+SUBJECT_CACHE_TIMEOUT = 60 * 60 * 24
+
+# The cache used by Thing.get_by_path() to share Things between processes, and
+# the number of seconds a Thing may be cached for. Each process also keeps up to
+# THING_PATH_CACHE_LOCAL_SIZE Things for THING_PATH_CACHE_LOCAL_TIMEOUT
+# seconds, checking the shared version of each Thing before using it, so
+# changes made by other processes are seen once they commit. The local Things
+# are only used if THING_PATH_CACHE can store versions (i.e. isn't a
+# DummyCache).
+THING_PATH_CACHE = "default"
+THING_PATH_CACHE_TIMEOUT = 60 * 60
+THING_PATH_CACHE_LOCAL_SIZE = 1000
+THING_PATH_CACHE_LOCAL_TIMEOUT = 10
+
+# The backend used by LockStrategy to store the locks held on timetables (see
+# timetables.locks). CacheLockBackend keeps locks in the cache named by
+# LOCK_CACHE, which must be shared by all processes; the default
+# DatabaseLockBackend stores them as ThingLock rows.
+LOCK_BACKEND = "timetables.locks.DatabaseLockBackend"
+LOCK_CACHE = "default"
+
 # Forms to edit thing types keyed by thing.type
 THING_FORMS = {
     "module" : "timetables.forms.ModuleForm"
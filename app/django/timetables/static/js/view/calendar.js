@@ -13,7 +13,9 @@ define([
             _.bindAll(this, "onScroll");
 
             this.$el.fullCalendar({
-                events: this.options.eventsFeed,
+                events: this.options.compactFeed && this.options.eventsFeed ?
+                        this.compactEventSource(this.options.eventsFeed) :
+                        this.options.eventsFeed,
                 ignoreTimezone: false, // Why is this true by default? WTF.
                 allDaySlot: false,
                 minTime: this.options.minTime || 7,
@@ -50,6 +52,44 @@ define([
             this.updateCalendarTableAriaHidden();
         },
 
+        /**
+         * Returns a fullcalendar event source which fetches events from url
+         * in the compact format, and expands them into the objects the JSON
+         * feed would have returned.
+         */
+        compactEventSource: function (url) {
+            return function (start, end, callback) {
+                $.ajax({
+                    url: url,
+                    dataType: "json",
+                    data: {
+                        format: "compact",
+                        start: Math.round(start.getTime() / 1000),
+                        end: Math.round(end.getTime() / 1000)
+                    },
+                    success: function (data) {
+                        callback(_.map(data.events, function (values) {
+                            var event = _.object(data.fields, values),
+                                day;
+
+                            event.eventSourceTitle = data.series[event.eventSourceId];
+                            if (event.allDay) {
+                                // All day events fall on their UTC date,
+                                // whatever the browser's timezone.
+                                day = new Date(event.start * 1000);
+                                event.start = new Date(day.getUTCFullYear(), day.getUTCMonth(), day.getUTCDate());
+                                delete event.end;
+                            }
+                            return event;
+                        }));
+                    },
+                    error: function () {
+                        callback([]);
+                    }
+                });
+            };
+        },
+
         /**
          * Generates an accessible event string from a calEvent object.
          */
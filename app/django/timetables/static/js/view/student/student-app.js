@@ -186,6 +186,7 @@ define([
             this.fullCalendarView = new FullCalendarView({
                 el: ".js-calendar",
                 eventsFeed: page.isUserLoggedIn() ? this.getThingPath() + ".cal.json" : undefined,
+                compactFeed: true,
                 defaultView: "agendaWeek",
                 firstDay: 4
             });
@@ -0,0 +1,81 @@
+from django.contrib.auth.models import User
+from django.core.cache import get_cache
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from timetables.backend import (TimetablesAuthorizationBackend, ThingSubject,
+    GlobalThingSubject)
+from timetables.models import Thing, ThingTag
+
+
+@override_settings(CACHES={
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "backend-test"
+    }
+})
+class PermissionMemoTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        get_cache("default").clear()
+        self.backend = TimetablesAuthorizationBackend()
+        self.user_thing = Thing.objects.get(fullpath="user/gcm23")
+        self.part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+
+    def get_user(self):
+        # A fresh user object, as seen by a new request
+        return User(username="gcm23")
+
+    def test_repeated_checks_are_memoised(self):
+        user = self.get_user()
+        subject = ThingSubject(fullpath="tripos/test_tripos/test_part")
+
+        self.assertTrue(self.backend.has_perm(user, Thing.PERM_READ, subject))
+        with self.assertNumQueries(0):
+            self.assertTrue(self.backend.has_perm(
+                user, Thing.PERM_READ,
+                ThingSubject(fullpath="tripos/test_tripos/test_part")))
+            self.assertFalse(self.backend.has_perm(
+                user, Thing.PERM_LINK, subject))
+
+    def test_memo_is_per_user_object(self):
+        self.backend.has_perm(self.get_user(), Thing.PERM_READ,
+                              ThingSubject(fullpath="user/admin"))
+        # The user Thing, subject Thing and admin tags are fetched again
+        with self.assertNumQueries(3):
+            self.backend.has_perm(self.get_user(), Thing.PERM_READ,
+                                  ThingSubject(fullpath="user/admin"))
+
+    def test_admin_targets_are_shared_between_requests(self):
+        self.assertFalse(self.backend.has_perm(
+            self.get_user(), Thing.PERM_WRITE, GlobalThingSubject()))
+
+        ThingTag.objects.create(thing=self.user_thing, targetthing=self.part,
+                                annotation="admin")
+        user = self.get_user()
+        self.assertTrue(self.backend.has_perm(
+            user, Thing.PERM_WRITE, GlobalThingSubject()))
+
+        # Only the user's Thing is fetched, the admin targets are cached
+        with self.assertNumQueries(1):
+            self.assertTrue(self.backend.has_perm(
+                self.get_user(), Thing.PERM_WRITE, GlobalThingSubject()))
+
+    def test_granting_via_view_invalidates_admin_targets(self):
+        self.assertFalse(self.backend.has_perm(
+            self.get_user(), Thing.PERM_WRITE, GlobalThingSubject()))
+
+        User.objects.create_superuser("root", "root@example.com", "password")
+        self.client.login(username="root", password="password")
+        self.client.post(
+            reverse("admin user timetable perms", args=["gcm23"]),
+            {"tripos/test_tripos/test_part": "on"})
+
+        self.assertTrue(ThingTag.objects.filter(
+            thing=self.user_thing, targetthing=self.part,
+            annotation="admin").exists())
+        self.assertTrue(self.backend.has_perm(
+            self.get_user(), Thing.PERM_WRITE, GlobalThingSubject()))
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from timetables.models import Event
+from timetables.views.calendarview import CalendarView
+
+
+class CalendarViewJsonTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def get_json(self, **params):
+        view = CalendarView()
+        view.request = RequestFactory().get("/user/gcm23.cal.json", params)
+        view.kwargs = {"thing": "user/gcm23"}
+        view.get_thing()
+        events = view.get_event_values()
+        # The events and their series titles are read with a single query
+        with self.assertNumQueries(1):
+            chunks = list(view.generate_json(events))
+        return json.loads("".join(chunks))
+
+    def test_fullcalendar_format(self):
+        event = Event.objects.get(title="Event 2")
+        event.metadata = {"x-allday": True}
+        event.save()
+        events = sorted(self.get_json(), key=lambda e: e["djid"])
+
+        self.assertEqual({
+            "djid": 1,
+            "title": u"Evént 1",
+            "allDay": False,
+            "start": "2013-10-10T08:00:00+00:00",
+            "end": "2013-10-10T09:00:00+00:00",
+            "location": u"Lectűre Roōm 1",
+            "lecturer": [u"Prof C Ļeveŕ"],
+            "type": "lecture",
+            "eventSourceId": 1,
+            "eventSourceTitle": "Test Series"
+        }, events[0])
+        self.assertEqual({
+            "djid": 2,
+            "title": "Event 2",
+            "allDay": True,
+            "start": "2013-10-17",
+            "location": "Lecture Room 1",
+            "lecturer": [],
+            "type": False,
+            "eventSourceId": 1,
+            "eventSourceTitle": "Test Series"
+        }, events[1])
+
+    def test_compact_format(self):
+        data = self.get_json(format="compact")
+
+        self.assertEqual(list(CalendarView.COMPACT_FIELDS), data["fields"])
+        self.assertEqual({"1": "Test Series"}, data["series"])
+        self.assertEqual(
+            [1, 1381392000, 1381395600, False, u"Evént 1", u"Lectűre Roōm 1",
+             [u"Prof C Ļeveŕ"], "lecture", 1],
+            sorted(data["events"])[0])
+        self.assertEqual(2, len(data["events"]))
+
+    def test_output_is_chunked(self):
+        view = CalendarView()
+        view.request = RequestFactory().get("/user/gcm23.cal.json")
+        view.kwargs = {"thing": "user/gcm23"}
+        view.stream_buffer_size = 1
+        chunks = list(view.generate_json(view.get_event_values()))
+        self.assertEqual(3, len(chunks))
+        self.assertEqual(2, len(json.loads("".join(chunks))))
@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import datetime
+
+from django.test import TestCase
+from django.utils import timezone
+
+from timetables.models import (Thing, Event, EventSource, EventSourceTag,
+    EventTag, ThingEventIndex)
+
+
+class ThingEventIndexTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        self.user = Thing.objects.get(fullpath="user/gcm23")
+        self.admin = Thing.objects.get(fullpath="user/admin")
+        self.part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+        self.series = EventSource.objects.get(title="Test Series")
+
+    def get_index(self):
+        return sorted(ThingEventIndex.objects.values_list(
+            "thing_id", "event_id", "start"))
+
+    def test_fixture_is_indexed(self):
+        self.assertEqual(
+            [u"Event 2", u"Evént 1"],
+            sorted(e.title for e in self.user.get_events()))
+        self.assertEqual(2, self.part.get_events(depth=2).count())
+        self.assertEqual(0, self.admin.get_events().count())
+
+    def test_get_events_date_range(self):
+        date_range = (timezone.make_aware(datetime.datetime(2013, 10, 15),
+                                          timezone.utc),
+                      timezone.make_aware(datetime.datetime(2013, 10, 20),
+                                          timezone.utc))
+        self.assertEqual(
+            ["Event 2"],
+            [e.title for e in self.user.get_events(date_range=date_range)])
+
+    def test_event_start_change_is_indexed(self):
+        event = Event.objects.get(title="Event 2")
+        event.start = event.start + datetime.timedelta(days=1)
+        event.save()
+
+        self.assertEqual(
+            event.start,
+            ThingEventIndex.objects.get(thing=self.user, event=event).start)
+
+    def test_tags_are_indexed(self):
+        EventSourceTag.objects.create(thing=self.admin,
+                                      eventsource=self.series)
+        self.assertEqual(2, self.admin.get_events().count())
+
+        # Direct links are included in the index
+        other = Thing.objects.get(fullpath="user")
+        EventTag.objects.create(thing=other,
+                                event=Event.objects.get(title="Event 2"))
+        self.assertEqual(["Event 2"],
+                         [e.title for e in other.get_events()])
+
+    def test_tag_delete_is_indexed(self):
+        EventSourceTag.objects.get(thing=self.user).delete()
+        self.assertEqual(0, self.user.get_events().count())
+
+        tag = EventTag.objects.create(
+            thing=self.user, event=Event.objects.get(title="Event 2"))
+        self.assertEqual(1, self.user.get_events().count())
+        tag.delete()
+        self.assertEqual(0, self.user.get_events().count())
+
+    def test_thing_delete_with_tags(self):
+        EventTag.objects.create(
+            thing=self.user, event=Event.objects.get(title="Event 2"))
+        self.user.delete()
+        self.assertEqual(
+            0, ThingEventIndex.objects.filter(thing_id=self.user.id).count())
+
+    def test_index_things_after_bulk_delete(self):
+        EventSourceTag.objects.filter(thing=self.user).delete()
+        ThingEventIndex.index_things([self.user.id])
+
+        self.assertEqual(0, self.user.get_events().count())
+
+    def test_index_more_things_than_a_batch(self):
+        ThingEventIndex.objects.all().delete()
+        batch_size = ThingEventIndex.BATCH_SIZE
+        ThingEventIndex.BATCH_SIZE = 2
+        try:
+            # Two batches, with the user's id last
+            thing_ids = [10 ** 6, 10 ** 6 + 1, 10 ** 6 + 2, self.user.id]
+            with self.assertNumQueries(4):
+                ThingEventIndex.index_things(thing_ids)
+            self.assertEqual(2, self.user.get_events().count())
+
+            EventSourceTag.objects.filter(thing=self.user).delete()
+            with self.assertNumQueries(2):
+                ThingEventIndex.unindex_things(thing_ids)
+            self.assertEqual(0, self.user.get_events().count())
+        finally:
+            ThingEventIndex.BATCH_SIZE = batch_size
+
+    def test_eventsource_makecurrent(self):
+        new_series = EventSource(from_instance=self.series)
+        new_series.makecurrent()
+
+        self.assertEqual(2, self.user.get_events().count())
+        self.assertEqual(
+            set([new_series.id]),
+            set(e.source_id for e in self.user.get_events()))
+
+    def test_unpacked_events_are_indexed(self):
+        sources = EventSource.objects.filter(id=self.series.id)
+        self.assertEqual((1, 2), Event.objects.unpack_sources(sources))
+
+        events = self.user.get_events()
+        self.assertEqual(2, events.count())
+        self.assertEqual(set([self.series.id]),
+                         set(e.source_id for e in events))
+        for event in events:
+            self.assertEqual(event.id, event.master_id)
+
+    def test_get_all_events(self):
+        self.assertEqual(
+            2, Thing.get_all_events([self.user, self.admin]).count())
+
+    def test_rebuild(self):
+        expected = self.get_index()
+        ThingEventIndex.objects.all().delete()
+        ThingEventIndex.rebuild()
+
+        self.assertEqual(expected, self.get_index())
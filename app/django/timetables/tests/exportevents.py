@@ -0,0 +1,94 @@
+import gzip
+import json
+from cStringIO import StringIO
+
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from timetables.backend import ThingSubject
+from timetables.views.exportevents import ExportEvents
+
+
+class ExportEventsVariantsTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def get(self, extension, params=None, fullpath="user/gcm23",
+            view_kwargs=None, **headers):
+        request = RequestFactory().get(
+            "/%s.events.%s" % (fullpath, extension), params or {}, **headers)
+        request.user = AnonymousUser()
+        hmac = ThingSubject(fullpath=fullpath).create_hmac()
+        return ExportEvents.as_view(**(view_kwargs or {}))(
+            request, thing=fullpath, hmac=hmac)
+
+    def content(self, response):
+        if response.streaming:
+            content = b"".join(response.streaming_content)
+        else:
+            content = response.content
+        if response.get("Content-Encoding") == "gzip":
+            content = gzip.GzipFile(fileobj=StringIO(content)).read()
+        return content
+
+    def test_json(self):
+        response = self.get("json")
+        self.assertEqual("application/json; charset=utf-8",
+                         response["Content-Type"])
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(2, len(json.loads(response.content)))
+        self.assertEqual("Accept, Accept-Encoding", response["Vary"])
+
+    def test_ndjson(self):
+        for response in (self.get("json", {"format": "ndjson"}),
+                         self.get("json", HTTP_ACCEPT="application/x-ndjson")):
+            self.assertEqual("application/x-ndjson; charset=utf-8",
+                             response["Content-Type"])
+            lines = response.content.split("\n")
+            self.assertEqual([""], lines[2:])
+            self.assertEqual(
+                json.loads(self.get("json").content),
+                [json.loads(line) for line in lines[:2]])
+
+    def test_ndjson_is_ignored_by_other_formats(self):
+        response = self.get("csv", {"format": "ndjson"})
+        self.assertEqual("text/csv; charset=utf-8", response["Content-Type"])
+
+    def test_recurrences_are_ignored_by_other_formats(self):
+        plain = self.get("csv")
+        response = self.get("csv", {"recur": "weekly"})
+        self.assertEqual(plain.content, response.content)
+        self.assertEqual(plain["ETag"], response["ETag"])
+
+    def test_gzip(self):
+        plain = self.get("csv")
+        response = self.get("csv", HTTP_ACCEPT_ENCODING="gzip, deflate")
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertEqual(plain.content, self.content(response))
+        self.assertNotEqual(plain["ETag"], response["ETag"])
+
+        # The param takes precedence over the header
+        response = self.get("csv", {"compress": "none"},
+                            HTTP_ACCEPT_ENCODING="gzip")
+        self.assertFalse(response.has_header("Content-Encoding"))
+        response = self.get("csv", {"compress": "gzip"})
+        self.assertEqual("gzip", response["Content-Encoding"])
+
+    def test_streamed_gzip_ndjson(self):
+        response = self.get("json", {"depth": 2, "format": "ndjson"},
+                            fullpath="tripos/test_tripos/test_part",
+                            HTTP_ACCEPT_ENCODING="gzip")
+        self.assertTrue(response.streaming)
+        self.assertEqual("gzip", response["Content-Encoding"])
+        self.assertEqual(2, len(self.content(response).splitlines()))
+
+    def test_streamed_events_are_read_in_chunks(self):
+        response = self.get("json", {"depth": 2, "format": "ndjson"},
+                            fullpath="tripos/test_tripos/test_part",
+                            view_kwargs={"stream_chunk_size": 1})
+        self.assertTrue(response.streaming)
+        # Two chunks of one event, then an empty one
+        with self.assertNumQueries(3):
+            content = self.content(response)
+        self.assertEqual(2, len(content.splitlines()))
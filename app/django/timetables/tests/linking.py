@@ -0,0 +1,83 @@
+from django.test import TestCase
+
+from timetables.models import (Thing, Event, EventSource, EventSourceTag,
+    EventTag, ThingEventIndex, ThingLinker)
+
+
+class ThingLinkerTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        self.admin = Thing.objects.get(fullpath="user/admin")
+        self.series = EventSource.objects.get(title="Test Series")
+        self.linker = ThingLinker(self.admin)
+
+    def get_tags(self):
+        return (
+            sorted(EventTag.objects.filter(thing=self.admin)
+                   .values_list("event_id", flat=True)),
+            sorted(EventSourceTag.objects.filter(thing=self.admin)
+                   .values_list("eventsource_id", flat=True)))
+
+    def get_indexed_events(self):
+        return sorted(ThingEventIndex.objects.filter(thing=self.admin)
+                      .values_list("event_id", flat=True))
+
+    def test_link_subtree(self):
+        self.assertEqual(1, self.linker.link_subtrees(["tripos/test_tripos"]))
+        self.assertEqual(([], [self.series.id]), self.get_tags())
+
+        # Linking again changes nothing
+        self.assertEqual(0, self.linker.link_subtrees(["tripos/test_tripos"]))
+        self.assertEqual(1, self.linker.changed)
+
+    def test_unlink_subtree(self):
+        self.linker.link_subtrees(["tripos/test_tripos/test_part"])
+        self.assertEqual(1, self.linker.unlink_subtrees(
+            ["tripos/test_tripos/test_part"]))
+        self.assertEqual(([], []), self.get_tags())
+
+    def test_link_subtree_beyond_max_depth(self):
+        self.linker.MAX_DEPTH = 1
+        self.assertEqual(0, self.linker.link_subtrees(["tripos"]))
+        self.assertEqual(1, self.linker.link_subtrees(
+            ["tripos/test_tripos/test_part"]))
+
+    def test_link_subtree_events(self):
+        module = Thing.objects.get(
+            fullpath="tripos/test_tripos/test_part/test_module")
+        EventTag.objects.create(thing=module, event_id=1)
+        self.assertEqual(2, self.linker.link_subtrees(["tripos"]))
+        self.assertEqual(([1], [self.series.id]), self.get_tags())
+
+    def test_link_and_unlink_ids(self):
+        self.assertEqual(2, self.linker.link_events([1, 2]))
+        self.assertEqual(1, self.linker.link_sources([self.series.id]))
+        self.assertEqual(([1, 2], [self.series.id]), self.get_tags())
+
+        self.assertEqual(1, self.linker.unlink_events([2]))
+        self.assertEqual(1, self.linker.unlink_sources([self.series.id]))
+        self.assertEqual(([1], []), self.get_tags())
+        self.assertEqual(5, self.linker.changed)
+
+    def test_non_current_are_unlinked(self):
+        self.linker.link_events([1, 2])
+        Event.objects.filter(id=2).update(current=False)
+        self.assertEqual(1, self.linker.link_events([1, 2]))
+        self.assertEqual(([1], []), self.get_tags())
+
+    def test_batches(self):
+        self.linker.BATCH_SIZE = 1
+        self.assertEqual(2, self.linker.link_events([1, 2, 3]))
+        self.assertEqual(([1, 2], []), self.get_tags())
+
+    def test_finish_updates_index(self):
+        self.linker.link_subtrees(["tripos/test_tripos"])
+        self.assertEqual([], self.get_indexed_events())
+        self.linker.finish()
+        self.assertEqual([1, 2], self.get_indexed_events())
+
+    def test_finish_without_changes(self):
+        with self.assertNumQueries(0):
+            self.linker.finish()
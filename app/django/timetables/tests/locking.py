@@ -2,9 +2,11 @@ import datetime
 
 from django.test import TestCase
 from django.core import exceptions
+from django.core.cache import get_cache
 from django.utils import timezone
 
 from timetables import models
+from timetables.locks import CacheLockBackend, DatabaseLockBackend
 
 # Use a constant starting time
 START_TIME = timezone.make_aware(datetime.datetime(2012, 12, 18, 10, 5),
@@ -115,6 +117,47 @@ class TestThingLock(SimpleLockingTestCase):
                 .exists())
 
 
+class TestDeleteExpiredLocks(SimpleLockingTestCase):
+
+    def setUp(self):
+        self.time = Time(START_TIME)
+        self.hal = models.Thing.objects.get(fullpath="user/hal")
+        self.thing = models.Thing.objects.get(fullpath="tripos/asnc/I")
+
+    def create_locks(self, count, expires):
+        for _ in range(count):
+            models.ThingLock.objects.create(thing=self.thing, owner=self.hal,
+                    expires=expires, name="short")
+
+    def test_only_expired_locks_are_deleted(self):
+        self.create_locks(5, self.time.now() - datetime.timedelta(seconds=1))
+        self.create_locks(2, self.time.now())
+
+        self.assertEqual(5, models.ThingLock.delete_expired(
+                now=self.time.now, batch_size=2))
+        self.assertEqual(2, models.ThingLock.objects.count())
+        self.assertEqual(2, self.thing.locks.just_active(now=self.time.now)
+                .count())
+
+    def test_max_batches(self):
+        self.create_locks(5, self.time.now() - datetime.timedelta(seconds=1))
+
+        self.assertEqual(4, models.ThingLock.delete_expired(
+                now=self.time.now, batch_size=2, max_batches=2))
+        self.assertEqual(1, models.ThingLock.objects.count())
+
+    def test_acquiring_lock_sweeps_expired_locks(self):
+        self.create_locks(3, self.time.now() - datetime.timedelta(seconds=1))
+        other = models.Thing.objects.get(fullpath="tripos/asnc")
+        locker = models.LockStrategy(now=self.time.now,
+                backend=DatabaseLockBackend(sweep_probability=1))
+
+        locker.acquire_lock(other, self.hal)
+
+        self.assertEqual(set([other]),
+                set(lock.thing for lock in models.ThingLock.objects.all()))
+
+
 class TestLockStrategy(SimpleLockingTestCase):
 
     SHORT_TIMEOUT = datetime.timedelta(minutes=4)
@@ -182,6 +225,10 @@ class TestLockStrategy(SimpleLockingTestCase):
         except models.LockException:
             pass
 
+    def get_backend(self):
+        # Use the default backend
+        return None
+
     def _create_locker(self):
         # Make our time start from START_TIME
         time = Time(START_TIME)
@@ -192,7 +239,8 @@ class TestLockStrategy(SimpleLockingTestCase):
         # Create a LockStrategy instance to perform the locking
         locker = models.LockStrategy(now=time.now,
                 timeout_lock_timeout=self.SHORT_TIMEOUT,
-                edit_lock_timeout=self.LONG_TIMEOUT)
+                edit_lock_timeout=self.LONG_TIMEOUT,
+                backend=self.get_backend())
 
         return time, thing, locker
 
@@ -340,6 +388,67 @@ class TestLockStrategy(SimpleLockingTestCase):
                 "Nobody now holds the lock.")
 
 
+class TestCacheLockStrategy(TestLockStrategy):
+    """
+    Runs the LockStrategy tests against CacheLockBackend.
+    """
+
+    def setUp(self):
+        super(TestCacheLockStrategy, self).setUp()
+        self.cache = get_cache(
+            "django.core.cache.backends.locmem.LocMemCache",
+            LOCATION="locking-test")
+        self.cache.clear()
+
+    def get_backend(self):
+        return CacheLockBackend(cache=self.cache)
+
+    def test_get_status_is_a_single_cache_lookup(self):
+        time, thing, locker = self._create_lock_for_user1()
+
+        with self.assertNumQueries(0):
+            status = locker.get_status(["tripos/asnc/I", "tripos/asnc"])
+
+        self.assertEqual({"tripos/asnc/I": {"name": "user1"},
+                          "tripos/asnc": False}, status)
+
+        time.tick(self.SHORT_TIMEOUT + datetime.timedelta(seconds=1))
+        self.assertEqual({"tripos/asnc/I": False},
+                         locker.get_status(["tripos/asnc/I"]))
+
+    def test_no_database_locks_are_created(self):
+        time, thing, locker = self._create_lock_for_user1()
+        locker.refresh_lock(thing, self.user1, True)
+
+        self.assertFalse(models.ThingLock.objects.exists())
+
+    def test_concurrent_change_times_out(self):
+        time, thing, locker = self._create_locker()
+        backend = locker.backend
+        backend.MUTEX_WAIT = datetime.timedelta()
+
+        # Another process is part way through changing the lock
+        self.cache.add(backend.MUTEX_KEY % thing.pathid, True)
+
+        with self.assertRaises(models.LockException):
+            locker.acquire_lock(thing, self.user1)
+        self.assertEqual(None, locker.get_holder(thing))
+
+
+    def test_overrunning_change_keeps_other_mutex(self):
+        time, thing, locker = self._create_locker()
+        backend = locker.backend
+        mutex_key = backend.MUTEX_KEY % thing.pathid
+
+        def get_active(thing, now):
+            # Our mutex expires and another process takes it
+            self.cache.set(mutex_key, "other")
+            return None
+        backend._get_active = get_active
+
+        locker.acquire_lock(thing, self.user1)
+        self.assertEqual("other", self.cache.get(mutex_key))
+
 class TimeTestCase(TestCase):
     """
     This TestCase verifies the behaviour of the Time class used in the other
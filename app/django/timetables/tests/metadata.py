@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from timetables.models import (Event, EventSource, deferred_metadata,
+    split_metadata_list)
+from timetables.utils.formats.jsonformat import JsonExporter
+
+
+class EventSourceMetadataTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def get_series(self):
+        return EventSource.objects.get(title="Test Series")
+
+    def move_events(self, location):
+        for event in Event.objects.filter(source__title="Test Series"):
+            event.location = location
+            event.save()
+
+    def test_compute_metadata(self):
+        metadata = self.get_series().compute_metadata()
+
+        self.assertEqual([u"Prof C Ļeveŕ", u"Prof C Lever"],
+                         metadata["people"])
+
+    def test_event_save_updates_metadata(self):
+        self.move_events("Elsewhere")
+        self.assertEqual("Elsewhere", self.get_series().metadata["location"])
+
+    def test_deferred_metadata(self):
+        with deferred_metadata():
+            with deferred_metadata():
+                self.move_events("Elsewhere")
+            # Nested blocks don't update the metadata
+            self.assertNotEqual("Elsewhere",
+                                self.get_series().metadata.get("location"))
+
+        self.assertEqual("Elsewhere", self.get_series().metadata["location"])
+
+    def test_deferred_metadata_discarded_on_error(self):
+        try:
+            with deferred_metadata():
+                self.move_events("Elsewhere")
+                raise ValueError()
+        except ValueError:
+            pass
+
+        self.assertNotEqual("Elsewhere",
+                            self.get_series().metadata.get("location"))
+        # Saves after the failed block update immediately again
+        self.move_events("Elsewhere")
+        self.assertEqual("Elsewhere", self.get_series().metadata["location"])
+
+
+class MetadataColumnsTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def get_columns(self, title):
+        return Event.objects.filter(title=title).values_list(
+            "allday", "event_type", "people")[0]
+
+    def test_fixture_columns(self):
+        self.assertEqual((False, "lecture", u"Prof C Ļeveŕ"),
+                         self.get_columns(u"Evént 1"))
+
+    def test_save_updates_columns(self):
+        event = Event.objects.get(title="Event 2")
+        event.metadata.update({"x-allday": True, "type": "class",
+                               "people": ["A", "B"]})
+        event.save()
+
+        self.assertEqual((True, "class", "A\nB"), self.get_columns("Event 2"))
+        self.assertEqual(["A", "B"], split_metadata_list(event.people))
+
+    def test_json_allday(self):
+        event = Event.objects.get(title="Event 2")
+        self.assertNotIn("x-allday", event.metadata)
+        self.assertIs(False, JsonExporter().make_event(event)["allday"])
+
+    def test_series_columns(self):
+        series = EventSource.objects.get(title="Test Series")
+        series.set_metadata(save=True)
+
+        series = EventSource.objects.get(title="Test Series")
+        self.assertEqual([u"Prof C Ļeveŕ", u"Prof C Lever"],
+                         split_metadata_list(series.people))
+        self.assertEqual(series.metadata["datePattern"], series.date_pattern)
+
+    def test_backfill(self):
+        Event.objects.filter(title="Event 2").update(
+            data='{"x-allday": true, "people": ["A"]}')
+        Event.objects.filter(title=u"Evént 1").update(data="not json")
+
+        with self.assertNumQueries(3):
+            updated, invalid = Event.backfill_metadata_columns()
+        self.assertEqual((1, [1]), (updated, invalid))
+        self.assertEqual((True, "", "A"), self.get_columns("Event 2"))
+
+        # Nothing changes when run again
+        self.assertEqual((0, [1]), Event.backfill_metadata_columns(batch_size=1))
@@ -0,0 +1,38 @@
+from django.test import TestCase
+
+from timetables.models import Event
+from timetables.querysets import QuerysetIterator
+
+
+class QuerysetIteratorTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def assert_iterates_all(self, queryset, chunk_size):
+        expected = [e.pk for e in queryset]
+        actual = [e.pk for e in QuerysetIterator(queryset, chunk_size)]
+
+        self.assertEqual(sorted(expected), sorted(actual))
+
+    def test_without_prefetch(self):
+        self.assert_iterates_all(Event.objects.all(), 1)
+
+    def test_unordered_with_prefetch(self):
+        for chunk_size in [1, 2, 3]:
+            self.assert_iterates_all(
+                Event.objects.prefetch_related("source"), chunk_size)
+
+    def test_chunked_values_list(self):
+        queryset = Event.objects.values_list("title", "id")
+        with self.assertNumQueries(3):
+            iterated = list(QuerysetIterator(queryset, 1, chunked=True))
+        self.assertEqual(sorted(queryset), sorted(iterated))
+
+    def test_ordered_with_prefetch(self):
+        queryset = Event.objects.order_by("-start").prefetch_related("source")
+        iterated = list(QuerysetIterator(queryset, 1))
+
+        self.assertEqual(list(queryset), iterated)
+        # prefetched series are available on the iterated events
+        with self.assertNumQueries(0):
+            [e.source.title for e in iterated]
@@ -0,0 +1,117 @@
+import datetime
+import json
+import os
+import shutil
+import sys
+import tempfile
+from cStringIO import StringIO
+
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from timetables.management.commands import recompute_eventsource_metadata
+from timetables.management.commands import utils
+from timetables.models import Event, EventSource
+
+
+# fix_eventsource_batch() manages its own transactions, so these tests can't
+# run inside one as TestCase's do.
+class RecomputeEventSourceMetadataTest(TransactionTestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        self.series = [EventSource.objects.get(title="Test Series")]
+        for i in range(3):
+            self.series.append(EventSource.objects.create(
+                title="Series %d" % i, sourcetype="pattern"))
+        self.ids = [series.id for series in self.series]
+
+        self.tmpdir = tempfile.mkdtemp()
+        self.checkpoint = os.path.join(self.tmpdir, "checkpoint.json")
+
+        # Record the batches processed
+        self.batches = []
+        self._fix_eventsource_batch = utils.fix_eventsource_batch
+        def fix_eventsource_batch(eventsource_ids, dry_run=False):
+            self.batches.append(list(eventsource_ids))
+            return self._fix_eventsource_batch(eventsource_ids, dry_run)
+        utils.fix_eventsource_batch = fix_eventsource_batch
+
+    def tearDown(self):
+        utils.fix_eventsource_batch = self._fix_eventsource_batch
+        shutil.rmtree(self.tmpdir)
+
+    def run_command(self, *argv):
+        command = recompute_eventsource_metadata.Command()
+        stderr = sys.stderr
+        sys.stderr = StringIO()
+        try:
+            command.handle(command.parser.parse_args(list(argv)))
+        finally:
+            sys.stderr = stderr
+
+    def test_all_batches(self):
+        self.run_command("--batch-size", "2")
+        self.assertEqual([self.ids[:2], self.ids[2:]], self.batches)
+
+    def test_resume_from_checkpoint(self):
+        with open(self.checkpoint, "w") as f:
+            json.dump({"last_id": self.ids[1]}, f)
+
+        self.run_command("--batch-size", "1", "--checkpoint", self.checkpoint)
+
+        self.assertEqual([[self.ids[2]], [self.ids[3]]], self.batches)
+        # The checkpoint is removed once every batch is done
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_since(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        Event.objects.update(versionstamp=old, lastmodified=old)
+        Event.objects.create(
+            title="New", source=self.series[2], location="Here",
+            start=timezone.now(),
+            end=timezone.now() + datetime.timedelta(hours=1))
+
+        self.run_command("--since",
+                         (old + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual([[self.ids[2]]], self.batches)
+
+    def test_since_finds_changed_events(self):
+        old = timezone.now() - datetime.timedelta(days=10)
+        Event.objects.update(versionstamp=old, lastmodified=old)
+        # An existing event edited in place keeps its versionstamp
+        event = Event.objects.get(title="Event 2")
+        event.location = "Somewhere else"
+        event.save()
+
+        self.run_command("--since",
+                         (old + datetime.timedelta(days=1)).isoformat())
+        self.assertEqual([[self.ids[0]]], self.batches)
+
+
+class CheckpointTest(TransactionTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "checkpoint.json")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_advances_past_completed_batches_in_order(self):
+        checkpoint = recompute_eventsource_metadata.Checkpoint(
+            self.path, [[1, 2], [3, 4], [5]])
+        self.assertIsNone(
+            recompute_eventsource_metadata.Checkpoint.load(self.path))
+
+        checkpoint.complete(1)
+        self.assertIsNone(
+            recompute_eventsource_metadata.Checkpoint.load(self.path))
+        checkpoint.complete(0)
+        self.assertEqual(
+            4, recompute_eventsource_metadata.Checkpoint.load(self.path))
+
+        checkpoint.complete(2)
+        checkpoint.finish()
+        self.assertFalse(os.path.exists(self.path))
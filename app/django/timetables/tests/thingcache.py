@@ -0,0 +1,198 @@
+from django.core.cache import get_cache
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from timetables.backend import ThingSubject
+from timetables.models import Thing
+from timetables.utils.tests.caches import LocMemCacheMixin
+from timetables.utils.thingcache import (VERSION_KEY, THING_KEY,
+    thing_path_cache)
+from timetables.utils.transactions import commit_on_success
+
+
+# Things are only cached outside transactions, so these tests can't run inside
+# one as TestCase's do.
+class ThingPathCacheTest(LocMemCacheMixin, TransactionTestCase):
+
+    fixtures = ("test_ical.json",)
+
+    cache_wrappers = (thing_path_cache,)
+
+    def setUp(self):
+        super(ThingPathCacheTest, self).setUp()
+        thing_path_cache.clear_local()
+        thing_path_cache.reset_stats()
+
+    def tearDown(self):
+        thing_path_cache.clear_local()
+
+    def assert_stats(self, local_hits, shared_hits, misses):
+        self.assertEqual({"local_hits": local_hits,
+                          "shared_hits": shared_hits,
+                          "misses": misses},
+                         thing_path_cache.get_stats())
+
+    def test_lookups_are_cached(self):
+        thing = Thing.get_by_path("tripos/test_tripos/test_part")
+
+        with self.assertNumQueries(0):
+            cached = Thing.get_by_path("tripos/test_tripos/test_part")
+            thing_path_cache.clear_local()
+            shared = Thing.get_by_path("tripos/test_tripos/test_part")
+
+        for other in [cached, shared]:
+            self.assertEqual(thing, other)
+            self.assertEqual(thing.fullname, other.fullname)
+            self.assertEqual(thing.parent_id, other.parent_id)
+            self.assertEqual(thing.type, other.type)
+            self.assertEqual(thing.metadata, other.metadata)
+        self.assert_stats(local_hits=1, shared_hits=1, misses=1)
+
+    def test_missing_thing(self):
+        with self.assertRaises(Thing.DoesNotExist):
+            Thing.get_by_path("tripos/missing")
+        with self.assertRaises(Thing.DoesNotExist):
+            Thing.get_by_path("tripos/missing")
+        self.assert_stats(local_hits=0, shared_hits=0, misses=2)
+
+    def test_metadata_is_copied(self):
+        thing = Thing.get_by_path("tripos/test_tripos")
+        thing.metadata["changed"] = True
+
+        self.assertNotIn("changed",
+                         Thing.get_by_path("tripos/test_tripos").metadata)
+
+    def test_cached_thing_can_be_saved(self):
+        Thing.get_by_path("tripos/test_tripos")
+        thing = Thing.get_by_path("tripos/test_tripos")
+        thing.fullname = "Renamed Tripos"
+        thing.save()
+
+        self.assertEqual(1, Thing.objects.filter(fullpath="tripos/test_tripos")
+                                         .count())
+        self.assertEqual("Renamed Tripos",
+                         Thing.get_by_path("tripos/test_tripos").fullname)
+
+    def test_rename_invalidates(self):
+        part = Thing.get_by_path("tripos/test_tripos/test_part")
+        module = Thing.get_by_path("tripos/test_tripos/test_part/test_module")
+        tripos = Thing.get_by_path("tripos/test_tripos")
+        tripos.name = "renamed"
+        tripos.save()
+
+        # The tripos and its descendants are no longer found at their old
+        # paths, the descendants having been renamed with a bulk UPDATE.
+        for path in ["tripos/test_tripos", "tripos/test_tripos/test_part",
+                     "tripos/test_tripos/test_part/test_module"]:
+            with self.assertRaises(Thing.DoesNotExist):
+                Thing.get_by_path(path)
+
+        self.assertEqual(part, Thing.get_by_path("tripos/renamed/test_part"))
+        self.assertEqual(module, Thing.get_by_path(
+            "tripos/renamed/test_part/test_module"))
+
+    def test_delete_invalidates(self):
+        module = Thing.get_by_path("tripos/test_tripos/test_part/test_module")
+        Thing.objects.get(pk=module.pk).delete()
+
+        with self.assertRaises(Thing.DoesNotExist):
+            Thing.get_by_path("tripos/test_tripos/test_part/test_module")
+
+    def test_invalidated_while_reading(self):
+        path = "tripos/test_tripos"
+        record_for_thing = thing_path_cache.record_for_thing
+
+        def invalidate_after_read(thing):
+            # Runs between reading the Thing and storing its record
+            Thing.objects.filter(pk=thing.pk).update(fullname="Renamed")
+            thing_path_cache.invalidate([thing.pathid])
+            return record_for_thing(thing)
+
+        thing_path_cache.record_for_thing = invalidate_after_read
+        try:
+            Thing.get_by_path(path)
+        finally:
+            del thing_path_cache.record_for_thing
+
+        self.assertEqual("Renamed", Thing.get_by_path(path).fullname)
+        self.assert_stats(local_hits=0, shared_hits=0, misses=2)
+
+    def test_invalidated_again_after_commit(self):
+        path = "tripos/test_tripos"
+        record = thing_path_cache.record_for_thing(Thing.get_by_path(path))
+        with commit_on_success():
+            tripos = Thing.objects.get(fullpath=path)
+            tripos.fullname = "Renamed"
+            tripos.save()
+            # Another process reads the old row before the commit, and caches
+            # it under the new version token...
+            version = thing_path_cache._get_version(tripos.pathid)
+            thing_path_cache.cache.set(THING_KEY % (tripos.pathid, version),
+                                       record)
+        # ...which is changed again once the transaction commits.
+        self.assertEqual("Renamed", Thing.get_by_path(path).fullname)
+
+    def change_in_other_process(self, path, **fields):
+        """
+        Update a Thing and invalidate it as another process would, which
+        leaves this process' local cache alone.
+        """
+        Thing.objects.filter(pathid=Thing.hash(path)).update(**fields)
+        thing_path_cache.cache.delete(VERSION_KEY % Thing.hash(path))
+
+    def test_local_entries_check_version(self):
+        Thing.get_by_path("tripos/test_tripos")
+        self.change_in_other_process("tripos/test_tripos", fullname="Renamed")
+
+        self.assertEqual("Renamed",
+                         Thing.get_by_path("tripos/test_tripos").fullname)
+        self.assert_stats(local_hits=0, shared_hits=0, misses=2)
+
+    def test_no_local_entries_without_versions(self):
+        thing_path_cache._cache = get_cache(
+            "django.core.cache.backends.dummy.DummyCache")
+        Thing.get_by_path("tripos/test_tripos")
+        Thing.objects.filter(fullpath="tripos/test_tripos").update(
+            fullname="Renamed")
+
+        self.assertEqual("Renamed",
+                         Thing.get_by_path("tripos/test_tripos").fullname)
+        self.assert_stats(local_hits=0, shared_hits=0, misses=2)
+
+    def test_salt_created_by_other_process(self):
+        Thing.objects.filter(fullpath="user/gcm23").update(data="{}")
+        Thing.get_by_path("user/gcm23")
+        self.change_in_other_process("user/gcm23", data='{"salt": "other"}')
+
+        # The salt from the database is used, rather than a new one
+        subject = ThingSubject(fullpath="user/gcm23")
+        self.assertFalse(subject.create_salt())
+        self.assertEqual(
+            "other", Thing.objects.get(fullpath="user/gcm23").metadata["salt"])
+
+    def test_reset_salt_reads_database(self):
+        Thing.get_by_path("user/gcm23")
+        # A change made without invalidating the cache
+        Thing.objects.filter(fullpath="user/gcm23").update(
+            data='{"salt": "other", "name": "Changed"}')
+
+        ThingSubject(fullpath="user/gcm23").create_hmac(update=True)
+        metadata = Thing.objects.get(fullpath="user/gcm23").metadata
+        self.assertEqual("Changed", metadata["name"])
+        self.assertNotEqual("other", metadata["salt"])
+
+    def test_not_cached_in_transaction(self):
+        with transaction.atomic():
+            Thing.get_by_path("tripos/test_tripos")
+        Thing.get_by_path("tripos/test_tripos")
+
+        self.assert_stats(local_hits=0, shared_hits=0, misses=2)
+
+    def test_user_thing(self):
+        user = Thing.objects.get(fullpath="user/gcm23")
+
+        class User(object):
+            username = "gcm23"
+        self.assertEqual(user, Thing.get_or_create_user_thing(User()))
+        with self.assertNumQueries(0):
+            self.assertEqual(user, Thing.get_or_create_user_thing(User()))
@@ -0,0 +1,61 @@
+from django.test import TestCase
+
+from timetables.models import Thing, ThingClosure
+
+
+class ThingClosureTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def descendants(self, paths, **kwargs):
+        return sorted(Thing.objects.filter(Thing.treequery(paths, **kwargs))
+                      .values_list("fullpath", flat=True))
+
+    def test_fixture_is_indexed(self):
+        self.assertEqual(
+            ["tripos", "tripos/test_tripos", "tripos/test_tripos/test_part",
+             "tripos/test_tripos/test_part/test_module"],
+            self.descendants(["tripos"]))
+
+    def test_exclusive_and_max_depth(self):
+        self.assertEqual(
+            ["tripos/test_tripos", "tripos/test_tripos/test_part"],
+            self.descendants(["tripos"], inclusive=False, max_depth=2))
+
+    def test_overlapping_paths_are_not_duplicated(self):
+        self.assertEqual(
+            ["tripos/test_tripos/test_part",
+             "tripos/test_tripos/test_part/test_module"],
+            self.descendants(["tripos/test_tripos/test_part",
+                              "tripos/test_tripos/test_part/test_module"]))
+
+    def test_created_thing_is_indexed(self):
+        part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+        a = Thing.objects.create(parent=part, name="a", fullname="A")
+        Thing.objects.create(parent=a, name="b", fullname="B")
+
+        self.assertEqual(
+            ["tripos/test_tripos/test_part/a",
+             "tripos/test_tripos/test_part/a/b"],
+            self.descendants(["tripos/test_tripos/test_part/a"]))
+        self.assertIn("tripos/test_tripos/test_part/a/b",
+                      self.descendants(["tripos"]))
+
+    def test_moved_subtree_is_reindexed(self):
+        part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+        part.parent = Thing.objects.get(fullpath="user")
+        part.save()
+
+        self.assertEqual(["tripos", "tripos/test_tripos"],
+                         self.descendants(["tripos"]))
+        self.assertIn("user/test_part/test_module",
+                      self.descendants(["user"]))
+
+    def test_rebuild(self):
+        expected = sorted(ThingClosure.objects.values_list(
+            "ancestor_id", "descendant_id", "depth"))
+        ThingClosure.objects.all().delete()
+        ThingClosure.rebuild()
+
+        self.assertEqual(expected, sorted(ThingClosure.objects.values_list(
+            "ancestor_id", "descendant_id", "depth")))
@@ -0,0 +1,73 @@
+from django.test import TestCase
+
+from timetables.models import Thing, ThingClosure
+
+
+class EnsurePathsTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def closure(self):
+        return sorted(ThingClosure.objects.values_list(
+            "ancestor_id", "descendant_id", "depth"))
+
+    def test_creates_paths_and_parents(self):
+        things = Thing.ensure_paths(
+            ["tripos/new_tripos/part_a/module", "tripos/new_tripos/part_b"],
+            ["tripos", "part", "module"],
+            {"tripos/new_tripos/part_a/module": {"fullname": "Module"},
+             "tripos/new_tripos/part_b": {"fullname": "Part B"},
+             "tripos/new_tripos/part_a": {"fullname": "Part A"},
+             "tripos/new_tripos": {"fullname": "New Tripos"}})
+
+        self.assertEqual(
+            ["tripos", "tripos/new_tripos", "tripos/new_tripos/part_a",
+             "tripos/new_tripos/part_a/module", "tripos/new_tripos/part_b"],
+            sorted(things))
+        module = Thing.objects.get(fullpath="tripos/new_tripos/part_a/module")
+        self.assertEqual(module.id, things[module.fullpath].id)
+        self.assertEqual(("module", "Module"), (module.type, module.fullname))
+        # Types are matched to each path from the end
+        self.assertEqual("module", things["tripos/new_tripos/part_b"].type)
+        self.assertEqual("part", things["tripos/new_tripos/part_a"].type)
+        self.assertEqual(things["tripos/new_tripos/part_a"].id, module.parent_id)
+        # The existing tripos is returned unchanged
+        self.assertEqual(Thing.objects.get(fullpath="tripos").id,
+                         things["tripos"].id)
+
+    def test_closure_matches_rebuild(self):
+        Thing.ensure_paths(["tripos/new_tripos/part_a/module"],
+                           ["tripos", "part", "module"],
+                           {"tripos/new_tripos/part_a/module": {"fullname": "M"},
+                            "tripos/new_tripos/part_a": {"fullname": "P"},
+                            "tripos/new_tripos": {"fullname": "T"}})
+        created = self.closure()
+        ThingClosure.objects.all().delete()
+        ThingClosure.rebuild()
+        self.assertEqual(self.closure(), created)
+        self.assertIn("tripos/new_tripos/part_a/module",
+                      Thing.objects.filter(Thing.treequery(["tripos"]))
+                      .values_list("fullpath", flat=True))
+
+    def test_existing_paths(self):
+        paths = ["tripos/test_tripos/test_part/test_module"]
+        with self.assertNumQueries(1):
+            things = Thing.ensure_paths(paths)
+        self.assertEqual(Thing.objects.get(fullpath=paths[0]).id,
+                         things[paths[0]].id)
+
+    def test_queries_per_level(self):
+        paths = ["tripos/test_tripos/test_part/%d" % i for i in range(20)]
+        properties = dict((path, {"fullname": path}) for path in paths)
+        # The lookup, then an insert, a select and two closure inserts for
+        # the only level which is missing.
+        with self.assertNumQueries(5):
+            things = Thing.ensure_paths(paths, ["module"], properties)
+        self.assertEqual(20, Thing.objects.filter(
+            id__in=[things[path].id for path in paths]).count())
+
+    def test_create_path(self):
+        thing = Thing.create_path("user/newuser", {"fullname": "New User"},
+                                  ["user"])
+        self.assertEqual("user", thing.type)
+        self.assertEqual(thing, Thing.get_by_path("user/newuser"))
@@ -0,0 +1,53 @@
+from django.test import TestCase
+
+from timetables.models import Thing
+
+
+class UpdateChildPathsTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        self.tripos = Thing.objects.get(fullpath="tripos/test_tripos")
+        # Add another level so the subtree is more than one level deep
+        module = Thing.objects.get(
+            fullpath="tripos/test_tripos/test_part/test_module")
+        Thing.objects.create(parent=module, name="child", fullname="Child")
+
+    def assert_paths(self, expected, root):
+        things = Thing.objects.filter(Thing.treequery([root]))
+        self.assertEqual(sorted(expected),
+                         sorted(t.fullpath for t in things))
+        for thing in things:
+            self.assertEqual(Thing.hash(thing.fullpath), thing.pathid)
+
+    def test_rename_updates_descendants(self):
+        self.tripos.name = "renamed"
+        self.tripos.save()
+
+        self.assert_paths(["tripos/renamed",
+                           "tripos/renamed/test_part",
+                           "tripos/renamed/test_part/test_module",
+                           "tripos/renamed/test_part/test_module/child"],
+                          "tripos/renamed")
+        self.assertFalse(Thing.objects.filter(
+            pathid=Thing.hash("tripos/test_tripos/test_part")).exists())
+
+    def test_update_child_paths_returns_row_count(self):
+        self.tripos.fullpath = "tripos/renamed"
+        with self.assertNumQueries(2):
+            self.assertEqual(3, self.tripos.update_child_paths())
+
+    def test_batches(self):
+        part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+        for i in range(5):
+            Thing.objects.create(parent=part, name="m%d" % i, fullname="M")
+
+        self.tripos.CHILD_PATH_BATCH_SIZE = 2
+        self.tripos.name = "renamed"
+        self.tripos.save()
+
+        self.assertEqual(
+            9, len(Thing.objects.filter(Thing.treequery(["tripos/renamed"]))))
+        self.assertTrue(Thing.objects.filter(
+            pathid=Thing.hash("tripos/renamed/test_part/m4")).exists())
@@ -8,6 +8,9 @@ from django.conf import settings
 
 JSON_CONTENT_TYPE="application/json; charset=utf-8"
 
+# Newline delimited JSON, one value per line
+NDJSON_CONTENT_TYPE="application/x-ndjson; charset=utf-8"
+
 JSON_INDENT = settings.JSON_INDENT
 
 class JsonCodec(json.JSONEncoder):
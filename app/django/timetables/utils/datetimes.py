@@ -1,4 +1,5 @@
 import re, pytz, logging, operator
+from bisect import bisect_right
 from datetime import timedelta
 
 from django.utils.datetime_safe import datetime, date
@@ -317,6 +318,78 @@ def date_to_termweek(date, year=None, term=None):
             relative.week, DAYS_REVERSE[relative.day])
 
 
+def dates_to_termweeks(dates):
+    """
+    Converts a sequence of dates into week offsets from the start of the term
+    each date is nearest to.
+
+    This is equivalent to calling date_to_termweek(date) for each date, but
+    avoids creating intermediate objects for each one, so it's much quicker
+    when converting a large number of dates.
+
+    Args:
+        dates: An iterable of datetime.date instances.
+
+    Returns:
+        A list of (year, term, week, day) tuples, in the same order as dates.
+        See date_to_termweek() for details.
+    """
+    terms = {}
+    termweeks = []
+    for date in dates:
+        term = TERM_IDENTIFIER.term_for_date(date)
+        term_info = terms.get(term)
+        if term_info is None:
+            term_info = terms[term] = (term.academic_year_start_year,
+                    TERMS_REVERSE[term.name], term.first_day())
+        year, term_name, first_day = term_info
+
+        termweeks.append((year, term_name, ((date - first_day).days // 7) + 1,
+                DAYS_REVERSE[date.weekday()]))
+    return termweeks
+
+def termweeks_to_dates(termweeks, week_start="thu"):
+    """
+    Converts a sequence of week offsets from the start of terms into dates.
+
+    This is equivalent to calling termweek_to_date() for each
+    (year, term, week, day) tuple, but each term's start date is only looked
+    up once.
+
+    Args:
+        termweeks: An iterable of (year, term, week, day) tuples. See
+            termweek_to_date() for details.
+        week_start: The day of the week on which the weeks of term start.
+
+    Returns:
+        A list of datetime.date objects, in the same order as termweeks.
+    """
+    if week_start not in DAYS:
+        _error_unknown("day", week_start, DAYS.keys())
+
+    first_days = {}
+    dates = []
+    for year, term, week, day in termweeks:
+        first_day = first_days.get((year, term))
+        if first_day is None:
+            if not year in TERM_STARTS:
+                _error_unknown("year", year, TERM_STARTS.keys())
+
+            if not term in TERMS:
+                _error_unknown("term", term, TERMS.keys())
+
+            first_day = first_days[(year, term)] = Term.from_static_data(
+                    year, TERMS[term], DAYS[week_start]).first_day()
+
+        if day not in DAYS:
+            _error_unknown("day", day, DAYS.keys())
+
+        week_start_date = first_day + timedelta(weeks=week - 1)
+        dates.append(TimeBlock.first_day_on_or_after(week_start_date,
+                DAYS[day]))
+    return dates
+
+
 class TimeBlock(object):
     """
     Represents a point in time from which offsets can be calculated. It differs
@@ -442,24 +515,32 @@ class TermIdentificationStrategy(object):
         for term in terms:
             duration = (term.first_day(), term.first_day() + term_length, term)
             durations.append(duration)
+        # Sorted by start date so that the term for a date can be found with a
+        # binary search rather than by checking every term.
+        durations.sort(key=operator.itemgetter(0))
         self.durations = durations
-    
+        self._starts = [start for start, _, _ in durations]
+
     def _closest_duration(self, date):
         """
         Finds the term closest to date.
         """
-        # This assumes that there are no overlapping durations
-        closest = None
-        for start, end, term in self.durations:
-            if date >= start and date <= end:
-                return term
-            distance = min(
-                abs(start - date),
-                abs(end - date))
-            if closest is None or distance < closest[0]:
-                closest = (distance, term)
-        return closest[1]
-    
+        # This assumes that there are no overlapping durations, so the only
+        # candidates are the last term starting on or before date and the
+        # first term starting after it.
+        index = bisect_right(self._starts, date)
+        if index == 0:
+            return self.durations[0][2]
+
+        start, end, term = self.durations[index - 1]
+        if date <= end or index == len(self.durations):
+            return term
+
+        next_start, _, next_term = self.durations[index]
+        if next_start - date < date - end:
+            return next_term
+        return term
+
     def term_for_date(self, date):
         """
         Args:
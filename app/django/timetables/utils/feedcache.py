@@ -0,0 +1,118 @@
+"""
+A cache of rendered event feeds.
+
+Calendar clients poll the export views (e.g. the "export ics hmac" url) far
+more often than timetables change. Rendered feeds are stored in the cache named
+by settings.EVENT_FEED_CACHE, keyed on the Thing's pathid, the depth and the
+output format.
+
+Rather than tracking down and deleting every affected feed when data changes,
+each key also embeds a set of version tokens:
+
+    * a per-Thing token, changed when EventTags/EventSourceTags pointing at
+      the Thing change.
+    * an events token, changed whenever any Event or EventSource changes.
+    * a tags token, changed whenever any tag changes. Only feeds with
+      depth > 1 depend on this as they include the tags of child Things.
+
+Invalidating is therefore just a case of deleting a version token (see
+timetables.utils.versiontokens).
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import get_cache
+
+from timetables.utils import versiontokens
+
+
+EVENTS_VERSION_KEY = "feedcache:version:events"
+TAGS_VERSION_KEY = "feedcache:version:tags"
+THING_VERSION_KEY = "feedcache:version:thing:%s"
+
+
+class CachedFeed(object):
+    """
+    A rendered feed, as stored in the cache.
+    """
+
+    # For feeds cached before content_encoding was stored
+    content_encoding = None
+
+    def __init__(self, content, content_type, content_disposition=None,
+                 last_modified=None, content_encoding=None):
+        self.content = content
+        self.content_type = content_type
+        self.content_disposition = content_disposition
+        self.content_encoding = content_encoding
+        self.last_modified = int(last_modified or time.time())
+        # Unquoted, as returned by django.utils.http.parse_etags()
+        self.etag = hashlib.md5(content).hexdigest()
+
+    @classmethod
+    def from_response(cls, response):
+        return cls(response.content, response["Content-Type"],
+                   response.get("Content-Disposition"),
+                   content_encoding=response.get("Content-Encoding"))
+
+
+class FeedCache(object):
+
+    def __init__(self, cache=None, timeout=None):
+        self._cache = cache
+        self._timeout = timeout
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_cache(settings.EVENT_FEED_CACHE)
+        return self._cache
+
+    @property
+    def timeout(self):
+        if self._timeout is None:
+            return settings.EVENT_FEED_CACHE_TIMEOUT
+        return self._timeout
+
+    def get_key(self, thing, depth, outputformat):
+        version_keys = [THING_VERSION_KEY % thing.id, EVENTS_VERSION_KEY]
+        if depth > 1:
+            version_keys.append(TAGS_VERSION_KEY)
+
+        return "feedcache:feed:%s" % ":".join(
+            [thing.pathid, str(depth), outputformat] +
+            versiontokens.get_versions(self.cache, version_keys))
+
+    def get(self, key):
+        """
+        Returns: The CachedFeed stored under key (from get_key()) or None if
+            it's not cached.
+        """
+        return self.cache.get(key)
+
+    def set(self, key, feed):
+        """
+        Store a CachedFeed. The key should be obtained before rendering the
+        feed so that a feed rendered while being invalidated is stored under
+        the already stale key.
+        """
+        self.cache.set(key, feed, self.timeout)
+
+    def invalidate_things(self, thing_ids):
+        """
+        Invalidate the feeds of the Things with the specified ids, and of any
+        Thing containing them.
+        """
+        keys = [TAGS_VERSION_KEY]
+        keys.extend(THING_VERSION_KEY % thing_id for thing_id in thing_ids)
+        versiontokens.invalidate(self.cache, keys)
+
+    def invalidate_events(self):
+        """
+        Invalidate every feed as a result of an Event or EventSource changing.
+        """
+        versiontokens.invalidate(self.cache, [EVENTS_VERSION_KEY])
+
+
+feed_cache = FeedCache()
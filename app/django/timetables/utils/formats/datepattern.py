@@ -34,7 +34,7 @@ class DatePatternImporter(object):
                     group_template, start_year, data=metadata)
 
             Event.objects.bulk_create(events)
-            Event.after_bulk_operation()
+            Event.after_bulk_operation([source.id])
 
             return len(events)
         except Exception as e:
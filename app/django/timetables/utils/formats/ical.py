@@ -13,12 +13,16 @@ from icalendar import Event as iCalEvent
 from icalendar.cal import Calendar, Alarm
 import pytz
 
-from django.http import HttpResponse
+from django.db.models import query
+from django.http import HttpResponse, StreamingHttpResponse
 
 import llic
 
-from timetables.models import Event
+from timetables.models import Event, split_metadata_list
+from timetables.querysets import QuerysetIterator
 from timetables.utils.date import DateConverter
+from timetables.utils.formats.records import EventRecords
+from timetables.utils.formats.recurrences import find_weekly_runs
 
 LOG = logging.getLogger(__name__)
 
@@ -48,7 +52,7 @@ class BaseICalExporter(object):
         """
         # Build a comma and "and" separated string of people, e.g.
         # Mr Foo, Mr Bar and Mr Baz
-        people = self._join_comma_and(event.metadata.get("people"))
+        people = self._join_comma_and(split_metadata_list(event.people))
 
         return "with {}.".format(people)
 
@@ -69,8 +73,8 @@ class BaseICalExporter(object):
     def make_event(self, e, metadata_names=None):
         event = iCalEvent()
         event.add('summary', self._build_summary(e))
-        event.add('dtstart', DateConverter.from_datetime(e.start_origin(), e.metadata.get("x-allday")));
-        event.add('dtend', DateConverter.from_datetime(e.end_origin(), e.metadata.get("x-allday")))
+        event.add('dtstart', DateConverter.from_datetime(e.start_origin(), e.allday));
+        event.add('dtend', DateConverter.from_datetime(e.end_origin(), e.allday))
         event.add('location', e.location)
         event.add('uid', e.get_ical_uid())
         event.add('description', self._build_description(e))
@@ -106,39 +110,139 @@ class BaseICalExporter(object):
 
 class LlicICalExporter(BaseICalExporter):
     """
-    A non-streaming iCalendar exporter for Timetable events
-
-    (Could be made streaming very easily by passing the response to the
-    writer as the output.)
+    An iCalendar exporter for Timetable events.
 
     This implementation uses our llic library to write the iCalendar data.
     It's significantly faster (> 10x) than icalendar (although llic is not as
     feature complete or well tested as icalendar).
+
+    By default the whole calendar is written to a buffer and returned in an
+    HttpResponse. If stream_response is True a StreamingHttpResponse is
+    returned instead, which pulls events from the database chunk_size at a
+    time and sends the output as it's generated. Memory use then stays flat
+    regardless of the number of events in the feed, at the cost of the
+    response not having a Content-Length and not being cacheable.
+
+    If recurrences is True, events which recur weekly (see
+    timetables.utils.formats.recurrences) are written as a single VEVENT with
+    an RRULE, and an EXDATE for any weeks they skip, which makes the feeds of
+    most series several times smaller. Irregular events are written as usual.
+    The runs can only be found once all the events have been read, so the
+    events are held in memory even when streaming.
     """
+
+    stream_response = False
+
+    recurrences = False
+
+    # The number of events to fetch from the database at once when streaming
+    chunk_size = 500
+
+    # The amount of output to buffer before sending it when streaming
+    stream_buffer_size = 64 * 1024
+
     def get_calendar_writer(self, outstream):
         return llic.CalendarWriter(outstream)
 
-    def write_calendar(self, writer, events):
+    def write_calendar_start(self, writer):
         writer.begin(b"VCALENDAR")
         writer.contentline(b"VERSION", self.version)
         writer.contentline(b"PRODID", self.prodid)
 
-        for event in events:
-            writer.begin(b"VEVENT")
+    def write_event(self, writer, event, run=None):
+        """
+        Write event as a VEVENT, recurring over the weeks of run if given.
+        """
+        writer.begin(b"VEVENT")
+
+        writer.contentline("SUMMARY", writer.as_text(self._build_summary(event)))
+        writer.contentline("DTSTART", writer.as_datetime(event.start))
+        writer.contentline("DTEND", writer.as_datetime(event.end))
+        if run is not None and run.is_recurring():
+            writer.contentline("RRULE",
+                               "FREQ=WEEKLY;COUNT={:d}".format(run.get_count()))
+            exdates = run.get_exdates()
+            if exdates:
+                writer.contentline("EXDATE", ",".join(
+                    writer.as_datetime(exdate) for exdate in exdates))
+        writer.contentline("LOCATION", writer.as_text(event.location))
+        writer.contentline("UID", writer.as_text(event.get_ical_uid()))
+        writer.contentline("DESCRIPTION", writer.as_text(
+            self._build_description(event)))
+
+        writer.end(b"VEVENT")
+
+    def write_calendar_end(self, writer):
+        writer.end("VCALENDAR")
+
+    def get_recurrence_key(self, event):
+        """
+        The parts of an event written to its VEVENT other than its times,
+        which must be equal for events to be written as one recurring VEVENT.
+        """
+        return (event.source_id, event.title, event.location, event.people)
 
-            writer.contentline("SUMMARY", writer.as_text(self._build_summary(event)))
-            writer.contentline("DTSTART", writer.as_datetime(event.start))
-            writer.contentline("DTEND", writer.as_datetime(event.end))
-            writer.contentline("LOCATION", writer.as_text(event.location))
-            writer.contentline("UID", writer.as_text(event.get_ical_uid()))
-            writer.contentline("DESCRIPTION", writer.as_text(
-                self._build_description(event)))
+    def get_vevents(self, events):
+        """
+        Get an iterable of (event, run) pairs, one for each VEVENT of the
+        calendar, where run is the WeeklyRun starting with event, or None.
+        """
+        if self.recurrences:
+            return ((run.first, run) for run in
+                    find_weekly_runs(events, self.get_recurrence_key))
+        return ((event, None) for event in events)
 
-            writer.end(b"VEVENT")
+    def write_calendar(self, writer, events):
+        self.write_calendar_start(writer)
 
-        writer.end("VCALENDAR")
+        for event, run in self.get_vevents(events):
+            self.write_event(writer, event, run)
 
-    def export(self, events, metadata_names=None, feed_name="events"):
+        self.write_calendar_end(writer)
+
+    def get_streamed_events(self, events):
+        """
+        Get an iterable over events which holds at most chunk_size of them in
+        memory at once.
+        """
+        if isinstance(events, query.QuerySet):
+            return QuerysetIterator(events, chunk_size=self.chunk_size,
+                                    chunked=True)
+        if isinstance(events, EventRecords) and events.chunk_size is None:
+            events.chunk_size = self.chunk_size
+        return events
+
+    def generate_calendar(self, events):
+        """
+        A generator of the calendar's output, in blocks of roughly
+        stream_buffer_size bytes.
+        """
+        out = StringIO()
+        try:
+            writer = self.get_calendar_writer(out)
+
+            self.write_calendar_start(writer)
+            for event, run in self.get_vevents(
+                    self.get_streamed_events(events)):
+                self.write_event(writer, event, run)
+
+                if out.tell() >= self.stream_buffer_size:
+                    yield out.getvalue()
+                    out.seek(0)
+                    out.truncate()
+            self.write_calendar_end(writer)
+
+            yield out.getvalue()
+        finally:
+            out.close()
+
+    def export_streaming(self, events):
+        return StreamingHttpResponse(
+            self.generate_calendar(events),
+            content_type="text/calendar; charset=utf-8"
+        )
+
+    def export_buffered(self, events):
         out = StringIO()
 
         try:
@@ -152,6 +256,13 @@ class LlicICalExporter(BaseICalExporter):
             )
         finally:
             out.close()
+        return response
+
+    def export(self, events, metadata_names=None, feed_name="events"):
+        if self.stream_response:
+            response = self.export_streaming(events)
+        else:
+            response = self.export_buffered(events)
 
         response['Content-Disposition'] = (
             "attachment; filename={}.ics".format(feed_name)
@@ -336,10 +447,12 @@ class ICalImporter(object):
                     metadata[k.lower()] = self._get_value(e,k,default_timezone)
     
                 metadata['x-allday'] = DateConverter.is_date(e.decoded('DTSTART'))
+                # bulk_create() doesn't call on_pre_save()
+                event.update_metadata_columns()
                 events.append(event)
             source.save()
             Event.objects.bulk_create(events)
-            Event.after_bulk_operation()
+            Event.after_bulk_operation([source.id])
             return len(events)
 
 
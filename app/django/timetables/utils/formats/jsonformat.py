@@ -5,58 +5,113 @@ Created on Oct 17, 2012
 
 This module is named jsonformat as opposed to json to avoid import issues.
 '''
-from django.http import HttpResponse
+from cStringIO import StringIO
+
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import simplejson as json
-from timetables.utils.Json import JSON_CONTENT_TYPE, JSON_INDENT
+from timetables.utils.Json import (JSON_CONTENT_TYPE, JSON_INDENT,
+    NDJSON_CONTENT_TYPE)
 from timetables.utils.date import DateConverter
 
 class JsonExporter(object):
     '''
     An Json Exporter.
+
+    Events are written as a JSON array, or if ndjson is True as newline
+    delimited JSON with one compact event object per line. Either way the
+    events are encoded into a single buffer as they're read, and sent in
+    blocks of roughly stream_buffer_size bytes. If stream_response is True a
+    StreamingHttpResponse is returned, otherwise the feed is rendered into an
+    HttpResponse.
     '''
+
+    stream_response = False
+
+    ndjson = False
+
+    # The amount of output to buffer before sending it
+    stream_buffer_size = 64 * 1024
+
+    def make_event(self, e, metadata_names=None):
+        event = {
+                'summary' : '%s' % e.title,
+                'start' :  DateConverter.from_datetime(e.start_local(), e.allday).isoformat(),
+                'end' :  DateConverter.from_datetime(e.end_local(), e.allday).isoformat(),
+                'start_origin' :  DateConverter.from_datetime(e.start_origin(), e.allday).isoformat(),
+                'end_origin' :  DateConverter.from_datetime(e.end_origin(), e.allday).isoformat(),
+                'start_origin_tz' :  e.starttz,
+                'end_origin_tz' :  e.endtz,
+                # From the allday column, so false rather than null for
+                # events without x-allday metadata
+                'allday' : e.allday,
+                'location' : e.location,
+                'uid' : e.uid
+                }
+        # If a mapping has been provided, unpack
+        metadata = e.metadata
+        protected = frozenset(event.keys())
+        if metadata_names is not None:
+            for metadata_name, jsonname in metadata_names.iteritems():
+                if jsonname not in protected and metadata_name in metadata:
+                    event[jsonname] = metadata[metadata_name]
+        else:
+            for k,v in metadata.iteritems():
+                if k not in protected:
+                    event[k] = v
+        return event
+
+    def generate(self, events, metadata_names=None):
+        '''
+        A generator of the feed's output, in blocks of roughly
+        stream_buffer_size bytes.
+        '''
+        # I am not using json.dump() on the whole list since I want to stream.
+        if self.ndjson:
+            encode = json.JSONEncoder(separators=(",", ":")).encode
+        else:
+            encode = json.JSONEncoder(indent=JSON_INDENT).encode
+        out = StringIO()
+        try:
+            if not self.ndjson:
+                out.write("[\n")
+            first = True
+            for e in events:
+                if self.ndjson:
+                    out.write(encode(self.make_event(e, metadata_names)))
+                    out.write("\n")
+                else:
+                    if not first:
+                        out.write(",\n")
+                    out.write(encode(self.make_event(e, metadata_names)))
+                first = False
+
+                if out.tell() >= self.stream_buffer_size:
+                    yield out.getvalue()
+                    out.seek(0)
+                    out.truncate()
+            if not self.ndjson:
+                out.write("\n]\n")
+            yield out.getvalue()
+        finally:
+            out.close()
+
     def export(self, events, metadata_names=None, feed_name="events"):
         '''
-        Creates a streaming http response of json data representing the contents of the events sequence
+        Creates an http response of json data representing the contents of the events sequence
         :param events: a sequence of events
         :param metadata_names: mapping between the metadata key and the json property name. 
             The key is the metadata key, the value is the name of the json property.
             If the metadata value is a list, it will be output as multiple properties in the json stream.
         '''
-        def generate():
-            # I am not using the standard simplejoson encoders since I want to stream.
-            yield "[\n"
-            first = True
-            for e in events:
-                event = {
-                        'summary' : '%s' % e.title,
-                        'start' :  DateConverter.from_datetime(e.start_local(), e.metadata.get("x-allday")).isoformat(),
-                        'end' :  DateConverter.from_datetime(e.end_local(), e.metadata.get("x-allday")).isoformat(),
-                        'start_origin' :  DateConverter.from_datetime(e.start_origin(), e.metadata.get("x-allday")).isoformat(),
-                        'end_origin' :  DateConverter.from_datetime(e.end_origin(), e.metadata.get("x-allday")).isoformat(),
-                        'start_origin_tz' :  e.starttz,
-                        'end_origin_tz' :  e.endtz,
-                        'allday' : e.metadata.get("x-allday"),
-                        'location' : e.location,
-                        'uid' : e.uid
-                        }
-                # If a mapping has been provided, unpack
-                metadata = e.metadata
-                protected = frozenset(event.keys())
-                if metadata_names is not None:
-                    for metadata_name, jsonname in metadata_names.iteritems():
-                        if jsonname not in protected and metadata_name in metadata:
-                            event[jsonname] = metadata[metadata_name]
-                else:
-                    for k,v in metadata.iteritems():
-                        if k not in protected:
-                            event[k] = v
-                if first:
-                    yield "%s" % json.dumps(event, indent=JSON_INDENT)
-                    first = False
-                else:
-                    yield ",\n%s" % json.dumps(event, indent=JSON_INDENT)
-            yield "\n]\n"
-        response = HttpResponse(generate(),content_type=JSON_CONTENT_TYPE)
-        response['Content-Disposition'] = "attachment; filename=%s.json" % feed_name
-        response.streaming = True
+        if self.ndjson:
+            content_type, extension = NDJSON_CONTENT_TYPE, "ndjson"
+        else:
+            content_type, extension = JSON_CONTENT_TYPE, "json"
+
+        content = self.generate(events, metadata_names)
+        if self.stream_response:
+            response = StreamingHttpResponse(content, content_type=content_type)
+        else:
+            response = HttpResponse(b"".join(content), content_type=content_type)
+        response['Content-Disposition'] = "attachment; filename=%s.%s" % (feed_name, extension)
         return response
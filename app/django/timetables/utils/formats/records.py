@@ -0,0 +1,124 @@
+"""
+Lightweight, read only records of Events for the exporters.
+
+Feeds can hold thousands of events, and creating an Event instance for each
+one (running Model.__init__ and Event's from_instance handling) is a large
+part of the cost of rendering them. EventRecords reads just the columns the
+exporters use with values_list(), and yields an EventRecord for each row.
+EventRecords provide the parts of the Event API used by the exporters in
+settings.EVENT_EXPORTERS: the fields, metadata, start_local()/end_local(),
+start_origin()/end_origin(), get_ical_uid() and source.title.
+
+The timezones of the events, their series and the site domain are looked up
+once for each EventRecords rather than once for each event.
+"""
+import pytz
+
+from django.contrib.sites.models import Site
+from django.utils import simplejson as json
+from django.utils import timezone
+
+from timetables.querysets import QuerysetIterator
+
+
+class SeriesRecord(object):
+    """
+    The EventSource of an EventRecord, which only has an id and title.
+    """
+    __slots__ = ("id", "title")
+
+    def __init__(self, id, title):
+        self.id = id
+        self.title = title
+
+
+class EventRecord(object):
+
+    FIELDS = ("id", "uid", "title", "location", "start", "end", "starttz",
+              "endtz", "allday", "event_type", "people", "data", "source_id")
+
+    __slots__ = FIELDS + ("source", "_records", "_metadata")
+
+    def __init__(self, records, values, source):
+        for field, value in zip(self.FIELDS, values):
+            setattr(self, field, value)
+        self.source = source
+        self._records = records
+        self._metadata = None
+
+    @property
+    def metadata(self):
+        if self._metadata is None:
+            self._metadata = json.loads(self.data) if self.data else {}
+        return self._metadata
+
+    def start_local(self, tz=None):
+        if tz is None:
+            return timezone.localtime(self.start)
+        return tz.normalize(self.start.astimezone(tz))
+
+    def end_local(self, tz=None):
+        if tz is None:
+            return timezone.localtime(self.end)
+        return tz.normalize(self.end.astimezone(tz))
+
+    def start_origin(self):
+        if self.starttz is None:
+            return self.start_local()
+        return self.start_local(self._records.get_timezone(self.starttz))
+
+    def end_origin(self):
+        if self.endtz is None:
+            return self.end_local()
+        return self.end_local(self._records.get_timezone(self.endtz))
+
+    def get_ical_uid(self, domain=None):
+        if domain is None:
+            domain = self._records.get_domain()
+        return "{!s}@{!s}".format(self.uid, domain)
+
+
+class EventRecords(object):
+    """
+    An iterable of EventRecords for the events of a queryset, which are read
+    from the database with a single query as they're iterated over, or if
+    chunk_size is set, with a query for each chunk_size of them so that
+    large (streamed) feeds are never held in memory at once.
+    """
+
+    def __init__(self, events, chunk_size=None):
+        self.events = events
+        self.chunk_size = chunk_size
+        self._timezones = {}
+        self._series = {}
+        self._domain = None
+
+    def get_timezone(self, name):
+        tz = self._timezones.get(name)
+        if tz is None:
+            tz = self._timezones[name] = pytz.timezone("%s" % name)
+        return tz
+
+    def get_series(self, source_id, title):
+        if source_id is None:
+            return None
+        series = self._series.get(source_id)
+        if series is None:
+            series = self._series[source_id] = SeriesRecord(source_id, title)
+        return series
+
+    def get_domain(self):
+        if self._domain is None:
+            self._domain = Site.objects.get_current().domain
+        return self._domain
+
+    def __iter__(self):
+        rows = self.events.values_list(
+            *(EventRecord.FIELDS + ("source__title",)))
+        if self.chunk_size is None:
+            rows = rows.iterator()
+        else:
+            rows = QuerysetIterator(rows, self.chunk_size, chunked=True)
+        for values in rows:
+            yield EventRecord(self, values[:-1],
+                              self.get_series(values[-2], values[-1]))
@@ -0,0 +1,107 @@
+"""
+Detection of weekly runs of events, so that feeds can describe a run with a
+single recurring entry (e.g. an iCalendar RRULE) rather than repeating every
+occurrence.
+
+Most series meet at the same time each week (e.g. "Mi1-8 Th 10"), so their
+events fall into a few runs. The runs are found from the start times of the
+events rather than from the datePattern of their series, as individual
+events can be edited or cancelled after being generated from the pattern.
+
+Events are compared by their UTC start times, so a run never spans a change
+of daylight saving time. Each run can then be written with UTC times and no
+VTIMEZONE.
+"""
+import datetime
+
+import pytz
+
+
+WEEK = datetime.timedelta(weeks=1)
+
+# The greatest number of weeks between consecutive events of a run. Weeks in
+# between without an event are excluded from the run's recurrence.
+MAX_GAP_WEEKS = 4
+
+
+class WeeklyRun(object):
+    """
+    Events which are identical apart from their start and end, all starting
+    at the same time of the same weekday. A run of one event is an event
+    which doesn't recur.
+    """
+
+    def __init__(self, events):
+        self.events = events
+
+    @property
+    def first(self):
+        return self.events[0]
+
+    @property
+    def last(self):
+        return self.events[-1]
+
+    def is_recurring(self):
+        return len(self.events) > 1
+
+    def get_count(self):
+        """
+        Returns: The number of weeks from the first event to the last,
+            inclusive.
+        """
+        return (self.last.start - self.first.start).days // 7 + 1
+
+    def get_exdates(self):
+        """
+        Returns: The (UTC) starts of the weeks within the run without an
+            event.
+        """
+        starts = set(event.start for event in self.events)
+        start = self.first.start.astimezone(pytz.utc)
+        exdates = []
+        for _ in range(self.get_count()):
+            if start not in starts:
+                exdates.append(start)
+            start += WEEK
+        return exdates
+
+
+def find_weekly_runs(events, key, max_gap_weeks=MAX_GAP_WEEKS):
+    """
+    Group events into WeeklyRuns.
+
+    Args:
+        events: An iterable of events (anything with start and end datetimes)
+        key: A function of an event returning the parts of it which must be
+            equal for events to share a run, e.g. their title and location.
+        max_gap_weeks: The greatest number of weeks between consecutive
+            events of a run.
+    Returns: A list of WeeklyRuns holding every event exactly once, in order
+        of their first event's start, then the order of the events.
+    """
+    groups = {}
+    for index, event in enumerate(events):
+        start = event.start.astimezone(pytz.utc)
+        group_key = (key(event), start.weekday(), start.time(),
+                     event.end - event.start)
+        groups.setdefault(group_key, []).append((start, index, event))
+
+    runs = []
+    max_gap = WEEK * max_gap_weeks
+    for group in groups.itervalues():
+        group.sort()
+        run = []
+        for start, index, event in group:
+            if run and start == run[-1][0]:
+                # A duplicate can't be part of the same recurrence
+                runs.append(((start, index), [event]))
+                continue
+            if run and start - run[-1][0] > max_gap:
+                runs.append(((run[0][0], run[0][1]), [e for _, _, e in run]))
+                run = []
+            run.append((start, index, event))
+        runs.append(((run[0][0], run[0][1]), [e for _, _, e in run]))
+
+    runs.sort(key=lambda run: run[0])
+    return [WeeklyRun(run_events) for _, run_events in runs]
@@ -6,25 +6,40 @@ Created on Oct 17, 2012
 
 This file is names spreadsheet as opposed to csv to avoid import issues withe standard module csv.
 '''
-import StringIO
-from django.http import HttpResponse
+from cStringIO import StringIO
+from django.http import HttpResponse, StreamingHttpResponse
 import csv
 from timetables.utils.date import DateConverter
 
 class CsvExporter(object):
     '''
     Export data in CSV form. 
+
+    Rows are written by a single csv writer into a buffer which is sent in
+    blocks of roughly stream_buffer_size bytes. If stream_response is True a
+    StreamingHttpResponse is returned, otherwise the feed is rendered into an
+    HttpResponse.
     '''
-    def export(self, events, metadata_names=None, feed_name="events"):
+
+    stream_response = False
+
+    # The amount of output to buffer before sending it
+    stream_buffer_size = 64 * 1024
+
+    @staticmethod
+    def _encode(value):
+        # The csv module can only write byte strings
+        if isinstance(value, unicode):
+            return value.encode("utf-8")
+        return value
+
+    def generate(self, events, metadata_names=None):
         '''
-        export the events with an optional mapping of metadata to column headers.
-        :param events: a sequence of events, that should stream
-        :param metadata_names: a dict containing metadata key to csv column mappings. 
-            The key is the medatdata key, the value is the csv column name
-        returns a http response that uses a generator to stream.
+        A generator of the feed's output, in blocks of roughly
+        stream_buffer_size bytes.
         '''
-        def generate():
-            csvfile = StringIO.StringIO()
+        csvfile = StringIO()
+        try:
             csvwriter = csv.writer(csvfile)
             # If a mapping has been provided, unpack
             columns = [
@@ -43,18 +58,15 @@ class CsvExporter(object):
                     columns.append(csvname)
 
             csvwriter.writerow(columns)
-            yield csvfile.getvalue()
             for e in events:
-                csvfile = StringIO.StringIO()
-                csvwriter = csv.writer(csvfile)
                 columns = [
                         e.id,
                         e.uid,
                         e.title,
                         e.location,
-                        DateConverter.from_datetime(e.start_local(), e.metadata.get("x-allday")).isoformat(),
+                        DateConverter.from_datetime(e.start_local(), e.allday).isoformat(),
                         e.starttz,
-                        DateConverter.from_datetime(e.start_local(), e.metadata.get("x-allday")).isoformat(),
+                        DateConverter.from_datetime(e.start_local(), e.allday).isoformat(),
                         e.endtz
                         ]
                 # If a mapping has been provided, unpack
@@ -69,10 +81,28 @@ class CsvExporter(object):
                                 columns.append(o)
                         else:
                             columns.append("")
-                csvwriter.writerow(columns)
-                yield csvfile.getvalue()
-           
-        response = HttpResponse(generate(),content_type="text/csv; charset=utf-8")
+                csvwriter.writerow([self._encode(c) for c in columns])
+
+                if csvfile.tell() >= self.stream_buffer_size:
+                    yield csvfile.getvalue()
+                    csvfile.seek(0)
+                    csvfile.truncate()
+            yield csvfile.getvalue()
+        finally:
+            csvfile.close()
+
+    def export(self, events, metadata_names=None, feed_name="events"):
+        '''
+        export the events with an optional mapping of metadata to column headers.
+        :param events: a sequence of events, that should stream
+        :param metadata_names: a dict containing metadata key to csv column mappings. 
+            The key is the medatdata key, the value is the csv column name
+        returns a http response, which streams if stream_response is True.
+        '''
+        content = self.generate(events, metadata_names)
+        if self.stream_response:
+            response = StreamingHttpResponse(content, content_type="text/csv; charset=utf-8")
+        else:
+            response = HttpResponse(b"".join(content), content_type="text/csv; charset=utf-8")
         response['Content-Disposition'] = "attachment; filename=%s.csv" % feed_name
-        response.streaming = True
-        return response
\ No newline at end of file
+        return response
@@ -5,9 +5,9 @@ import itertools
 
 from timetables.utils import ints
 from timetables.model.models import GroupUsage
+from timetables.querysets import QuerysetIterator
 
 from django.template.loader import render_to_string
-import django.db.models.query
 
 TIMETABLES_PRODID = "-//University of Cambridge Timetables//timetables.caret.cam.ac.uk//"
 ICALENDAR_VERSION = "2.0"
@@ -45,76 +45,6 @@ class DefaultIcalendarEventFactory(object):
         return "%s.%d@timetables.caret.cam.ac.uk" % (
                 event.id, ints.hash_ints(sorted(gu.id for gu in group_usages)))
 
-class QuerysetIterator(object):
-    """
-    Provides streaming access to queryset results, regardless of whether they
-    use prefetch_related() or not.
-    
-    The max results to hold in memory at once is controlled by the chunk_size
-    argument to __init__.
-    
-    Querysets not using prefetch_related are iterated with the
-    queryset.iterator() method which provides ideal behaviour.
-    
-    Querysets using prefetch_related are trickier, as queryset.iterator() will
-    not perform any prefetches, and iter(queryset) will cache the entire set of
-    results in memory. In this case we iteratively fetch chunk_size sized slices
-    from the queryset which limits the maximum number of results in memory while
-    still allowing prefetch_related to work.
-    """
-    def __init__(self, queryset, chunk_size=django.db.models.query.CHUNK_SIZE):
-        self._queryset = queryset
-        self._chunk_size = chunk_size
-
-    def _uses_prefetch(self):
-        """
-        Returns: True if our queryset uses prefetch_related. 
-        """
-        # _prefetch_related_lookups is non-empty if prefetch_related is used
-        return bool(self._queryset._prefetch_related_lookups)
-
-    def __iter__(self):
-        """
-        Returns a memory-efficient iterator over our queryset's results.
-        
-        This is called when this object is used in a for loop, or passed to the
-        iter() function (etc).
-        """
-        if not self._uses_prefetch():
-            return self._queryset.iterator()
-        return self._chunk_iterator()
-
-    def chunk_size(self):
-        """
-        The maximum number of results that will be held in memory at once.
-        
-        This does not include additional rows fetched as a result of
-        prefetch_related calls.
-        """
-        return self._chunk_size
-
-    def _chunks(self):
-        """
-        Generates the 'chunks' (lists of results up to chunk_size in length)
-        of our queryset. 
-        """
-        position = 0
-        while True:
-            # Slice a range of rows out of the queryset
-            chunk = self._queryset[position:position + self._chunk_size]
-
-            if len(chunk) == 0:
-                return
-            yield chunk
-
-            if len(chunk) < self._chunk_size:
-                return
-
-    def _chunk_iterator(self):
-        for chunk in self._chunks():
-            for row in chunk:
-                yield row
-
 def event_stream(group_usages):
     """
     An iterable whose iterators provide streamed access to (Event, GroupUsage)
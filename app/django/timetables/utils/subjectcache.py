@@ -0,0 +1,84 @@
+"""
+A cache of the Subjects catalogue.
+
+The list of subjects (see timetables.models.Subjects) is needed by the student
+landing page and several admin pages, but it only changes when a tripos, part
+or subject Thing is created, renamed, disabled or deleted, which happens a few
+times a term. The subjects, and the drill down JSON built from them, are stored
+in the cache named by settings.SUBJECT_CACHE.
+
+As with the feed cache (see timetables.utils.feedcache), keys embed a version
+token. Invalidating the catalogue is just a case of deleting the token (see
+timetables.utils.versiontokens).
+"""
+from django.conf import settings
+from django.core.cache import get_cache
+
+from timetables.utils import versiontokens
+
+
+VERSION_KEY = "subjectcache:version"
+SUBJECTS_KEY = "subjectcache:subjects:%s"
+JSON_KEY = "subjectcache:json:%s"
+
+
+class SubjectCache(object):
+
+    def __init__(self, cache=None, timeout=None):
+        self._cache = cache
+        self._timeout = timeout
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_cache(settings.SUBJECT_CACHE)
+        return self._cache
+
+    @property
+    def timeout(self):
+        if self._timeout is None:
+            return settings.SUBJECT_CACHE_TIMEOUT
+        return self._timeout
+
+    def get_version(self):
+        return versiontokens.get_version(self.cache, VERSION_KEY)
+
+    def _get_or_build(self, key_format, build):
+        # Get the key before building so that a catalogue invalidated while
+        # we build it is never stored under the new key.
+        key = key_format % self.get_version()
+        value = self.cache.get(key)
+        if value is None:
+            value = build()
+            self.cache.set(key, value, self.timeout)
+        return value
+
+    def get_subjects(self):
+        """
+        Returns: A list of all the Subject objects, as returned by
+            Subjects.all_subjects().
+        """
+        from timetables.models import Subjects
+        return self._get_or_build(SUBJECTS_KEY, Subjects.all_subjects)
+
+    def get_json(self):
+        """
+        Returns: The subjects grouped for a drill down from name > part, as
+            returned by Subjects.to_json().
+        """
+        from timetables.models import Subjects
+        return self._get_or_build(JSON_KEY, lambda: Subjects.to_json(
+            Subjects.group_for_part_drill_down(self.get_subjects())))
+
+    def invalidate(self):
+        versiontokens.invalidate(self.cache, [VERSION_KEY])
+
+    def rebuild(self):
+        """
+        Invalidate the cached catalogue and build a new one.
+        """
+        self.invalidate()
+        self.get_json()
+
+
+subject_cache = SubjectCache()
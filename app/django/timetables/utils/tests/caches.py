@@ -0,0 +1,23 @@
+"""
+Helpers for tests of the caches in timetables.utils.
+"""
+from django.core.cache import get_cache
+
+
+class LocMemCacheMixin(object):
+    """
+    A TestCase mixin replacing the Django cache of each of cache_wrappers
+    (e.g. feed_cache) with an empty LocMemCache for the duration of each
+    test. The default caches are DummyCaches, which never store anything.
+    """
+
+    cache_wrappers = ()
+
+    def setUp(self):
+        super(LocMemCacheMixin, self).setUp()
+        for wrapper in self.cache_wrappers:
+            self.addCleanup(setattr, wrapper, "_cache", wrapper._cache)
+            wrapper._cache = get_cache(
+                "django.core.cache.backends.locmem.LocMemCache",
+                LOCATION="%s-test" % type(wrapper).__name__)
+            wrapper.cache.clear()
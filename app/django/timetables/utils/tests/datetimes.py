@@ -2,6 +2,8 @@
 Tests for timetables.utils.datetimes.
 """
 
+from datetime import timedelta
+
 from django.test import TestCase
 from django.utils import datetime_safe as datetime
 
@@ -80,3 +82,69 @@ class TestDateToTermWeek(TestCase):
             
             self.assertEqual(expected, actual,"expected: %s, actual: %s, "
                     "args: %s" % (expected, actual, args))
+
+
+class TestTermIdentificationStrategy(TestCase):
+    def linear_closest_term(self, date):
+        # The straightforward scan of every term which the bisect based lookup
+        # replaces. Ties go to the earlier term.
+        closest = None
+        for start, end, term in datetimes.TERM_IDENTIFIER.durations:
+            if date >= start and date <= end:
+                return term
+            distance = min(abs(start - date), abs(end - date))
+            if closest is None or distance < closest[0]:
+                closest = (distance, term)
+        return closest[1]
+
+    def test_matches_linear_scan(self):
+        durations = datetimes.TERM_IDENTIFIER.durations
+        date = durations[0][0] - timedelta(days=100)
+        last = durations[-1][1] + timedelta(days=100)
+
+        while date <= last:
+            self.assertIs(self.linear_closest_term(date),
+                    datetimes.TERM_IDENTIFIER.term_for_date(date), date)
+            date += timedelta(days=1)
+
+
+class TestBatchConversions(TestCase):
+    dates = [
+        datetime.date(2012, 10,  4),
+        datetime.date(2012,  9, 18),
+        datetime.date(2013,  1, 20),
+        datetime.date(2013,  7,  1),
+        datetime.date(2012, 10,  5),
+    ]
+
+    def test_dates_to_termweeks_matches_date_to_termweek(self):
+        self.assertEqual(
+            [datetimes.date_to_termweek(date) for date in self.dates],
+            datetimes.dates_to_termweeks(self.dates))
+
+    def test_termweeks_to_dates_matches_termweek_to_date(self):
+        termweeks = datetimes.dates_to_termweeks(self.dates)
+
+        self.assertEqual(
+            [datetimes.termweek_to_date(*termweek) for termweek in termweeks],
+            datetimes.termweeks_to_dates(termweeks))
+        self.assertEqual(self.dates, datetimes.termweeks_to_dates(termweeks))
+
+    def test_termweeks_to_dates_week_start(self):
+        termweeks = [(2012, "michaelmas", 1, "mon"), (2012, "lent", 2, "fri")]
+
+        self.assertEqual(
+            [datetimes.termweek_to_date(*termweek, week_start="mon")
+             for termweek in termweeks],
+            datetimes.termweeks_to_dates(termweeks, week_start="mon"))
+
+    def test_termweeks_to_dates_rejects_unknown_values(self):
+        for termweek in [(1066, "michaelmas", 1, "mon"),
+                         (2012, "blah", 1, "mon"),
+                         (2012, "michaelmas", 1, "acksdfs")]:
+            with self.assertRaises(ValueError):
+                datetimes.termweeks_to_dates([termweek])
+
+    def test_empty(self):
+        self.assertEqual([], datetimes.dates_to_termweeks([]))
+        self.assertEqual([], datetimes.termweeks_to_dates([]))
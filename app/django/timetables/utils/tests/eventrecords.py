@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+from django.test import TestCase
+
+from timetables.models import Event, Thing
+from timetables.utils.formats.jsonformat import JsonExporter
+from timetables.utils.formats.records import EventRecords
+from timetables.utils.formats.spreadsheet import CsvExporter
+
+
+class EventRecordsTest(TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    def setUp(self):
+        event = Event.objects.get(title="Event 2")
+        event.metadata["x-allday"] = True
+        event.endtz = "Australia/Sydney"
+        event.save()
+
+    def get_events(self):
+        return (Thing.objects.get(fullpath="user/gcm23").get_events()
+                .order_by("id"))
+
+    def test_records_match_events(self):
+        for event, record in zip(self.get_events(),
+                                 EventRecords(self.get_events())):
+            for field in ("id", "uid", "title", "location", "starttz",
+                          "endtz", "allday", "metadata"):
+                self.assertEqual(getattr(event, field), getattr(record, field))
+            for method in ("start_local", "end_local", "start_origin",
+                           "end_origin", "get_ical_uid"):
+                self.assertEqual(getattr(event, method)(),
+                                 getattr(record, method)())
+            self.assertEqual(event.source.title, record.source.title)
+
+    def test_single_query(self):
+        records = EventRecords(self.get_events())
+        with self.assertNumQueries(1):
+            records = list(records)
+        # Each series is only created once
+        self.assertIs(records[0].source, records[1].source)
+        self.assertIs(records[0]._records.get_timezone("Europe/London"),
+                      records[1]._records.get_timezone("Europe/London"))
+
+    def test_exporters(self):
+        for exporter in (JsonExporter(), CsvExporter()):
+            expected = exporter.export(self.get_events())
+            actual = exporter.export(EventRecords(self.get_events()))
+            self.assertEqual(expected.content, actual.content)
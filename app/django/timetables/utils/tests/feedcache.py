@@ -0,0 +1,99 @@
+from django.test import TestCase
+
+from timetables.models import (Thing, ThingLinker, Event, EventSource,
+    EventSourceTag)
+from timetables.utils.feedcache import CachedFeed, feed_cache
+from timetables.utils import transactions
+from timetables.utils.tests.caches import LocMemCacheMixin
+
+
+class FeedCacheTest(LocMemCacheMixin, TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    cache_wrappers = (feed_cache,)
+
+    def setUp(self):
+        super(FeedCacheTest, self).setUp()
+        self.user = Thing.objects.get(fullpath="user/gcm23")
+        self.part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+
+    def cache_feed(self, thing, depth):
+        key = feed_cache.get_key(thing, depth, "ics")
+        feed_cache.set(key, CachedFeed(b"BEGIN:VCALENDAR", "text/calendar"))
+
+    def get_feed(self, thing, depth):
+        return feed_cache.get(feed_cache.get_key(thing, depth, "ics"))
+
+    def test_get_set(self):
+        self.assertIsNone(self.get_feed(self.user, 1))
+        self.cache_feed(self.user, 1)
+        feed = self.get_feed(self.user, 1)
+
+        self.assertEqual(b"BEGIN:VCALENDAR", feed.content)
+        # Other depths and formats are cached separately
+        self.assertIsNone(self.get_feed(self.user, 2))
+        self.assertIsNone(
+            feed_cache.get(feed_cache.get_key(self.user, 1, "csv")))
+
+    def test_etag_depends_on_content(self):
+        feed1 = CachedFeed(b"foo", "text/plain")
+        feed2 = CachedFeed(b"foo", "text/plain")
+        feed3 = CachedFeed(b"bar", "text/plain")
+
+        self.assertEqual(feed1.etag, feed2.etag)
+        self.assertNotEqual(feed1.etag, feed3.etag)
+
+    def test_event_save_invalidates(self):
+        self.cache_feed(self.user, 1)
+        self.cache_feed(self.part, 2)
+
+        event = Event.objects.get(title="Event 2")
+        event.location = "Somewhere else"
+        event.save()
+
+        self.assertIsNone(self.get_feed(self.user, 1))
+        self.assertIsNone(self.get_feed(self.part, 2))
+
+    def test_invalidated_again_after_commit(self):
+        event = Event.objects.get(title="Event 2")
+        with transactions.commit_on_success():
+            event.location = "Somewhere else"
+            event.save()
+            # A poll before the commit renders the old events under the new
+            # version tokens...
+            self.cache_feed(self.user, 1)
+            self.assertIsNotNone(self.get_feed(self.user, 1))
+        # ...which are changed again once the transaction commits.
+        self.assertIsNone(self.get_feed(self.user, 1))
+
+    def test_linking_invalidates_after_commit(self):
+        linker = ThingLinker(self.user)
+        with transactions.commit_on_success():
+            linker.unlink_sources([1])
+            linker.finish()
+            self.cache_feed(self.user, 1)
+        self.assertIsNone(self.get_feed(self.user, 1))
+
+    def test_eventsource_makecurrent_invalidates(self):
+        self.cache_feed(self.user, 1)
+        EventSource.objects.get(title="Test Series").makecurrent()
+        self.assertIsNone(self.get_feed(self.user, 1))
+
+    def test_tag_delete_invalidates_tagged_thing(self):
+        self.cache_feed(self.user, 1)
+        EventSourceTag.objects.get(thing=self.user).delete()
+        self.assertIsNone(self.get_feed(self.user, 1))
+
+    def test_tag_save_invalidates_tagged_thing(self):
+        admin = Thing.objects.get(fullpath="user/admin")
+        self.cache_feed(self.user, 1)
+        self.cache_feed(self.part, 2)
+
+        EventSourceTag.objects.create(
+            thing=admin, eventsource=EventSource.objects.get(id=1))
+
+        # Other users' feeds are unaffected
+        self.assertIsNotNone(self.get_feed(self.user, 1))
+        # Feeds including child things' tags are invalidated
+        self.assertIsNone(self.get_feed(self.part, 2))
@@ -0,0 +1,104 @@
+import datetime
+import unittest
+
+import pytz
+from django.test import TestCase
+
+from timetables.models import Event, EventSource
+
+try:
+    from timetables.utils.formats import ical
+except ImportError:
+    # ical requires llic
+    ical = None
+
+
+LONDON = pytz.timezone("Europe/London")
+
+
+class StubCalendarWriter(object):
+    """
+    Records the content lines written by an exporter, in place of
+    llic.CalendarWriter.
+    """
+
+    def __init__(self):
+        self.lines = []
+
+    def begin(self, component):
+        self.lines.append("BEGIN:%s" % component)
+
+    def end(self, component):
+        self.lines.append("END:%s" % component)
+
+    def contentline(self, name, value):
+        self.lines.append("%s:%s" % (name, value))
+
+    def as_text(self, text):
+        return text
+
+    def as_datetime(self, dt):
+        return dt.astimezone(pytz.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+@unittest.skipIf(ical is None, "llic is not installed")
+class LlicICalExporterRecurrencesTest(TestCase):
+
+    def setUp(self):
+        source = EventSource.objects.create(title="Series",
+                                            sourcetype="pattern")
+        self.events = []
+        # Weekly on Thursdays, skipping the 17th
+        for day in (3, 10, 24, 31):
+            self.events.append(self.create_event(source, "Lecture", day))
+        # A different time, so not part of the run
+        self.events.append(self.create_event(source, "Lecture", 18, hour=14))
+
+    def create_event(self, source, title, day, hour=10):
+        start = LONDON.localize(datetime.datetime(2013, 1, day, hour))
+        return Event.objects.create(
+            source=source, title=title, location="Room",
+            start=start, end=start + datetime.timedelta(hours=1))
+
+    def get_lines(self):
+        exporter = ical.LlicICalExporter()
+        exporter.recurrences = True
+        writer = StubCalendarWriter()
+        exporter.write_calendar(writer, self.events)
+        return writer.lines
+
+    def get_vevents(self):
+        vevents = []
+        for line in self.get_lines():
+            if line == "BEGIN:VEVENT":
+                vevents.append([])
+            elif vevents and line != "END:VEVENT":
+                vevents[-1].append(line)
+        return vevents
+
+    def test_weekly_run_has_rrule_and_exdate(self):
+        run, _ = self.get_vevents()
+
+        self.assertIn("DTSTART:20130103T100000Z", run)
+        self.assertIn("RRULE:FREQ=WEEKLY;COUNT=5", run)
+        self.assertIn("EXDATE:20130117T100000Z", run)
+
+    def test_exdates_are_comma_joined(self):
+        Event.objects.filter(start__day=24).delete()
+        self.events = [event for event in self.events
+                       if event.start.day != 24]
+
+        run, _ = self.get_vevents()
+        self.assertIn("EXDATE:20130117T100000Z,20130124T100000Z", run)
+
+    def test_irregular_events_are_plain_vevents(self):
+        _, irregular = self.get_vevents()
+
+        self.assertIn("DTSTART:20130118T140000Z", irregular)
+        self.assertFalse([line for line in irregular
+                          if line.startswith(("RRULE", "EXDATE"))])
+
+    def test_calendar_is_wrapped(self):
+        lines = self.get_lines()
+        self.assertEqual("BEGIN:VCALENDAR", lines[0])
+        self.assertEqual("END:VCALENDAR", lines[-1])
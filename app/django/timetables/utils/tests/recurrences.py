@@ -0,0 +1,84 @@
+import collections
+import datetime
+
+import pytz
+from django.test import TestCase
+
+from timetables.utils.formats.recurrences import find_weekly_runs
+
+
+Event = collections.namedtuple("Event", "title start end")
+
+LONDON = pytz.timezone("Europe/London")
+
+
+def event(title, day, hour=10, hours=1):
+    start = LONDON.localize(datetime.datetime(2013, 1, day, hour))
+    return Event(title, start, start + datetime.timedelta(hours=hours))
+
+
+def title(event):
+    return event.title
+
+
+class FindWeeklyRunsTest(TestCase):
+
+    def runs(self, events, **kwargs):
+        return [run.events for run in find_weekly_runs(events, title, **kwargs)]
+
+    def test_weekly_run(self):
+        events = [event("a", day) for day in (17, 3, 10, 24)]
+        runs = find_weekly_runs(events, title)
+        self.assertEqual(1, len(runs))
+        self.assertEqual(sorted(events), runs[0].events)
+        self.assertTrue(runs[0].is_recurring())
+        self.assertEqual(4, runs[0].get_count())
+        self.assertEqual([], runs[0].get_exdates())
+
+    def test_missing_weeks_are_excluded(self):
+        events = [event("a", day) for day in (3, 24, 31)]
+        run, = find_weekly_runs(events, title)
+        self.assertEqual(5, run.get_count())
+        self.assertEqual([event("a", 10).start, event("a", 17).start],
+                         run.get_exdates())
+        self.assertEqual(pytz.utc, run.get_exdates()[0].tzinfo)
+
+    def test_long_gaps_split_runs(self):
+        events = [event("a", day) for day in (3, 10, 31)]
+        self.assertEqual([events[:2], events[2:]],
+                         self.runs(events, max_gap_weeks=2))
+        self.assertEqual([events], self.runs(events, max_gap_weeks=3))
+
+    def test_irregular_events_are_not_grouped(self):
+        weekly = [event("a", day) for day in (3, 10)]
+        other_title = event("b", 17)
+        other_time = event("a", 17, hour=11)
+        other_weekday = event("a", 18)
+        other_length = event("a", 24, hours=2)
+        events = weekly + [other_title, other_time, other_weekday,
+                           other_length]
+        self.assertEqual(
+            [weekly, [other_title], [other_time], [other_weekday],
+             [other_length]],
+            self.runs(events))
+        self.assertFalse(find_weekly_runs([other_title], title)[0]
+                         .is_recurring())
+
+    def test_duplicates_are_not_grouped(self):
+        first, duplicate, second = event("a", 3), event("a", 3), event("a", 10)
+        runs = find_weekly_runs([first, duplicate, second], title)
+        self.assertEqual(2, len(runs))
+        self.assertIs(first, runs[0].events[0])
+        self.assertIs(second, runs[0].events[1])
+        self.assertEqual([duplicate], runs[1].events)
+
+    def test_runs_end_at_daylight_saving_changes(self):
+        start = LONDON.localize(datetime.datetime(2013, 3, 21, 10))
+        events = []
+        for week in range(3):
+            local = LONDON.localize(
+                start.replace(tzinfo=None) + datetime.timedelta(weeks=week))
+            events.append(Event("a", local,
+                                local + datetime.timedelta(hours=1)))
+        # The clocks change on the 31st, so the UTC time of the third moves
+        self.assertEqual([events[:2], events[2:]], self.runs(events))
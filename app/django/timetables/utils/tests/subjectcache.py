@@ -0,0 +1,109 @@
+from django.test import TestCase
+
+from timetables.models import Thing, ThingTag
+from timetables.utils.subjectcache import subject_cache
+from timetables.utils.tests.caches import LocMemCacheMixin
+from timetables.utils.transactions import commit_on_success
+
+
+class SubjectCacheTest(LocMemCacheMixin, TestCase):
+
+    fixtures = ("test_ical.json",)
+
+    cache_wrappers = (subject_cache,)
+
+    def setUp(self):
+        super(SubjectCacheTest, self).setUp()
+        self.tripos = Thing.objects.get(fullpath="tripos/test_tripos")
+        self.part = Thing.objects.get(fullpath="tripos/test_tripos/test_part")
+
+    def get_json(self):
+        with self.assertNumQueries(0):
+            return subject_cache.get_json()
+
+    def assert_rebuilt(self):
+        # The part and nested subject queries, and the prefetch of the parts'
+        # triposes
+        with self.assertNumQueries(3):
+            subject_cache.get_subjects()
+
+    def test_get_json(self):
+        self.assertEqual(
+            [{"name": "Test Tripos",
+              "parts": [{"level_name": "Test Part",
+                         "fullpath": "tripos/test_tripos/test_part"}]}],
+            subject_cache.get_json())
+        self.get_json()
+
+    def test_get_subjects(self):
+        subjects = subject_cache.get_subjects()
+
+        self.assertEqual(["tripos/test_tripos/test_part"],
+                         [s.get_path() for s in subjects])
+        with self.assertNumQueries(0):
+            cached = subject_cache.get_subjects()
+        self.assertEqual(subjects[0].get_part(), cached[0].get_part())
+
+    def test_rename_invalidates(self):
+        subject_cache.get_json()
+        self.part.fullname = "Renamed Part"
+        self.part.save()
+
+        self.assertEqual("Renamed Part",
+                         subject_cache.get_json()[0]["parts"][0]["level_name"])
+
+    def test_invalidated_again_after_commit(self):
+        subject_cache.get_json()
+        with commit_on_success():
+            self.part.fullname = "Renamed Part"
+            self.part.save()
+            # A request before the commit builds the catalogue from the old
+            # rows under the new version token...
+            subject_cache.get_json()
+        # ...which is changed again once the transaction commits.
+        self.assert_rebuilt()
+
+    def test_bulk_path_update_invalidates(self):
+        # Renaming the root updates the tripos and part with a bulk UPDATE
+        subject_cache.get_subjects()
+        root = self.tripos.parent
+        root.name = "triposes"
+        root.save()
+
+        self.assertEqual(["triposes/test_tripos/test_part"],
+                         [s.get_path() for s in subject_cache.get_subjects()])
+
+    def test_create_and_delete_invalidate(self):
+        subject_cache.get_subjects()
+        part = Thing.objects.create(parent=self.tripos, name="other_part",
+                                    type="part", fullname="Other Part")
+        self.assertEqual(2, len(subject_cache.get_subjects()))
+
+        part.delete()
+        self.assertEqual(1, len(subject_cache.get_subjects()))
+
+    def test_disable_invalidates(self):
+        subject_cache.get_subjects()
+        tag = ThingTag.objects.create(thing=self.part, targetthing=self.part,
+                                      annotation="disabled")
+        self.assert_rebuilt()
+
+        tag.delete()
+        self.assert_rebuilt()
+
+    def test_unrelated_changes_dont_invalidate(self):
+        subject_cache.get_subjects()
+        user = Thing.objects.get(fullpath="user/gcm23")
+        user.fullname = "Someone else"
+        user.save()
+        ThingTag.objects.create(thing=user, targetthing=self.part,
+                                annotation="admin")
+
+        with self.assertNumQueries(0):
+            subject_cache.get_subjects()
+
+    def test_rebuild(self):
+        subject_cache.get_json()
+        subject_cache.rebuild()
+
+        self.get_json()
@@ -0,0 +1,35 @@
+from django.core.cache import get_cache
+from django.test import TestCase
+
+from timetables.utils import versiontokens
+from timetables.utils.transactions import commit_on_success
+
+
+class VersionTokensTest(TestCase):
+
+    def setUp(self):
+        self.cache = get_cache("django.core.cache.backends.locmem.LocMemCache",
+                               LOCATION="versiontokens-test")
+        self.cache.clear()
+
+    def test_tokens_are_kept_until_invalidated(self):
+        first, second = versiontokens.get_versions(self.cache, ["a", "b"])
+        self.assertNotEqual(first, second)
+        self.assertEqual([first, second],
+                         versiontokens.get_versions(self.cache, ["a", "b"]))
+        self.assertEqual(first, versiontokens.get_version(self.cache, "a"))
+
+        versiontokens.invalidate(self.cache, ["a"])
+        self.assertNotEqual(first, versiontokens.get_version(self.cache, "a"))
+        self.assertEqual(second, versiontokens.get_version(self.cache, "b"))
+
+    def test_invalidated_again_after_commit(self):
+        with commit_on_success():
+            versiontokens.invalidate(self.cache, ["a"])
+            token = versiontokens.get_version(self.cache, "a")
+        self.assertNotEqual(token, versiontokens.get_version(self.cache, "a"))
+
+    def test_dummy_cache(self):
+        cache = get_cache("django.core.cache.backends.dummy.DummyCache")
+        self.assertEqual("", versiontokens.get_version(cache, "a"))
+        self.assertEqual([""], versiontokens.get_versions(cache, ["a"]))
@@ -0,0 +1,219 @@
+"""
+A cache mapping Thing fullpaths to Things.
+
+Almost every view starts by looking up a Thing from the path in its url, and
+many requests do so several times for the same path. Rather than querying the
+database each time, Thing.get_by_path() looks Things up here.
+
+The cache has two tiers:
+
+    * a small LRU in each process, whose entries are kept for at most
+      settings.THING_PATH_CACHE_LOCAL_TIMEOUT seconds.
+    * the cache named by settings.THING_PATH_CACHE, shared between processes.
+
+Both hold a record of each Thing's fields (including its parsed metadata)
+keyed on its pathid, from which a new Thing instance is created for each
+lookup.
+
+Shared keys embed a version token for each pathid (see
+timetables.utils.versiontokens), which saving, renaming or deleting a Thing
+deletes, and deletes again once its transaction commits. Each lookup reads
+the token first, and local entries are only used while their token is
+current, so a committed change made by any process is seen by all of them
+straight away. Reading the token before the Thing also means a record read
+from the database while it's being invalidated, or before the change
+commits, is stored under an already stale key.
+
+If the shared cache can't store version tokens (e.g. it's a DummyCache, as
+in the default settings, or it's unavailable) changes made by other
+processes can't be detected, so the local tier isn't used either.
+
+Records can still be out of date within a transaction making changes, so
+Things which are going to be changed and saved should be read from the
+database rather than with Thing.get_by_path().
+
+Things are only cached when read outside a transaction, otherwise a Thing
+created in a transaction which is then rolled back could be cached.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import get_cache
+from django.db import connection
+
+from timetables.utils import versiontokens
+
+
+VERSION_KEY = "thingcache:version:%s"
+THING_KEY = "thingcache:thing:%s:%s"
+
+# The Thing fields stored in each record
+RECORD_FIELDS = ("id", "pathid", "fullpath", "name", "type", "parent_id",
+                 "fullname", "data")
+
+
+class ThingPathCache(object):
+
+    def __init__(self, cache=None, timeout=None, local_size=None,
+                 local_timeout=None):
+        self._cache = cache
+        self._timeout = timeout
+        self._local_size = local_size
+        self._local_timeout = local_timeout
+
+        # pathid -> (expiry time, record), least recently used first
+        self._local = OrderedDict()
+        # Incremented by each invalidation, so that a record read while one
+        # happens isn't stored locally
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_cache(settings.THING_PATH_CACHE)
+        return self._cache
+
+    @property
+    def timeout(self):
+        if self._timeout is None:
+            return settings.THING_PATH_CACHE_TIMEOUT
+        return self._timeout
+
+    @property
+    def local_size(self):
+        if self._local_size is None:
+            return settings.THING_PATH_CACHE_LOCAL_SIZE
+        return self._local_size
+
+    @property
+    def local_timeout(self):
+        if self._local_timeout is None:
+            return settings.THING_PATH_CACHE_LOCAL_TIMEOUT
+        return self._local_timeout
+
+    def reset_stats(self):
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+
+    def get_stats(self):
+        """
+        Returns: A dict of the number of lookups answered by the local cache
+            (local_hits), by the shared cache (shared_hits) and by the
+            database (misses) since the stats were last reset.
+        """
+        return {
+            "local_hits": self.local_hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses
+        }
+
+    @staticmethod
+    def can_store():
+        return connection.get_autocommit() and not connection.in_atomic_block
+
+    def _get_local(self, pathid, version):
+        with self._lock:
+            entry = self._local.get(pathid)
+            if entry is None:
+                return None
+            expires, entry_version, record = entry
+            if expires < time.time() or entry_version != version:
+                del self._local[pathid]
+                return None
+            # Move to the most recently used end
+            del self._local[pathid]
+            self._local[pathid] = entry
+            self.local_hits += 1
+            return record
+
+    def _set_local(self, pathid, version, record, generation=None):
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._local.pop(pathid, None)
+            self._local[pathid] = (time.time() + self.local_timeout, version,
+                                   record)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+
+    def _get_version(self, pathid):
+        return versiontokens.get_version(self.cache, VERSION_KEY % pathid)
+
+    @staticmethod
+    def record_for_thing(thing):
+        record = dict((field, getattr(thing, field)) for field in RECORD_FIELDS)
+        record["metadata"] = copy.deepcopy(thing.metadata)
+        return record
+
+    @staticmethod
+    def thing_for_record(record):
+        from timetables.models import Thing
+        thing = Thing(**dict((field, record[field]) for field in RECORD_FIELDS))
+        # Each lookup gets its own copy of the metadata, so changes to one
+        # Thing aren't seen by the others.
+        thing.metadata = copy.deepcopy(record["metadata"])
+        # Mark the Thing as having come from the database, as a queryset would
+        thing._state.adding = False
+        thing._state.db = Thing.objects.db
+        return thing
+
+    def get(self, fullpath):
+        """
+        Returns: The Thing with the specified fullpath.
+        Raises: Thing.DoesNotExist if there's no such Thing.
+        """
+        from timetables.models import Thing
+        pathid = Thing.hash(fullpath)
+
+        # Get the version before reading the Thing so that a Thing
+        # invalidated while we read it is never stored under the new key.
+        generation = self._generation
+        version = self._get_version(pathid)
+        # Without a token, local entries could never be seen to be stale
+        use_local = bool(version)
+
+        if use_local:
+            record = self._get_local(pathid, version)
+            if record is not None:
+                return self.thing_for_record(record)
+
+        key = THING_KEY % (pathid, version)
+        record = self.cache.get(key)
+        if record is not None:
+            self.shared_hits += 1
+            if use_local:
+                self._set_local(pathid, version, record, generation)
+            return self.thing_for_record(record)
+
+        self.misses += 1
+        thing = Thing.objects.get(pathid=pathid)
+        if self.can_store():
+            record = self.record_for_thing(thing)
+            self.cache.set(key, record, self.timeout)
+            if use_local:
+                self._set_local(pathid, version, record, generation)
+        return thing
+
+    def invalidate(self, pathids):
+        """
+        Remove the records of the Things with the specified pathids.
+        """
+        with self._lock:
+            self._generation += 1
+            for pathid in pathids:
+                self._local.pop(pathid, None)
+        versiontokens.invalidate(
+            self.cache, [VERSION_KEY % pathid for pathid in pathids])
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+
+thing_path_cache = ThingPathCache()
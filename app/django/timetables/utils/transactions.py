@@ -0,0 +1,109 @@
+"""
+Running code once a transaction has committed.
+
+The feed and Thing path caches are invalidated by deleting version tokens as
+data is changed, which happens before the transaction making the change
+commits. A request arriving in between reads the new token but the old
+committed rows, and would cache them under the new token until they expire.
+
+Django 1.6 has no hook to run code after a commit, so writers use
+commit_on_success() from here rather than from django.db.transaction. The
+caches invalidate straight away and also register the invalidation with
+after_commit(), which repeats it once the outermost commit_on_success() block
+has committed. Anything cached in between is then stored under a token which
+is already stale.
+
+Outside a block after_commit() does nothing, so anything changing cached data
+inside a transaction (including Model.delete(), which sends post_delete
+before committing) should be wrapped in commit_on_success(), or in
+committing() around a transaction it manages itself.
+"""
+import contextlib
+import sys
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.db import transaction
+
+
+# Per thread state of committing()
+_state = threading.local()
+
+
+def after_commit(func, *args):
+    """
+    Call func(*args) once the transaction of the enclosing commit_on_success()
+    block commits. Repeated calls with the same arguments are only made once.
+    """
+    pending = getattr(_state, "pending", None)
+    if pending is not None:
+        pending[(func, args)] = None
+
+
+@contextlib.contextmanager
+def committing():
+    """
+    Make the after_commit() calls registered inside the block as the
+    outermost block exits, which must be after the changes made inside it are
+    committed. If the block raises an exception the calls are discarded.
+    """
+    depth = getattr(_state, "depth", 0)
+    if depth == 0:
+        _state.pending = OrderedDict()
+    _state.depth = depth + 1
+    try:
+        yield
+    finally:
+        _state.depth = depth
+        if depth == 0:
+            pending = _state.pending
+            del _state.pending
+
+    if depth == 0:
+        for func, args in pending:
+            func(*args)
+
+
+class commit_on_success(object):
+    """
+    As django.db.transaction.commit_on_success, used as a decorator (with or
+    without arguments) or a context manager, but making the after_commit()
+    calls registered inside it once it commits.
+    """
+
+    def __new__(cls, using=None):
+        if callable(using):
+            return cls()(using)
+        return super(commit_on_success, cls).__new__(cls)
+
+    def __init__(self, using=None):
+        self.using = using
+        self._blocks = []
+
+    def __enter__(self):
+        block = committing()
+        block.__enter__()
+        try:
+            atomic = transaction.commit_on_success(self.using)
+            atomic.__enter__()
+        except:
+            block.__exit__(*sys.exc_info())
+            raise
+        self._blocks.append((block, atomic))
+
+    def __exit__(self, *exc_info):
+        block, atomic = self._blocks.pop()
+        try:
+            atomic.__exit__(*exc_info)
+        except:
+            block.__exit__(*sys.exc_info())
+            raise
+        block.__exit__(*exc_info)
+
+    def __call__(self, func):
+        @wraps(func)
+        def inner(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return inner
@@ -1,5 +1,7 @@
 import logging
 import calendar
+import collections
+import threading
 import traceback
 
 from django.db import models
@@ -108,6 +110,28 @@ def expand_patterns(patterns, year, template_pattern=None,
         raise ValueError("patterns should be a sequence of strings, got: %s" %
                 patterns)
 
+    if template_pattern is None:
+        # Without a template each pattern expands independently, so each can
+        # be cached separately.
+        results = [_expanded_patterns.get((pattern,), None, year)[0]
+                   for pattern in patterns]
+    else:
+        # With a template, MULT expressions (e.g. x3) continue on from where
+        # the preceding patterns finished, so the patterns must be expanded
+        # (and cached) together.
+        results = _expanded_patterns.get(tuple(patterns), template_pattern,
+                                         year)
+
+    if local_timezone is not None:
+        return _make_aware(results, local_timezone)
+    return results
+
+def _expand_patterns(patterns, template_pattern, year):
+    """
+    Expand a sequence of pattern strings into lists of naive (start, end)
+    datetimes. This does the work of expand_patterns(), which caches the
+    results.
+    """
     if template_pattern is None:
         group_template = None
     else:
@@ -123,11 +147,55 @@ def expand_patterns(patterns, year, template_pattern=None,
         # Get a list of absolute (start, end) datetimes.
         periods = year.atoms_to_isos(parsed.patterns(), as_datetime=True)
         results.append(periods)
-
-    if local_timezone is not None:
-        return _make_aware(results, local_timezone)
     return results
 
+
+class ExpandedPatternCache(object):
+    """
+    A least recently used cache of expanded patterns, keyed on the patterns,
+    template pattern and year.
+
+    Admins enter the same few patterns over and over again, so it's
+    worthwhile avoiding lexing, parsing and expanding them each time. The
+    expansion only depends on the arguments, so entries never become stale.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, patterns, template_pattern, year):
+        """
+        Returns: A new list containing, for each pattern, a new list of
+            (start, end) tuples.
+        """
+        key = (patterns, template_pattern, year)
+        with self._lock:
+            results = self._entries.pop(key, None)
+            if results is not None:
+                # Re-insert to mark as most recently used
+                self._entries[key] = results
+
+        if results is None:
+            results = tuple(tuple(periods) for periods in
+                            _expand_patterns(patterns, template_pattern, year))
+            with self._lock:
+                self._entries[key] = results
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+
+        # The cached results are immutable, callers get lists they can modify
+        return [list(periods) for periods in results]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_expanded_patterns = ExpandedPatternCache()
+
+
 def _make_aware(all_periods, timezone):
     """
     Localises all (start, end) datetimes into the provided timezone.
@@ -4,7 +4,9 @@ import re
 import sys
 import string
 
-digits_re = re.compile(r"^([0-9]+)")
+# Matched at the lexer's current offset with match(input, pos), so there's no
+# ^ anchor (which would only match at the very start of the input).
+digits_re = re.compile(r"([0-9]+)")
 
 class RawLexer(object):
     terms = ['mi','le','ea']
@@ -15,7 +17,10 @@ class RawLexer(object):
     debug = False
     
     def __init__(self,_input):
+        # The input is scanned using an offset into it rather than by slicing
+        # off each token, which would copy the rest of the input every time.
         self._input = _input.lower()
+        self._pos = 0
         self._terms_ok = True
         self._week_no = False
         self._after_x = False
@@ -23,8 +28,8 @@ class RawLexer(object):
     def _prefix(self,options,pos = False):
         i = 0
         for op in options:
-            if self._input.startswith(op):
-                self._input = self._input[len(op):]
+            if self._input.startswith(op,self._pos):
+                self._pos += len(op)
                 if pos:
                     return i
                 else:
@@ -39,16 +44,18 @@ class RawLexer(object):
         return p
         
     def _pop(self):
+        _input = self._input
+        end = len(_input)
         # skip whitespace
-        while len(self._input) and self._input[0] in string.whitespace:
-            self._input = self._input[1:]
+        while self._pos < end and _input[self._pos] in string.whitespace:
+            self._pos += 1
         # eof
-        if not len(self._input):
+        if self._pos == end:
             return ("EOF",None)
         # digits
-        d = digits_re.match(self._input)
+        d = digits_re.match(_input,self._pos)
         if d != None:
-            self._input = self._input[len(d.group(1)):]
+            self._pos = d.end()
             if self._after_x:
                 return ("MULT",d.group(1))
             elif self._week_no:
@@ -67,10 +74,10 @@ class RawLexer(object):
             self._terms_ok = False          
             self._week_no = False
             return ("DAY",dy)
-        if self._input[0] == 's':
+        if _input[self._pos] == 's':
             self._terms_ok = False          
             self._week_no = False
-            self._input = self._input[1:]
+            self._pos += 1
             return ("DAY",5)            
         # range
         rg = self._prefix(self.range)
@@ -84,7 +91,7 @@ class RawLexer(object):
             if ms == 'x':
                 self._after_x = True
             return ("CHAR",ms)
-        raise Exception("Bad lex: '%s'" % self._input)
+        raise Exception("Bad lex: '%s'" % _input[self._pos:])
 
 # Inserts commas where consecutive lexemes of same type (simplifies range computation)
 class CommaInsertedLexer(object):
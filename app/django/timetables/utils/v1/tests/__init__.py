@@ -5,7 +5,9 @@ from django.test import TestCase
 from django.utils import datetime_safe as datetime
 from django.utils import timezone
 
-from timetables.utils.v1 import expand_patterns, expand_pattern
+from timetables.utils.v1 import (expand_patterns, expand_pattern,
+    ExpandedPatternCache)
+from timetables.utils.v1.plexer import RawLexer
 
 class DatePatternTest(TestCase):
 
@@ -154,3 +156,57 @@ class DatePatternTest(TestCase):
         self.assertEqual(gmt_stop.hour, 15)
         # The end of the GMT event in UTC local time is 3:00PM (15:00) (UTC+0 = GMT)
         self.assertEqual(gmt_stop.astimezone(pytz.utc).hour, 15)
+
+
+class ExpandedPatternCacheTest(TestCase):
+
+    def test_results_are_cached(self):
+        cache = ExpandedPatternCache()
+        first = cache.get(("Mi 1-2 Th 10",), None, 2012)
+        self.assertEqual(1, len(cache._entries))
+
+        # Callers can modify the results without affecting the cache
+        first[0].pop()
+        self.assertEqual(2, len(cache.get(("Mi 1-2 Th 10",), None, 2012)[0]))
+        self.assertEqual(1, len(cache._entries))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = ExpandedPatternCache(max_size=2)
+        cache.get(("Mi 1 Th 10",), None, 2012)
+        cache.get(("Mi 2 Th 10",), None, 2012)
+        cache.get(("Mi 1 Th 10",), None, 2012)
+        cache.get(("Mi 3 Th 10",), None, 2012)
+
+        self.assertEqual(
+            [("Mi 1 Th 10",), ("Mi 3 Th 10",)],
+            [patterns for patterns, _, _ in cache._entries])
+
+    def test_templated_expansion_is_repeatable(self):
+        for _ in range(2):
+            a, b = expand_patterns(["x2", "x1"], 2012,
+                    template_pattern="Mi 1-8 MWF 10")
+            self.assertEqual(datetime.datetime(2012, 10, 10, 10), b[0][0])
+
+
+class RawLexerTest(TestCase):
+
+    def lex(self, text):
+        lexer = RawLexer(text)
+        tokens = []
+        while True:
+            token = lexer.pop()
+            if token[0] == "EOF":
+                return tokens
+            tokens.append(token)
+
+    def test_lex(self):
+        self.assertEqual(
+            [("TERM", 0), ("WEEKNO", "1"), ("CHAR", "-"), ("WEEKNO", "8"),
+             ("DAY", 3), ("DAY", 5), ("TIME", "10"), ("CHAR", ":"),
+             ("TIME", "30")],
+            self.lex("Mi1-8 Th  s 10:30"))
+
+    def test_bad_lex_reports_remaining_input(self):
+        with self.assertRaisesRegexp(Exception, "Bad lex: '\\?10'"):
+            self.lex("Mi1 Th ?10")
+
@@ -0,0 +1,56 @@
+"""
+Version tokens for the caches whose keys embed them.
+
+The feed, Thing path and subjects caches (see timetables.utils.feedcache,
+timetables.utils.thingcache and timetables.utils.subjectcache) don't delete
+stale entries. Instead each key embeds one or more version tokens, random
+values stored in the same cache under version keys. Invalidating entries is
+just a case of deleting their tokens; the next lookup generates new ones, so
+stale entries are never seen again and eventually expire from the cache.
+
+Tokens are deleted straight away and again once the transaction making the
+change commits (see timetables.utils.transactions). Otherwise a request
+arriving before the commit would read the new token but the old rows, and
+cache them under the new token.
+"""
+import uuid
+
+from timetables.utils.transactions import after_commit
+
+
+def get_versions(cache, keys):
+    """
+    Returns: A list of the tokens stored in cache under each of keys,
+        creating any which are missing. Tokens are "" if the cache can't
+        store them (e.g. a DummyCache).
+    """
+    versions = cache.get_many(keys)
+    missing = [key for key in keys if key not in versions]
+    for key in missing:
+        # add() rather than set() so that concurrent requests agree on the
+        # new token. Tokens never expire, only get deleted.
+        cache.add(key, uuid.uuid4().hex, None)
+    if missing:
+        versions.update(cache.get_many(missing))
+    return [versions.get(key, "") for key in keys]
+
+
+def get_version(cache, key):
+    """
+    Returns: The token stored in cache under key, as with get_versions().
+    """
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key, "")
+    return version
+
+
+def invalidate(cache, keys):
+    """
+    Delete the tokens stored in cache under keys, now and once the enclosing
+    commit_on_success() block commits.
+    """
+    keys = tuple(keys)
+    cache.delete_many(keys)
+    after_commit(cache.delete_many, keys)
@@ -18,17 +18,33 @@ from django.views.generic import View
 from django.contrib.auth.decorators import login_required, permission_required
 from django.utils.decorators import method_decorator
 from django.contrib.auth.models import User
-from django.db import transaction
 
 from braces.views import LoginRequiredMixin, SuperuserRequiredMixin
 
 from timetables import models
 from timetables import forms
+from timetables.backend import invalidate_user_admin_targets
 from timetables.utils.academicyear import AcademicYear
+from timetables.utils.subjectcache import subject_cache
+from timetables.utils import transactions
 from timetables.utils.v1 import FullPattern 
 from timetables.views import indexview
 
 
+def get_thing_or_404(fullpath, types=None):
+    """
+    Returns: The Thing at fullpath, if it's one of types (when specified).
+    Raises: Http404 if there's no such Thing.
+    """
+    try:
+        thing = models.Thing.get_by_path(fullpath)
+    except models.Thing.DoesNotExist:
+        raise http.Http404
+    if types is not None and thing.type not in types:
+        raise http.Http404
+    return thing
+
+
 def get_timetables(thing):
     assert thing.type == "tripos"
 
@@ -43,8 +59,7 @@ def timetable_view(request, thing=None):
     if thing == None: # default to first tripos in available list
         thing = triposes[0][1]
     
-    thing = shortcuts.get_object_or_404(models.Thing, type="tripos",
-        pathid=models.Thing.hash(thing))
+    thing = get_thing_or_404(thing, types=["tripos"])
     
     # get list of Things the current user may edit
     editable = get_user_editable(request)
@@ -165,8 +180,7 @@ class TimetableListRead(View):
         return (can_edit, lock_holder)
 
     def get(self, request, thing=None):
-        thing = shortcuts.get_object_or_404(models.Thing,
-                pathid=models.Thing.hash(thing))
+        thing = get_thing_or_404(thing)
 
         if thing.type not in ["part", "subject", "experimental", "option"]:
             return http.HttpResponseBadRequest(
@@ -221,9 +235,7 @@ class TimetableListWrite(TimetableListRead):
         if redirect:
             return shortcuts.redirect("admin list read", context["thing"])
 
-        grouped_subjects = models.Subjects.group_for_part_drill_down(
-            models.Subjects.all_subjects())
-        context["subjects"] = models.Subjects.to_json(grouped_subjects)
+        context["subjects"] = subject_cache.get_json()
         context["type_choices"] = models.Event.get_type_choices_dict()
 
         return shortcuts.render(request,
@@ -299,20 +311,11 @@ class EditSeriesView(SeriesMixin, AdministrationView):
         events_formset = editor.get_event_formset()
 
         if events_formset.is_valid():
-            # temporarily disable the effect of Event.post_save() for efficiency
-            series.disable_set_metadata()
-
-            @transaction.commit_on_success
-            def save():
-                events_formset.save()
-            save()
-
-            # re-enable the effect of Event.post_save() 
-            series.enable_set_metadata()
-
-            # manually recompute and save series metadata 
-            # (since automatic Event.post_save effect was disabled earlier)
-            series.set_metadata(save=True)
+            # Recompute the series metadata once after the events are saved
+            # rather than as each event is saved.
+            with models.deferred_metadata():
+                with transactions.commit_on_success():
+                    events_formset.save()
 
             # redirect
             path = urlresolvers.reverse("list events",
@@ -341,7 +344,7 @@ class EditSeriesTitleView(SeriesMixin, AdministrationView):
         series_form = editor.get_form()
 
         if series_form.is_valid():
-            @transaction.commit_on_success
+            @transactions.commit_on_success
             def save():
                 series_form.save()
             save()
@@ -457,7 +460,7 @@ class NewSeriesView(AdministrationView):
                 status=409
             )
 
-        with transaction.commit_on_success():
+        with transactions.commit_on_success():
             es = self.create_series(title, parent)
 
         # construct data to return
@@ -578,8 +581,8 @@ def new_thing_link(request, thing):
         return http.HttpResponseBadRequest("Cannot link a thing to itself")
 
     try:
-        from_thing = models.Thing.objects.get(pathid=from_hash_id)
-        to_thing = models.Thing.objects.get(pathid=to_hash_id)
+        from_thing = models.Thing.get_by_path(thing)
+        to_thing = models.Thing.get_by_path(request.POST.get("fullpath"))
     except models.Thing.DoesNotExist:
         return http.HttpResponseNotFound("Thing not found")
 
@@ -605,12 +608,9 @@ def new_thing_link(request, thing):
 @login_required
 @permission_required('timetables.is_admin', raise_exception=True)
 def delete_thing_link(request, thing):
-    from_hash_id = models.Thing.hash(thing)
-    to_hash_id = models.Thing.hash(request.POST.get("fullpath"))
-
     try:
-        from_thing = models.Thing.objects.get(pathid=from_hash_id)
-        to_thing = models.Thing.objects.get(pathid=to_hash_id)
+        from_thing = models.Thing.get_by_path(thing)
+        to_thing = models.Thing.get_by_path(request.POST.get("fullpath"))
     except models.Thing.DoesNotExist:
         return http.HttpResponseNotFound("Thing not found")
 
@@ -644,7 +644,8 @@ class DeleteSeriesView(SeriesMixin, AdministrationView):
         series = self.get_series()
 
         # delete the object
-        series.delete()
+        with transactions.commit_on_success():
+            series.delete()
 
         # response
         data = {
@@ -669,8 +670,7 @@ def _series_title_is_unique(title, module):
 @login_required
 @permission_required('timetables.is_admin', raise_exception=True)
 def calendar_view(request, thing=None):
-    thing = shortcuts.get_object_or_404(models.Thing,
-            pathid=models.Thing.hash(thing))
+    thing = get_thing_or_404(thing)
 
     if thing.type not in ["part", "subject", "experimental", "option"]:
         return http.HttpResponseBadRequest(
@@ -748,8 +748,7 @@ def warning_view(request):
 @login_required
 @permission_required('timetables.is_admin', raise_exception=True)
 def refresh_lock(request, thing=None):
-    thing = shortcuts.get_object_or_404(
-            models.Thing, pathid=models.Thing.hash(thing))
+    thing = get_thing_or_404(thing)
 
     user = models.Thing.get_or_create_user_thing(request.user)
 
@@ -798,7 +797,7 @@ class UserTimetablePermissionsView(
     raise_exception = True
 
     def get_subjects(self):
-        return models.Subjects.all_subjects()
+        return subject_cache.get_subjects()
 
     def get_user_writable_fullpaths(self, user, subjects):
         """
@@ -908,6 +907,8 @@ class UserTimetablePermissionsView(
 
         if to_create:
             models.ThingTag.objects.bulk_create(to_create)
+            # bulk_create() doesn't send post_save
+            invalidate_user_admin_targets(user.id)
         if to_remove:
             models.ThingTag.objects.filter(annotation="admin", thing=user,
                     targetthing__pathid__in=to_remove).delete()
@@ -1,8 +1,9 @@
 import re
 import base64
+import itertools
 
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render_to_response
 from django.shortcuts import render
 from django.contrib.auth import authenticate
@@ -20,7 +21,7 @@ def userHasAccess(user, path):
     path = re.sub('/$', '', path)  # remove end slash
     
     try:
-        thing = Thing.objects.get(pathid=Thing.hash(path))
+        thing = Thing.get_by_path(path)
     except Thing.DoesNotExist:
         return False
     except Thing.MultipleObjectsReturned:
@@ -103,15 +104,20 @@ def do_xml_export(request, path):
             else:
                 return HttpResponse('<error>Unable to break down path (too many elements)</error>', status=400)
 
-            # get the export xml
+            # get the export xml, generating the first module now so that
+            # errors found before any output is produced can be reported
+            chunks = api.iter_xml_file(tripos, part, subject)
             try:
-                result = api.output_xml_file(tripos, part, subject)
+                first_chunk = next(chunks)
             except DataValidationException as err:
                 # handle errors during xml export (eg bad data in our database
                 # or the generated file didn't validate for whatever reason
                 return HttpResponse('Error: {0}'.format(err), status=500)
 
-            return HttpResponse(result, content_type="application/xml")
+            return StreamingHttpResponse(
+                itertools.chain([first_chunk], chunks),
+                content_type="application/xml"
+            )
         else:
             # this will also be reported when the path does not exist
             return HttpResponse('<error>You (%s) do not have access to /%s</error>'% (user, path), status=403)
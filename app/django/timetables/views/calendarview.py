@@ -1,19 +1,19 @@
 import calendar
 import itertools
+from cStringIO import StringIO
 import pytz
 
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseNotFound, HttpResponse,\
-    HttpResponseForbidden
+    HttpResponseForbidden, StreamingHttpResponse
 from django.shortcuts import render
 from django.utils import simplejson as json
 from django.utils.datastructures import SortedDict
 from django.utils.datetime_safe import datetime, date
 from django.views.generic.base import View
 
-from timetables.models import Thing, Event
+from timetables.models import Thing, Event, split_metadata_list
 from timetables.utils.Json import JSON_CONTENT_TYPE, JSON_INDENT
-from timetables.utils.date import DateConverter
 from timetables.utils import datetimes
 from timetables.backend import ThingSubject
 from django.core.urlresolvers import reverse
@@ -28,38 +28,69 @@ class CalendarView(View):
     '''
 
     default_depth = 1
-    
-    def to_fullcalendar(self, event):
-        metadata = event.metadata
-        allday = bool(metadata.get("x-allday"))
-        lecturer = metadata.get("people") or []
-        eventtype = metadata.get("type") or False
 
-        # Note: event.start, event.end are UTC. No need to convert to
+    # The Event columns read for each event. The series title is joined in
+    # the same query rather than fetched for each event, and neither Event
+    # instances nor their metadata are created.
+    EVENT_FIELDS = ("id", "title", "start", "end", "location", "allday",
+                    "people", "event_type", "source_id", "source__title")
+
+    # The value of the format param which selects the compact format
+    COMPACT_FORMAT = "compact"
+
+    # The order of the values in each event of the compact format. start and
+    # end are seconds since the epoch and the series titles are sent once, in
+    # a dict of eventSourceId to title.
+    COMPACT_FIELDS = ("djid", "start", "end", "allDay", "title", "location",
+                      "lecturer", "type", "eventSourceId")
+
+    # The amount of output to buffer before sending it
+    stream_buffer_size = 64 * 1024
+
+    def to_fullcalendar(self, values):
+        (event_id, title, start, end, location, allday, people, eventtype,
+         source_id, source_title) = values
+
+        # Note: start, end are UTC. No need to convert to
         # local time in order to send to fullcalendar (as long as you
         # turn OFF ignoreTimezone in fullcalendar...)
-        
+
         event_data = {
-            "djid": event.id,
-            "title" : event.title,
+            "djid": event_id,
+            "title" : title,
             "allDay" : True,
-            "start" : DateConverter.from_datetime(event.start, True).isoformat(),
-            "location" : event.location,
-            "lecturer" : lecturer,
-            "type" : eventtype,
-            "eventSourceId": event.source_id,
-            "eventSourceTitle": event.source.title
+            "start" : start.date().isoformat(),
+            "location" : location,
+            "lecturer" : split_metadata_list(people),
+            "type" : eventtype or False,
+            "eventSourceId": source_id,
+            "eventSourceTitle": source_title
         }
 
         if not allday:
             event_data.update({
                 "allDay" : False,
-                "start" : DateConverter.from_datetime(event.start, False).isoformat(),
-                "end" : DateConverter.from_datetime(event.end, False).isoformat(),
+                "start" : start.isoformat(),
+                "end" : end.isoformat(),
             })
 
         return event_data
 
+    def to_compact(self, values):
+        (event_id, title, start, end, location, allday, people, eventtype,
+         source_id, _) = values
+        return [
+            event_id,
+            calendar.timegm(start.utctimetuple()),
+            calendar.timegm(end.utctimetuple()),
+            allday,
+            title,
+            location,
+            split_metadata_list(people),
+            eventtype or False,
+            source_id
+        ]
+
     def validate_permissions(self):
         thing = self.get_thing_fullpath()
 
@@ -87,7 +118,7 @@ class CalendarView(View):
     def __get_thing(self):
         try:
             path = self.get_thing_fullpath()
-            return Thing.objects.get(pathid=Thing.hash(path))
+            return Thing.get_by_path(path)
         except Thing.DoesNotExist:
             # Raise permission denied instead of 404 when a Thing does
             # not exist to avoid leaking presence of a user...
@@ -108,18 +139,60 @@ class CalendarView(View):
         return self.get_thing().get_events(depth=self.get_depth(),
                                            date_range=self.get_date_range())
 
-    def get_json(self):
-        events = [
-            self.to_fullcalendar(event)
-            for event in self.get_events()
-        ]
-        return events
+    def get_event_values(self):
+        return self.get_events().values_list(*self.EVENT_FIELDS)
+
+    def is_compact(self):
+        return self.request.GET.get("format") == self.COMPACT_FORMAT
+
+    def generate_json(self, event_values):
+        """
+        A generator of the JSON of the events, in blocks of roughly
+        stream_buffer_size bytes.
+
+        By default the JSON is a list of fullcalendar event objects. In the
+        compact format it's an object holding a list of each event's values
+        in the order of COMPACT_FIELDS, and the titles of their series.
+        """
+        compact = self.is_compact()
+        separators = (",", ":") if compact else None
+        out = StringIO()
+        series = {}
+        try:
+            out.write("{\"events\":[" if compact else "[")
+            for i, values in enumerate(event_values.iterator()):
+                if i > 0:
+                    out.write(", " if separators is None else ",")
+                if compact:
+                    series[values[8]] = values[9]
+                    event = self.to_compact(values)
+                else:
+                    event = self.to_fullcalendar(values)
+                out.write(json.dumps(event, separators=separators))
+
+                if out.tell() >= self.stream_buffer_size:
+                    yield out.getvalue()
+                    out.seek(0)
+                    out.truncate()
+
+            if compact:
+                out.write("],\"fields\":%s,\"series\":%s}" % (
+                    json.dumps(self.COMPACT_FIELDS, separators=separators),
+                    json.dumps(series, separators=separators)))
+            else:
+                out.write("]")
+            yield out.getvalue()
+        finally:
+            out.close()
 
     def get(self, request, thing):
         self.validate_permissions()
 
-        return HttpResponse(
-            json.dumps(self.get_json())
+        # Build the query now, so that a bad thing or date range is reported
+        # before the response starts.
+        return StreamingHttpResponse(
+            self.generate_json(self.get_event_values()),
+            content_type=JSON_CONTENT_TYPE
         )
 
 
@@ -131,9 +204,8 @@ class CalendarHtmlView(View):
     def get(self, request, thing, depth="0"):
         if not request.user.has_perm(Thing.PERM_READ,ThingSubject(fullpath=thing,depth=depth)):
             return HttpResponseForbidden("Denied")
-        hashid = Thing.hash(thing)
         try:
-            thing =  Thing.objects.get(pathid=hashid)
+            thing = Thing.get_by_path(thing)
             # create a url with a hmac in it if the thing is a user. If not just a simple url will do.
             thingsubject = ThingSubject(thing=thing)
             if thingsubject.is_user():
@@ -143,7 +215,7 @@ class CalendarHtmlView(View):
                 ics_feed_url = reverse("export ics", kwargs={ "thing" : thing.fullpath})
 
             context = {
-                       "thing" : Thing.objects.get(pathid=hashid) ,
+                       "thing" : thing,
                        "ics_feed_url" : ics_feed_url
                        }
             return render(request, "calendar.html", context)
@@ -163,7 +235,7 @@ class EventListView(View):
     def get_user_thing(self, request, thing):
         if (request.user.is_authenticated()
             and self.get_user_permission(request, thing)):
-            return Thing.objects.get(pathid=Thing.hash(thing))
+            return Thing.get_by_path(thing)
         elif thing == self.public_user_path:
             return None
         raise PermissionDenied
@@ -6,6 +6,7 @@ from django.http import HttpResponse
 import braces.views
 
 from timetables.models import Thing
+from timetables.utils import transactions
 
 
 class ThingView(
@@ -29,5 +30,6 @@ class DeleteThingView(ThingView):
     """
     def post(self, *args, **kwargs):
         thing = self.get_object()
-        thing.delete()
+        with transactions.commit_on_success():
+            thing.delete()
         return HttpResponse("")
@@ -3,25 +3,57 @@ Created on Aug 1, 2012
 
 @author: ieb
 '''
+import re
+
 from django.conf import settings
-from django.http import (HttpResponseBadRequest, HttpResponseNotFound,
-    HttpResponseForbidden)
-from django.utils.decorators import method_decorator
-from django.views.decorators.http import condition
+from django.http import (HttpResponse, HttpResponseBadRequest,
+    HttpResponseNotFound, HttpResponseForbidden, HttpResponseNotModified)
+from django.utils.cache import patch_vary_headers
+from django.utils.http import (http_date, parse_etags, parse_http_date_safe,
+    quote_etag)
+from django.utils.text import compress_sequence, compress_string
 from django.views.generic.base import View
 
 from timetables.backend import ThingSubject
 from timetables.models import Thing
+from timetables.utils.feedcache import CachedFeed, feed_cache
+from timetables.utils.formats.records import EventRecords
 from timetables.utils.reflection import newinstance
 
 
+# As used by django.middleware.gzip
+re_accepts_gzip = re.compile(r'\bgzip\b')
+
+
 class ExportEvents(View):
     '''
     Export all events in either csv or ical form.
+
+    Rendered feeds are cached (see timetables.utils.feedcache) and served with
+    ETag and Last-Modified headers so that polling clients get a 304 when
+    nothing has changed.
+
+    Feeds at depths in streamed_depths can be very large (e.g. a whole
+    tripos), so they're streamed straight to the client by exporters which
+    support it rather than being rendered in memory and cached.
+
+    Exporters with an ndjson attribute (i.e. JSON) can write newline
+    delimited JSON instead, and any feed can be gzip compressed. These are
+    chosen by the Accept and Accept-Encoding headers, or by the format=ndjson
+    and compress=gzip (or compress=none) params, which take precedence.
+
+    Exporters with a recurrences attribute (i.e. iCalendar) write weekly runs
+    of events as single recurring entries when given the recur=weekly param.
     '''
     default_depth = 1
     permitted_depths = set([1, 2])
-    
+    streamed_depths = frozenset([2])
+
+    # The number of events read from the database at once for streamed feeds
+    stream_chunk_size = 500
+
+    NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
     def _path_to_filename(self, fullpath):
         return "".join(x if x.isalpha() or x.isdigit() else '_' for x in fullpath )
 
@@ -35,29 +67,128 @@ class ExportEvents(View):
             pass
         return self.default_depth
 
+    def wants_ndjson(self, request, exporter):
+        if not hasattr(exporter, "ndjson"):
+            return False
+        requested = request.GET.get("format")
+        if requested is not None:
+            return requested == "ndjson"
+        return self.NDJSON_MEDIA_TYPE in request.META.get("HTTP_ACCEPT", "")
+
+    def wants_recurrences(self, request, exporter):
+        return (hasattr(exporter, "recurrences") and
+                request.GET.get("recur") == "weekly")
+
+    def wants_gzip(self, request):
+        requested = request.GET.get("compress")
+        if requested is not None:
+            return requested == "gzip"
+        return bool(re_accepts_gzip.search(
+            request.META.get("HTTP_ACCEPT_ENCODING", "")))
+
+    def compress(self, response):
+        if response.streaming:
+            response.streaming_content = compress_sequence(
+                response.streaming_content)
+        else:
+            response.content = compress_string(response.content)
+        response["Content-Encoding"] = "gzip"
+        return response
+
+    def is_not_modified(self, request, feed):
+        """
+        Returns: True if the client's copy of the feed (as identified by the
+            conditional request headers) is current.
+        """
+        if_none_match = request.META.get("HTTP_IF_NONE_MATCH")
+        if if_none_match:
+            try:
+                etags = parse_etags(if_none_match)
+            except ValueError:
+                return False
+            return feed.etag in etags or "*" in etags
+
+        if_modified_since = request.META.get("HTTP_IF_MODIFIED_SINCE")
+        if if_modified_since:
+            if_modified_since = parse_http_date_safe(if_modified_since)
+            return (if_modified_since is not None and
+                    feed.last_modified <= if_modified_since)
+        return False
+
+    def feed_response(self, request, feed):
+        if self.is_not_modified(request, feed):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(feed.content,
+                                    content_type=feed.content_type)
+            if feed.content_disposition:
+                response['Content-Disposition'] = feed.content_disposition
+            if feed.content_encoding:
+                response['Content-Encoding'] = feed.content_encoding
+
+        response['ETag'] = quote_etag(feed.etag)
+        response['Last-Modified'] = http_date(feed.last_modified)
+        return response
+
+    def should_stream(self, exporter, depth):
+        return (depth in self.streamed_depths and
+                hasattr(exporter, "stream_response"))
+
+    def export(self, exporter, thing, depth):
+        # The exporters get lightweight records of the events rather than
+        # Event instances, read along with their series titles in one query.
+        chunk_size = None
+        if getattr(exporter, "stream_response", False):
+            chunk_size = self.stream_chunk_size
+        events = EventRecords(thing.get_events(depth=depth),
+                              chunk_size=chunk_size)
+        return exporter.export(events,
+                feed_name=self._path_to_filename(thing.fullpath))
 
-    @method_decorator(condition(etag_func=None))
     def get(self, request, thing, hmac=None):
         if not request.user.has_perm(Thing.PERM_READ, ThingSubject(fullpath=thing, hmac=hmac)):
             return HttpResponseForbidden("Denied")
-        hashid = Thing.hash(thing)
         outputformat = request.path.split(".")[-1]
         try:
-            thing = Thing.objects.get(pathid=hashid)
+            thing = Thing.get_by_path(thing)
             if outputformat in settings.EVENT_EXPORTERS:
                 exporter_class = settings.EVENT_EXPORTERS[outputformat]
                 exporter = newinstance(exporter_class)
-                if exporter is not None:
-                    depth = self.get_depth()
-                    print "Depth: {}".format(depth)
-                    events = (thing.get_events(depth=depth)
-                        # The series is referenced from event in order to use
-                        # the series title in the output, so it helps to
-                        # prefetch the series to avoid len(events) queries
-                        # when iterating over events.
-                        .prefetch_related("source"))
-                    return exporter.export(events, feed_name=self._path_to_filename(thing.fullpath))
-                return HttpResponseBadRequest("Sorry, Format not recognized, can't load class %s " % exporter_class )
+                if exporter is None:
+                    return HttpResponseBadRequest("Sorry, Format not recognized, can't load class %s " % exporter_class )
+
+                variant = outputformat
+                if self.wants_ndjson(request, exporter):
+                    exporter.ndjson = True
+                    variant += ":ndjson"
+                if self.wants_recurrences(request, exporter):
+                    exporter.recurrences = True
+                    variant += ":weekly"
+                gzip = self.wants_gzip(request)
+                if gzip:
+                    variant += ":gzip"
+
+                depth = self.get_depth()
+                if self.should_stream(exporter, depth):
+                    exporter.stream_response = True
+                    response = self.export(exporter, thing, depth)
+                    if gzip:
+                        self.compress(response)
+                else:
+                    # Get the key before rendering so that a feed invalidated
+                    # while we render it is never stored under the new key.
+                    cache_key = feed_cache.get_key(thing, depth, variant)
+                    feed = feed_cache.get(cache_key)
+                    if feed is None:
+                        response = self.export(exporter, thing, depth)
+                        if gzip:
+                            self.compress(response)
+                        feed = CachedFeed.from_response(response)
+                        feed_cache.set(cache_key, feed)
+                    response = self.feed_response(request, feed)
+
+                patch_vary_headers(response, ("Accept", "Accept-Encoding"))
+                return response
             return HttpResponseBadRequest("Sorry, Format not recognized")
 
         except Thing.DoesNotExist:
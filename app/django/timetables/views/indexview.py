@@ -12,20 +12,19 @@ from django.shortcuts import render
 from django.views.generic.base import View
 
 from timetables.backend import GlobalThingSubject, ThingSubject
-from timetables.models import Thing, Subjects
+from timetables.models import Thing
 from timetables.utils.academicyear import AcademicYear
 from timetables.utils.site import get_site_url_from_request
+from timetables.utils.subjectcache import subject_cache
 
 
 class IndexView(View):
     def get(self, request):
         site_url = get_site_url_from_request(request)
-        grouped_subjects = Subjects.group_for_part_drill_down(
-            Subjects.all_subjects())
         # Get the cambridge year data for the acadamic year set in the settings.
         acadamic_year = AcademicYear.for_year(settings.DEFAULT_ACADEMIC_YEAR)
         context = {
-            "subjects": Subjects.to_json(grouped_subjects),
+            "subjects": subject_cache.get_json(),
             "site_url": site_url,
             "terms": acadamic_year.get_terms_json(),
             "calendar_start": acadamic_year.start_boundary.isoformat(),
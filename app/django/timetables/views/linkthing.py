@@ -4,13 +4,12 @@ Created on Oct 18, 2012
 @author: ieb
 '''
 from django.views.generic.base import View
-from django.db import transaction
-from timetables.models import Thing, EventSourceTag,\
-    EventSource, Event, EventTag
+from timetables.models import Thing, ThingLinker
 from django.http import HttpResponseNotFound, HttpResponse,\
-    HttpResponseForbidden
+    HttpResponseForbidden, HttpResponseBadRequest
 from django.utils.decorators import method_decorator
 from timetables.backend import ThingSubject
+from timetables.utils import transactions
 
 
 class LinkThing(View):
@@ -27,10 +26,12 @@ class LinkThing(View):
     The end point is designed to take 1000s of items at a time, hence the short names
 
     Where a thing path is linked it and all its child things are expanded to form a set of Event and Event series and those are linked or unlinked.
+    This is done inside the database by ThingLinker, so the Events are never loaded. The number of links
+    created or removed is returned in the X-Links-Changed header.
 
     '''
 
-    @method_decorator(transaction.commit_on_success)
+    @method_decorator(transactions.commit_on_success)
     def post(self, request, thing):
         # Check if the user is logged in
         if request.user.is_anonymous():
@@ -38,92 +39,43 @@ class LinkThing(View):
         elif not request.user.has_perm(Thing.PERM_LINK,ThingSubject(fullpath=thing)):
             return HttpResponseForbidden("Not your calendar")
 
-        hashid = Thing.hash(thing)
         try:
             try:
-                thing = Thing.objects.get(pathid=hashid)
+                thing = Thing.get_by_path(thing)
             except Thing.DoesNotExist:
                 path = "user/%s" % request.user.username
                 if thing == path:
                     thing = Thing.get_or_create_user_thing(request.user)
             
-            # Delete associations first
-            elist = self._expand(request.POST.getlist("esd"))
-            if len(elist) > 0:
-                EventSourceTag.objects.filter(thing=thing,eventsource__in=EventSource.objects.filter(id__in=elist)).delete()
-            elist = self._expand(request.POST.getlist("ed"))
-            if len(elist) > 0:
-                EventTag.objects.filter(thing=thing,event__in=Event.objects.filter(id__in=elist)).delete()
-
-            # If there is a list of things to delete, this is a little more complicated.
-            tlist = self._expand(request.POST.getlist("td"))
-            if len(tlist) > 0:
-                # remove all EventTags and EventSourceTags that link this thing to Events or EventSource linked to by any child
-                # The following query gets the decendents of all the things listed
-                decendents = Thing.objects.filter(Thing.treequery(tlist))
-                # Then get the Events associated with all the decendents of all the things
-                decendent_events = Event.objects.filter(eventtag__thing__in=decendents)
-                # And delete all events tags on this thing, that match those events.
-                EventTag.objects.filter(thing=thing, event__in=decendent_events).delete()
-                # get all eventsources that are associated with the list of decendent things
-                decendent_eventsource = EventSource.objects.filter(eventsourcetag__thing__in=decendents)
-                EventSourceTag.objects.filter(thing=thing,
-                                              eventsource__in=decendent_eventsource).delete()
+            try:
+                esd = self._expand_ids(request.POST.getlist("esd"))
+                ed = self._expand_ids(request.POST.getlist("ed"))
+                es = self._expand_ids(request.POST.getlist("es"))
+                e = self._expand_ids(request.POST.getlist("e"))
+            except ValueError:
+                return HttpResponseBadRequest("Invalid id")
 
-            # Add associations                
-            elist = self._expand(request.POST.getlist("es"))
-            if len(elist) > 0:
-                # Delete then bulk add, note that no hooks on bulk add
-                EventSourceTag.objects.filter(thing=thing,eventsource__in=EventSource.objects.filter(id__in=elist)).delete()
-                items = []
-                for es in EventSource.objects.filter(id__in=elist, current=True):
-                    eventsourcetag = EventSourceTag(thing=thing,eventsource=es)
-                    eventsourcetag.on_pre_save()
-                    items.append(eventsourcetag)
-                EventSourceTag.objects.bulk_create(items)
-            
-            elist = self._expand(request.POST.getlist("e"))
-            if len(elist) > 0:
-                # Delete then bulk add, note that no hooks on bulk add
-                EventTag.objects.filter(thing=thing,event__in=Event.objects.filter(id__in=elist)).delete()
-                items = []
-                for e in Event.objects.filter(id__id=elist,current=True):
-                    eventtag = EventTag(thing=thing,event=e)
-                    eventtag.on_pre_save()
-                    items.append(eventtag)
-                EventTag.objects.bulk_create(items)
-            
-            tlist = self._expand(request.POST.getlist("t"))
-            if len(tlist) > 0:
-                # remove all EventTags and EventSourceTags that link this thing to Events or EventSource linked to by any child
-                # The following query gets the decendents of all the things listed
-                decendents = Thing.objects.filter(Thing.treequery(tlist))
-                # Then get the Events associated with all the decendents of all the things
-                decendent_events = Event.objects.filter(eventtag__thing__in=decendents)
-                # And delete all events tags on this thing, that match those events.
-                EventTag.objects.filter(thing=thing, event__in=decendent_events).delete()
-                # get all eventsources that are associated with the list of decendent things
-                decendent_eventsource = EventSource.objects.filter(eventsourcetag__thing__in=decendents)
-                EventSourceTag.objects.filter(thing=thing,
-                                              eventsource__in=decendent_eventsource).delete()
+            linker = ThingLinker(thing)
+            # Delete associations first
+            linker.unlink_sources(esd)
+            linker.unlink_events(ed)
+            # Remove all EventTags and EventSourceTags that link this thing to
+            # Events or EventSources linked to by any descendant of the listed
+            # things.
+            linker.unlink_subtrees(self._expand(request.POST.getlist("td")))
 
-                # Having deleted, we need to add, first the events bulk creating EventTags
-                items = []
-                for e in decendent_events.filter(current=True):
-                    eventtag = EventTag(thing=thing,event=e)
-                    eventtag.on_pre_save()
-                    items.append(eventtag)
-                EventTag.objects.bulk_create(items)
+            # Add associations
+            linker.link_sources(es)
+            linker.link_events(e)
+            linker.link_subtrees(self._expand(request.POST.getlist("t")))
 
-                # Next the Event Sources bulk creating EventSourceTags
-                items = []
-                for es in decendent_eventsource.filter(current=True):
-                    eventtag = EventSourceTag(thing=thing,eventsource=es)
-                    eventtag.on_pre_save()
-                    items.append(eventtag)
-                EventSourceTag.objects.bulk_create(items)
+            # Tags are changed without signals being sent, so this updates
+            # the thing's event index and invalidates its feeds.
+            linker.finish()
 
-            return HttpResponse("ok")
+            response = HttpResponse("ok")
+            response["X-Links-Changed"] = str(linker.changed)
+            return response
                 
         except Thing.DoesNotExist:
             return HttpResponseNotFound()
@@ -131,5 +83,8 @@ class LinkThing(View):
     def _expand(self, elist):
         ids = []
         for l in elist:
-            ids.extend(l.split(","))
+            ids.extend(i for i in l.split(",") if i.strip())
         return ids
+
+    def _expand_ids(self, elist):
+        return [int(i) for i in self._expand(elist)]
@@ -17,11 +17,10 @@ class ResetFeed(View):
         elif not request.user.has_perm(Thing.PERM_LINK, user):
             return HttpResponseForbidden("Not your calendar")
 
-        hashid = Thing.hash(thing)
 
         # Check if the thing exists
         try:
-            thing = Thing.objects.get(pathid=hashid)
+            thing = Thing.get_by_path(thing)
         except Thing.DoesNotExist:
             return HttpResponseNotFound()
 
@@ -18,9 +18,8 @@ class ViewEvents(View):
     def get(self, request, thing):
         if not request.user.has_perm(Thing.PERM_READ,ThingSubject(fullpath=thing)):
             return HttpResponseForbidden("Denied")
-        hashid = Thing.hash(thing)
         try:
-            thing = Thing.objects.get(pathid=hashid)
+            thing = Thing.get_by_path(thing)
             typeofthing = thing.type
             if typeofthing is None:
                 typeofthing = "default"
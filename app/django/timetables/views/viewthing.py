@@ -15,7 +15,8 @@ from django.http import HttpResponseNotFound, HttpResponseBadRequest,\
 from django.shortcuts import render
 from django.views.generic.base import View
 from timetables.backend import ThingSubject
-from timetables.models import Thing, EventSource, EventSourceTag, ThingTag, sorted_naturally
+from timetables.models import (Thing, EventSource, EventSourceTag, ThingTag,
+    sorted_naturally, split_metadata_list)
 
 log = logging.getLogger(__name__)
 
@@ -27,10 +28,9 @@ class ViewThing(View):
     def get(self, request, thing, depth="0"):
         if not request.user.has_perm(Thing.PERM_READ,ThingSubject(fullpath=thing, depth=depth)):
             return HttpResponseForbidden("Denied")
-        hashid = Thing.hash(thing)
         try:
             if depth == "0":
-                thing = Thing.objects.get(pathid=hashid)
+                thing = Thing.get_by_path(thing)
                 typeofthing = thing.type
                 if typeofthing is None:
                     typeofthing = "default"
@@ -58,7 +58,7 @@ class ChildrenView(View):
         if not request.user.has_perm(Thing.PERM_READ,ThingSubject(fullpath=thing,fulldepth=True)):
             return HttpResponseForbidden("Denied")
         try:
-            thing = Thing.objects.get(pathid=Thing.hash(thing))
+            thing = Thing.get_by_path(thing)
             relatedthings = frozenset()
             relatedsources = frozenset()
             
@@ -107,9 +107,9 @@ class ChildrenView(View):
                     single_series = {
                         "id": raw_series.id,
                         "title": raw_series.title,
-                        "date_pattern": raw_series.metadata.get("datePattern", ""),
+                        "date_pattern": raw_series.date_pattern,
                         "location": raw_series.metadata.get("location", ""),
-                        "people": raw_series.metadata.get("people", []),
+                        "people": split_metadata_list(raw_series.people),
                         "in_calendar": raw_series.id in relatedsources
                     }
                     series.append(single_series)